@@ -13,6 +13,7 @@ import os
 import sys
 import logging
 import faulthandler
+import multiprocessing
 from argparse import ArgumentParser
 from logging.handlers import RotatingFileHandler
 
@@ -74,6 +75,12 @@ def launch_exporter(args):
     exporter.main(**args.__dict__)
 
 
+def launch_batch_exporter(args):
+    init_logging()
+    from declaracad.apps import batch_exporter
+    batch_exporter.main(**args.__dict__)
+
+
 def launch_viewer(args):
     if args.frameless:
         init_logging('%(message)s')
@@ -96,6 +103,9 @@ def launch_workbench(args):
 
 
 def main():
+    # When frozen, processes started by the importers and batch exporter
+    # run the executable and must not start the app
+    multiprocessing.freeze_support()
     is_frozen = getattr(sys, "frozen", False)
 
     if is_frozen and sys.platform == 'win32':
@@ -113,11 +123,27 @@ def main():
                         help="Watch for file changes and autoreload")
     viewer.add_argument("-f", "--frameless", action='store_true',
                         help="Frameless viewer")
+    viewer.add_argument("--profile-startup", action='store_true',
+                        help="Print the time spent importing each subsystem")
 
     exporter = subparsers.add_parser("export", help="Export the given file")
     exporter.set_defaults(func=launch_exporter)
     exporter.add_argument("options", help="File to export or json string of "
                                           "ExportOption parameters")
+    exporter.add_argument("--profile-startup", action='store_true',
+                          help="Print the time spent importing each "
+                               "subsystem")
+
+    batch = subparsers.add_parser(
+        "export-batch", help="Export the models listed in a manifest")
+    batch.set_defaults(func=launch_batch_exporter)
+    batch.add_argument("manifest", help="Json file listing the models and "
+                                        "exporter options")
+    batch.add_argument("-j", "--workers", type=int,
+                       help="Number of worker processes")
+    batch.add_argument("-t", "--timeout", type=float,
+                       help="Timeout of each model in seconds")
+    batch.add_argument("-s", "--summary", help="Save a json summary here")
 
     customizer = subparsers.add_parser("customize", help="Customize a model")
     customizer.set_defaults(func=launch_customizer)
@@ -125,6 +151,10 @@ def main():
 
     args = parser.parse_args()
 
+    if getattr(args, 'profile_startup', False):
+        from declaracad.core.startup import PROFILER
+        PROFILER.install()
+
     # Start the app
     launcher = getattr(args, 'func', launch_workbench)
     launcher(args)
@@ -0,0 +1,391 @@
+"""
+Copyright (c) 2020, Jairus Martin.
+
+Distributed under the terms of the GPL v3 License.
+
+The full license is in the file LICENSE, distributed with this software.
+
+Runs many exports in a pool of processes which each load the toolkit once.
+
+"""
+import os
+import sys
+import json
+import glob
+import time
+import queue
+import traceback
+import multiprocessing
+
+#: Seconds between checks of the workers while waiting for results
+POLL_INTERVAL = 0.1
+
+
+#: Application of the worker process
+_app = None
+
+
+def load_manifest(path):
+    """ Load the batch manifest. The manifest is a json file such as:
+
+        {
+            "files": ["models/**/*.enaml"],
+            "exporters": [
+                {"type": "step"},
+                {"type": "stl", "linear_deflection": 0.01}
+            ],
+            "output_dir": "build",
+            "workers": 4,
+            "timeout": 300,
+            "summary": "build/summary.json"
+        }
+
+    Globs are relative to the manifest. Each exporter has a `type` matching
+    the extension of the exporter and any options it supports. Exports are
+    written to the same path relative to the output_dir as the model is to
+    the manifest.
+
+    Parameters
+    ----------
+    path: String
+        Path to the manifest file
+
+    Returns
+    -------
+    manifest: Dict
+        The manifest with the files expanded and the `output_dirs` of each
+        file.
+
+    Raises
+    ------
+    ValueError:
+        If no files match, no exporters are defined, or two files would be
+        exported to the same path.
+
+    """
+    with open(path) as f:
+        manifest = json.load(f)
+    root = os.path.dirname(os.path.abspath(path))
+    files = []
+    for pattern in manifest.get('files', []):
+        pattern = os.path.join(root, pattern)
+        for filename in sorted(glob.glob(pattern, recursive=True)):
+            if filename not in files:
+                files.append(filename)
+    if not files:
+        raise ValueError("No files match the manifest %s" % path)
+    if not manifest.get('exporters'):
+        raise ValueError("No exporters are defined in the manifest %s" % path)
+    manifest['files'] = files
+    output_dir = manifest.get('output_dir')
+    if output_dir:
+        output_dir = manifest['output_dir'] = os.path.join(root, output_dir)
+    output_dirs = manifest['output_dirs'] = [
+        get_output_dir(filename, output_dir, root) for filename in files]
+
+    # Models with the same name must not overwrite each others exports
+    outputs = {}
+    for filename, path in zip(files, output_dirs):
+        name = os.path.splitext(os.path.basename(filename))[0]
+        if path is None:
+            # Exported next to the model
+            path = os.path.dirname(filename)
+        key = os.path.normcase(os.path.join(path, name))
+        if key in outputs:
+            raise ValueError("The exports of %s and %s would overwrite each "
+                             "other" % (outputs[key], filename))
+        outputs[key] = filename
+    summary = manifest.get('summary')
+    if summary:
+        manifest['summary'] = os.path.join(root, summary)
+    return manifest
+
+
+def get_output_dir(filename, output_dir, root):
+    """ Get the directory the exports of the file are written to. This
+    keeps the path of the file relative to the root.
+
+    """
+    if not output_dir:
+        return None
+    path = os.path.dirname(os.path.relpath(filename, root))
+    if path.startswith(os.pardir):
+        # Files outside of the root are exported to the output dir
+        return output_dir
+    return os.path.join(output_dir, path)
+
+
+def init_worker():
+    """ Create the application once per process """
+    global _app
+    from declaracad import occ
+    _app = occ.install_headless()
+
+
+def run_worker(tasks, results):
+    """ Export each model put on the tasks queue until None is received.
+    This is run in the worker process.
+
+    Parameters
+    ----------
+    tasks: multiprocessing.Queue
+        Queue of (index, args) of export_model calls
+    results: multiprocessing.Queue
+        Queue to put ('start', index) before each export and
+        ('done', index, result) after it.
+
+    """
+    init_worker()
+    for index, args in iter(tasks.get, None):
+        results.put(('start', index))
+        try:
+            result = export_model(*args)
+        except Exception:
+            result = failed_result(args[0], traceback.format_exc())
+        results.put(('done', index, result))
+
+
+def failed_result(filename, error):
+    return {'filename': filename, 'ok': False, 'error': error,
+            'exports': []}
+
+
+class Worker(object):
+    """ A worker process exporting one model at a time. The worker is
+    terminated and replaced if a model takes longer than the timeout since
+    a long running OCCT call cannot be interrupted from python.
+
+    """
+    def __init__(self, results):
+        self.tasks = multiprocessing.Queue()
+        self.process = multiprocessing.Process(
+            target=run_worker, args=(self.tasks, results), daemon=True)
+        self.process.start()
+        self.index = None
+        self.started = None
+
+    def submit(self, index, args):
+        self.index = index
+        self.started = None
+        self.tasks.put((index, args))
+
+    def stop(self):
+        if self.process.is_alive():
+            self.tasks.put(None)
+        self.process.join(1)
+        self.terminate()
+
+    def terminate(self):
+        if self.process.is_alive():
+            self.process.terminate()
+        self.process.join()
+
+
+def create_exporter(filename, options, output_dir=None):
+    """ Create the exporter for the given file from the options """
+    from declaracad.occ.plugin import get_exporters
+    options = dict(options)
+    ext = options.pop('type')
+    for cls in get_exporters():
+        if cls.extension == ext:
+            break
+    else:
+        raise ValueError("No exporter for type %s" % ext)
+    exporter = cls(filename=filename, **options)
+    if output_dir and 'path' not in options:
+        name = os.path.basename(exporter.path)
+        exporter.path = os.path.join(output_dir, name)
+    return exporter
+
+
+def export_model(filename, exporters, output_dir=None):
+    """ Load and render the model once then export it with each of the
+    exporters.
+
+    Parameters
+    ----------
+    filename: String
+        The model to export
+    exporters: List[Dict]
+        The options of each exporter
+    output_dir: String
+        Directory to write the exports to. By default they are written next
+        to the model.
+
+    Returns
+    -------
+    result: Dict
+        The timing and status of the job
+
+    """
+    from declaracad.occ.plugin import load_model
+    result = {
+        'filename': filename,
+        'ok': False,
+        'exports': [],
+    }
+    t0 = time.time()
+    try:
+        parts = load_model(filename)
+        for part in parts:
+            part.render()
+        result['render_time'] = time.time() - t0
+        if output_dir and not os.path.exists(output_dir):
+            os.makedirs(output_dir, exist_ok=True)
+        ok = True
+        for options in exporters:
+            t1 = time.time()
+            export = {'type': options.get('type')}
+            try:
+                exporter = create_exporter(filename, options, output_dir)
+                export['path'] = exporter.path
+                exporter.export(parts)
+                export['ok'] = True
+            except Exception:
+                ok = False
+                export['ok'] = False
+                export['error'] = traceback.format_exc()
+            export['time'] = time.time() - t1
+            result['exports'].append(export)
+        result['ok'] = ok
+    except Exception:
+        result['error'] = traceback.format_exc()
+    result['time'] = time.time() - t0
+    return result
+
+
+def main(**kwargs):
+    """ Export all the models in the manifest with each exporter.
+
+    Parameters
+    ----------
+    manifest: String
+        Path to the manifest
+    workers: Int
+        Number of worker processes. Overrides the manifest.
+    timeout: Float
+        Timeout of each model in seconds. Overrides the manifest.
+    summary: String
+        Path to write the json summary to. Overrides the manifest.
+
+    """
+    manifest = load_manifest(kwargs['manifest'])
+    workers = kwargs.get('workers') or manifest.get('workers') or \
+        multiprocessing.cpu_count()
+    timeout = kwargs.get('timeout') or manifest.get('timeout') or 0
+    summary = kwargs.get('summary') or manifest.get('summary')
+    files = manifest['files']
+    exporters = manifest['exporters']
+    output_dirs = manifest['output_dirs']
+    workers = min(workers, len(files))
+
+    print(f"Exporting {len(files)} models using {workers} workers...")
+    sys.stdout.flush()
+    t0 = time.time()
+    tasks = [(f, exporters, d) for f, d in zip(files, output_dirs)]
+    results = run_tasks(tasks, workers, timeout)
+
+    failures = [r['filename'] for r in results if not r['ok']]
+    data = {
+        'time': time.time() - t0,
+        'workers': workers,
+        'total': len(results),
+        'failures': failures,
+        'results': results,
+    }
+    if summary:
+        path = os.path.dirname(summary)
+        if path and not os.path.exists(path):
+            os.makedirs(path)
+        with open(summary, 'w') as f:
+            json.dump(data, f, indent=2)
+    print(f"Exported {len(results)-len(failures)}/{len(results)} models in "
+          f"{round(data['time'], 2)} seconds.")
+    if failures:
+        sys.exit(1)
+
+
+def run_tasks(tasks, workers, timeout=0):
+    """ Run export_model with the args of each task on the workers. The
+    timeout is enforced here so a worker stuck in OCCT can be terminated.
+
+    Parameters
+    ----------
+    tasks: List[Tuple]
+        Args of each export_model call
+    workers: Int
+        Number of worker processes
+    timeout: Float
+        Time in seconds before an export is aborted. Zero is unlimited.
+
+    Returns
+    -------
+    results: List[Dict]
+        The result of each task in order.
+
+    """
+    results = [None] * len(tasks)
+    queued = list(reversed(range(len(tasks))))
+    messages = multiprocessing.Queue()
+    pool = [Worker(messages) for i in range(workers)]
+    idle = list(pool)
+
+    def finish(worker, result):
+        filename = result['filename']
+        status = 'OK' if result['ok'] else 'FAILED'
+        print(f"{status} {filename} ({round(result.get('time', 0), 2)}s)")
+        sys.stdout.flush()
+        results[worker.index] = result
+        worker.index = None
+        idle.append(worker)
+
+    def replace(worker, error):
+        finish(worker, failed_result(tasks[worker.index][0], error))
+        idle.remove(worker)
+        pool.remove(worker)
+        worker.terminate()
+        new_worker = Worker(messages)
+        pool.append(new_worker)
+        idle.append(new_worker)
+
+    def handle(msg):
+        for worker in pool:
+            if worker.index == msg[1]:
+                break
+        else:
+            return  # From a worker that was replaced
+        if msg[0] == 'start':
+            worker.started = time.time()
+        elif msg[0] == 'done':
+            finish(worker, msg[2])
+
+    try:
+        while queued or len(idle) < len(pool):
+            while queued and idle:
+                i = queued.pop()
+                idle.pop().submit(i, tasks[i])
+            try:
+                handle(messages.get(timeout=POLL_INTERVAL))
+            except queue.Empty:
+                pass
+
+            # Check every busy worker even while others keep sending
+            now = time.time()
+            for worker in [w for w in pool if w.index is not None]:
+                if not worker.process.is_alive():
+                    # Handle anything it sent before exiting
+                    try:
+                        while worker.index is not None:
+                            handle(messages.get_nowait())
+                    except queue.Empty:
+                        pass
+                    if worker.index is not None:
+                        replace(worker, "The worker exited with code %s" %
+                                worker.process.exitcode)
+                elif timeout and worker.started and \
+                        now - worker.started > timeout:
+                    replace(worker, "Export timed out after %ss" % timeout)
+    finally:
+        for worker in pool:
+            worker.stop()
+    return results
@@ -16,9 +16,6 @@ import faulthandler
 faulthandler.enable()
 
 from declaracad import occ
-occ.install()
-import enaml
-from enaml.qt.qt_application import QtApplication
 
 
 def main(**kwargs):
@@ -33,10 +30,13 @@ def main(**kwargs):
     options = kwargs.pop('options')
     exporter = jsonpickle.loads(options)
     assert exporter, "Failed to load exporter from: {}".format(options)
-    # An Application is required
-    app = QtApplication()
+    # An Application is required but exporting does not need a gui
+    app = occ.install_headless()
     t0 = time.time()
     print("Exporting {e.filename} to {e.path}...".format(e=exporter))
     sys.stdout.flush()
     exporter.export()
+    if kwargs.get('profile_startup'):
+        from declaracad.core.startup import PROFILER
+        PROFILER.report()
     print("Success! Took {} seconds.".format(round(time.time()-t0, 2)))
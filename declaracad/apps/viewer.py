@@ -26,6 +26,7 @@ from declaracad import occ
 occ.install()
 from declaracad.core.app import Application
 from declaracad.core.utils import JSONRRCProtocol
+from declaracad.core.framing import available_codecs
 from declaracad.core.stdio import create_stdio_connection
 
 with enaml.imports():
@@ -46,8 +47,11 @@ class ViewerProtocol(JSONRRCProtocol):
     _exit_in_sec = Float(60, strict=False)
 
     def connection_made(self, transport):
+        # Advertise the supported framing codecs, the owner may then request
+        # to switch from the newline delimited protocol using `set_framing`
         self.send_message({'result': self.handle_window_id(),
-                           'id': 'window_id'})
+                           'id': 'window_id',
+                           'framing': available_codecs()})
         if self.view.frameless:
             self.schedule_close()
 
@@ -146,6 +150,9 @@ def main(**kwargs):
     view.show()
     app.deferred_call(create_stdio_connection, app.loop, view.protocol)
     app.deferred_call(view.protocol.handle_filename, filename)
+    if kwargs.get('profile_startup'):
+        from declaracad.core.startup import PROFILER
+        app.deferred_call(PROFILER.report)
     app.start()
 
 
@@ -11,6 +11,8 @@ Created on Aug 18, 2020
 """
 import os
 import re
+import numpy as np
+from array import array
 from collections import OrderedDict
 from atom.api import (
     Atom, Property, List, Instance, Str, Int, Enum, Float, Bool, Dict, observe
@@ -100,11 +102,30 @@ class Command(Atom):
 
 class GCode(Atom):
     path = Str()
+
+    #: Commands are only created when accessed
     commands = List(Command)
 
+    #: Command ids, the opcodes are an index into this list
+    codes = List(str)
+
+    #: Index of the id of each command in codes
+    opcodes = Instance(np.ndarray)
+
+    #: Line number of each command
+    lines = Instance(np.ndarray)
+
+    #: Byte offset of the line of each command in the file
+    offsets = Instance(np.ndarray)
+
+    #: Mapping of each code in COLUMNS to an array of the value in each
+    #: command or nan if the command does not have it
+    columns = Dict()
+
     AXIS_CODES = 'XYZABCUVW'
     ID_CODES = 'GMTS'
     MOVE_CODES = ('G0', 'G1', 'G2', 'G3', 'G5', 'G5.1')
+    COLUMNS = 'XYZFIJKRPQ'
 
     COLORMAP = {
         'G0': 'green',
@@ -113,18 +134,71 @@ class GCode(Atom):
         'G3': 'green',
     }
 
+    def _default_commands(self):
+        if not self.path:
+            return []
+        return list(iter_commands(self.path))
+
+    def __len__(self):
+        if self.opcodes is not None:
+            return len(self.opcodes)
+        return len(self.commands)
+
     def __repr__(self):
-        return "GCode<file='{} cmds=[\n    {}\n]>".format(
-            self.path, ",\n    ".join(map(str, self.commands[0:100])))
+        return "GCode<file='{}' cmds={}>".format(self.path, len(self))
+
+    def ids(self):
+        """ Return an array of the id of each command """
+        return np.array(self.codes, dtype=object)[self.opcodes]
+
+    def command(self, i):
+        """ Create the Command at the given index by parsing it's line.
+
+        Parameters
+        ----------
+        i: Int
+            The index of the command
+
+        Returns
+        -------
+        command: Command
+            The command
+
+        """
+        if self.opcodes is None:
+            return self.commands[i]
+        line = int(self.lines[i])
+        first = int(np.searchsorted(self.lines, line))
+        with open(self.path, 'rb') as f:
+            f.seek(int(self.offsets[i]))
+            raw = f.readline()
+        # Lookup the last move before the line
+        move_codes = [j for j, c in enumerate(self.codes)
+                      if c in self.MOVE_CODES]
+        moves = np.flatnonzero(np.isin(self.opcodes[:first], move_codes))
+        last_move = self.codes[self.opcodes[moves[-1]]] if len(moves) else ''
+        results = list(iter_parse([raw], last_move, line-1))
+        line, offset, source, comment, cmd_id, args = results[i-first]
+        cmd = Command(comment=comment, source=source, line=line)
+        if args is not None:
+            cmd.id = self.codes[self.opcodes[i]]
+            cmd.data = OrderedDict(args)
+        return cmd
 
     def max(self):
         """ Return max value of each axis """
+        if self.columns:
+            return Point(*(np.nanmax(self.columns[axis])
+                           for axis in ('X', 'Y', 'Z')))
         return Point(*(max(c.data[axis] for c in self.commands
                           if c.data and axis in c.data)
                      for axis in ('X', 'Y', 'Z')))
 
     def min(self):
         """ Return min value of each axis """
+        if self.columns:
+            return Point(*(np.nanmin(self.columns[axis])
+                           for axis in ('X', 'Y', 'Z')))
         return Point(*(min(c.data[axis] for c in self.commands
                           if c.data and axis in c.data)
                      for axis in ('X', 'Y', 'Z')))
@@ -132,13 +206,32 @@ class GCode(Atom):
 
 class Movement(Atom):
     rapid = Bool()
-    points = List()
+
+    #: List of points or an (N, 3) array of points
+    points = Instance((list, np.ndarray), factory=list)
 
     def clone(self):
+        if isinstance(self.points, np.ndarray):
+            return Movement(rapid=self.rapid, points=self.points.copy())
         return Movement(
             rapid=self.rapid,
             points=[Point(*p) for p in self.points])
 
+    def to_array(self):
+        """ Get the points as an (N, 3) array """
+        points = self.points
+        if isinstance(points, np.ndarray):
+            return points
+        return np.array([(p.x, p.y, p.z) for p in points],
+                        dtype=np.float64).reshape(-1, 3)
+
+    def length(self):
+        """ Get the total length of the movement """
+        points = self.to_array()
+        if len(points) < 2:
+            return 0
+        return float(np.linalg.norm(np.diff(points, axis=0), axis=1).sum())
+
 
 def convert(v, scale=1, precision=None):
     """ Convert a value for writing to gcode
@@ -166,6 +259,32 @@ def convert(v, scale=1, precision=None):
     return round(v*scale, precision)
 
 
+def convert_array(v, scale=1, precision=None):
+    """ Convert an array of values for writing to gcode. See `convert`.
+
+    Parameters
+    ----------
+    v: numpy.ndarray
+        The values to convert
+    scale: Float
+        The scale to apply
+    precision: None or Int
+        The precision to apply, if 0 convert to integer, if None
+        use full precision, otherwise round to given decimal places.
+
+    Returns
+    -------
+    v: numpy.ndarray
+        The converted values
+
+    """
+    if precision == 0:
+        return np.trunc(v*scale).astype(np.int64)
+    elif precision is None:
+        return v*scale
+    return np.round(v*scale, precision)
+
+
 def save_to_file(filename, movements, device):
     """ Write to a file
 
@@ -174,7 +293,8 @@ def save_to_file(filename, movements, device):
     filename: String
         The path to the file to save
     movements: List[Movement]
-        List of movements to save
+        List of movements to save. The points of each movement may be a
+        list of points or an array.
     device: Device
         Device to save it for
     """
@@ -185,15 +305,157 @@ def save_to_file(filename, movements, device):
             f.write(device.config.init_commands)
         for movement in movements:
             cmd = "G0" if movement.rapid else "G1"
-            for point in movement.points:
-                x, y, z = device.convert(point)
-                f.write(f"{cmd} X{x} Y{y} Z{z}\n")
+            if isinstance(movement.points, np.ndarray):
+                points = device.convert_array(movement.points)
+            else:
+                points = map(device.convert, movement.points)
+            f.writelines(f"{cmd} X{x} Y{y} Z{z}\n" for x, y, z in points)
         if device.config.finalize_commands:
             f.write(device.config.finalize_commands)
 
 
+#: Splits the comment from the data
+COMMENT_RE = re.compile(r';|\(|%')
+
+#: Matches each argument
+ARG_RE = re.compile(r'([A-z]) *(-?[\d.]+) *')
+
+
+def iter_parse(lines, last_move='', start=0, offset=0):
+    """ Parse lines of gcode yielding the data of each command. Commands are
+    yielded as soon as their line is parsed so large files can be processed
+    without loading all of them at once.
+
+    Parameters
+    ----------
+    lines: Iterable[Bytes]
+        The lines to parse, such as an open file in binary mode.
+    last_move: String
+        The id of the last move used by lines without a command id.
+    start: Int
+        The index of the first line
+    offset: Int
+        The byte offset of the first line
+
+    Notes
+    -----
+    This does not handle inline comments or multiple commands on a single line
+
+    Yields
+    ------
+    result: Tuple
+        A tuple of the line number, byte offset of the line, source,
+        comment, id, and the list of (key, value) arguments. The arguments
+        are None for comments.
+
+    """
+    move_codes = GCode.MOVE_CODES
+    axis_codes = GCode.AXIS_CODES
+    id_codes = GCode.ID_CODES
+    for i, raw in enumerate(lines, start):
+        line_offset = offset
+        offset += len(raw)
+        line = raw.decode(errors='replace').strip()
+        if not line:
+            continue
+
+        # Strip comments
+        parts = COMMENT_RE.split(line, maxsplit=1)
+        data = parts[0].strip()
+        comment = "" if len(parts) == 1 else parts[1]
+        if not data and not comment:
+            continue
+
+        if not data:
+            yield (i+1, line_offset, line, comment, '', None)  # Comment
+            continue
+
+        # The id is determined when first needed like Command.id
+        cmd_id = None
+        args = []
+
+        def get_id():
+            nonlocal cmd_id
+            if cmd_id is None:
+                cmd_id = ''
+                for k, v in args:
+                    if k in id_codes:
+                        cmd_id = normalize(k, v)
+                        break
+            if not cmd_id:
+                # If command is not specified use the last move
+                cmd_id = last_move
+            return cmd_id
+
+        try:
+            keys = set()
+            for k, v in ARG_RE.findall(data):
+                k = k.upper()
+                v = float(v)
+                if k in keys:
+                    # HACK: Split out to a new command
+                    # when duplicate keys are given in the same line, eg:
+                    #     N40 G90 G00 X0 Y0
+                    # is split into a G90 and G0
+                    split = True
+                elif k in axis_codes:
+                    # HACK: If we get move arguments for a non-move split
+                    # the command, eg a
+                    #    N100 G01 X30 Y50
+                    #    N110 G91 X10.1 Y-10.1
+                    # should be split into a G1, G91, G1
+                    split = get_id() not in move_codes
+                else:
+                    split = False
+                if split:
+                    cmd = get_id()
+                    if cmd in move_codes:
+                        last_move = cmd
+                    yield (i+1, line_offset, line, comment, cmd, args)
+                    cmd_id = None
+                    args = []
+                    keys = set()
+                keys.add(k)
+                args.append((k, v))
+        except ValueError as e:
+            raise ValueError("Failed to parse line %s: %s" % (i+1, e))
+        cmd = get_id()
+        if cmd in move_codes:
+            last_move = cmd
+        yield (i+1, line_offset, line, comment, cmd, args)
+
+
+def iter_commands(path):
+    """ Parse the file at the given path yielding each Command as it is
+    parsed.
+
+    Parameters
+    ----------
+    path: String
+        The file path
+
+    Yields
+    ------
+    command: Command
+        Each command in the file
+
+    """
+    with open(path, 'rb') as f:
+        try:
+            for line, offset, source, comment, cmd_id, args in iter_parse(f):
+                cmd = Command(comment=comment, source=source, line=line)
+                if args is not None:
+                    cmd.id = cmd_id
+                    cmd.data = OrderedDict(args)
+                yield cmd
+        except ValueError as e:
+            filepath, filename = os.path.split(path)
+            raise ValueError("Failed to parse '%s': %s" % (filename, e))
+
+
 def parse(path):
-    """ Parse the file at the given path into a list of Commands
+    """ Parse the file at the given path into a columnar GCode. The Commands
+    are only created when needed.
 
     Parameters
     ----------
@@ -210,83 +472,48 @@ def parse(path):
         A GCode instance with the parsed commands
 
     """
-    cmds = []
-
-    def set_id(cmd):
-        if not cmd.id:
-            # If command is not specified use the last move
-            for c in reversed(cmds):
-                if c.is_move:
-                    cmd.id = c.id
-                    break
-        return cmd.id
-
-    def finish(cmd):
-        set_id(cmd)
-        cmds.append(cmd)
-
-    with open(path) as f:
-        for i, line in enumerate(f):
-            line = line.strip()
-            if not line:
-                continue
-
-            # Strip comments
-            parts = re.split(r';|\(|%', line, maxsplit=1)
-            data = parts[0].strip()
-            comment = "" if len(parts) == 1 else parts[1]
-            if not data and not comment:
-                continue
-
-            cmd = Command(comment=comment, source=line, line=i+1)
-            if not data:
-                cmds.append(cmd)  # Comment
-                continue
-
-            try:
-                # Parse args
-                args = []
-                for c in re.findall(r'[A-z] *-?[\d.]+ *', data):
-                    args.append((c[0].upper(), float(c[1:])))
-
-                keys = set((it[0] for it in args))
-
-                # Since some files put mode changes on the same line
-                # split them into separate commands
-                cmd.data = d = OrderedDict()
-                for k, v in args:
-                    if k in d:
-                        # HACK: Split out to a new command
-                        # when duplicate keys are given in the same line, eg:
-                        #     N40 G90 G00 X0 Y0
-                        # is split into a G90 and G0
-                        finish(cmd)
-                        cmd = Command(comment=comment,
-                                      source=line,
-                                      line=i+1)
-                        cmd.data = d = OrderedDict()
-                    elif k in GCode.AXIS_CODES:
-                        # HACK: If we get move arguments for a non-move split
-                        # the command, eg a
-                        #    N100 G01 X30 Y50
-                        #    N110 G91 X10.1 Y-10.1
-                        # should be split into a G1, G91, G1
-                        cmd_id = set_id(cmd)
-                        if cmd_id not in GCode.MOVE_CODES:
-                            finish(cmd)
-                            cmd = Command(comment=comment,
-                                          source=line,
-                                          line=i+1)
-                            cmd.data = d = OrderedDict()
-                    d[k] = v
-                finish(cmd)
-            except ValueError as e:
-                filepath, filename = os.path.split(path)
-                msg = "Failed to parse '%s' at line %s: %s" % (
-                    filename, i, e)
-                raise ValueError(msg)
-
-    return GCode(path=path, commands=cmds)
+    codes = {}
+    opcodes = array('i')
+    lines = array('q')
+    offsets = array('q')
+
+    # Column values are stored sparsely as (row, column, value)
+    names = {k: i for i, k in enumerate(GCode.COLUMNS)}
+    rows = array('q')
+    cols = array('q')
+    vals = array('d')
+    n = 0
+    with open(path, 'rb') as f:
+        try:
+            for line, offset, source, comment, cmd_id, args in iter_parse(f):
+                opcode = codes.get(cmd_id)
+                if opcode is None:
+                    opcode = codes[cmd_id] = len(codes)
+                opcodes.append(opcode)
+                lines.append(line)
+                offsets.append(offset)
+                if args:
+                    for k, v in args:
+                        c = names.get(k)
+                        if c is not None:
+                            rows.append(n)
+                            cols.append(c)
+                            vals.append(v)
+                n += 1
+        except ValueError as e:
+            filepath, filename = os.path.split(path)
+            raise ValueError("Failed to parse '%s': %s" % (filename, e))
+
+    data = np.full((len(names), n), np.nan)
+    data[np.frombuffer(cols, dtype=np.int64),
+         np.frombuffer(rows, dtype=np.int64)] = np.frombuffer(vals)
+    return GCode(
+        path=path,
+        codes=list(codes),
+        opcodes=np.frombuffer(opcodes, dtype=np.int32),
+        lines=np.frombuffer(lines, dtype=np.int64),
+        offsets=np.frombuffer(offsets, dtype=np.int64),
+        columns={k: data[i] for k, i in names.items()})
 
 
 class Waypoint(Atom):
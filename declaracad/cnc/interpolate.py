@@ -9,7 +9,12 @@ Created on Dec 27, 2020
 
 @author: jrm
 """
-from declaracad.occ.api import Topology, Wire
+import math
+import numpy as np
+from collections import namedtuple
+from OCCT.TopExp import TopExp
+from declaracad.occ.api import Point, Topology, Wire
+from declaracad.occ.geom import settings
 
 
 def distance(points, start, end, scale=-1):
@@ -19,8 +24,9 @@ def distance(points, start, end, scale=-1):
 
     Parameters
     ----------
-    points: List[Point]
-        List of 2d points interpolate
+    points: List[Point] or numpy.ndarray
+        List of 2d points interpolate or an (N, 3) array of points. Arrays
+        are updated in place.
     start: Float
         The starting z-value
     end: Float
@@ -30,10 +36,12 @@ def distance(points, start, end, scale=-1):
 
     Returns
     -------
-    points: List[Point] or None
+    points: List[Point], numpy.ndarray or None
         The list of interpolated points on the curve
 
     """
+    if isinstance(points, np.ndarray):
+        return distance_array(points, start, end, scale)
     p0, p1 = points[0:2]
     if p0 == p1:
         None  # Line is vertical
@@ -65,6 +73,137 @@ def distance(points, start, end, scale=-1):
     return points
 
 
+def distance_array(points, start, end, scale=-1):
+    """ Set the z-value of the points by interpolating the distance from start
+    and end points. See `distance`.
+
+    Parameters
+    ----------
+    points: numpy.ndarray
+        An (N, 3) array of points. The z-values are updated in place.
+    start: Float
+        The starting z-value
+    end: Float
+        The ending z-value
+    scale: Float
+        Scale to apply to interpolation
+
+    Returns
+    -------
+    points: numpy.ndarray or None
+        The points or None if the total 2d distance is zero.
+
+    """
+    d = np.hypot(*np.diff(points[:, :2], axis=0).T)
+    d = np.concatenate(([0], np.cumsum(d)))
+    if len(points) < 2 or d[-1] == 0:
+        return None  # Line is vertical
+    z = start * scale
+    dz = (end - start) * scale
+    points[:, 2] = z + dz * (d / d[-1])
+    return points
+
+
+#: An edge in the graph. The points are the vertices of the graph the edge
+#: connects and the id is unique within the graph.
+GraphEdge = namedtuple('GraphEdge', ('id', 'shape', 'points'))
+
+
+class VertexGraph(dict):
+    """ Maps vertices to the list of GraphEdges connected to them. Points
+    within the tolerance of an existing vertex are merged into it. The
+    vertices are stored in a grid with cells the size of the tolerance so
+    a lookup only has to check the neighboring cells.
+
+    """
+    def __init__(self, tolerance=None):
+        super().__init__()
+        self.tolerance = tolerance or settings.tolerance
+        self.cells = {}
+        self.edge_count = 0
+
+    def get_cell(self, v):
+        s = self.tolerance
+        return (math.floor(v.x/s), math.floor(v.y/s), math.floor(v.z/s))
+
+    def find(self, v):
+        """ Find the vertex in the graph that is equal to the point within
+        the tolerance.
+
+        Parameters
+        ----------
+        v: Point
+            The point to find
+
+        Returns
+        -------
+        vertex: Point or None
+            The vertex in the graph if found.
+
+        """
+        cells = self.cells
+        x, y, z = self.get_cell(v)
+        tol2 = self.tolerance ** 2
+        for i in (x-1, x, x+1):
+            for j in (y-1, y, y+1):
+                for k in (z-1, z, z+1):
+                    for vertex in cells.get((i, j, k), ()):
+                        d2 = ((vertex.x-v.x)**2 + (vertex.y-v.y)**2 +
+                              (vertex.z-v.z)**2)
+                        if d2 <= tol2:
+                            return vertex
+
+    def add_vertex(self, v):
+        """ Add the point to the graph if no equal vertex exists.
+
+        Parameters
+        ----------
+        v: Point
+            The point to add
+
+        Returns
+        -------
+        vertex: Point
+            The vertex in the graph.
+
+        """
+        vertex = self.find(v)
+        if vertex is None:
+            vertex = v
+            self[v] = []
+            cell = self.get_cell(v)
+            vertices = self.cells.get(cell)
+            if vertices is None:
+                vertices = self.cells[cell] = []
+            vertices.append(v)
+        return vertex
+
+    def add_edge(self, edge):
+        """ Add the edge to the graph.
+
+        Parameters
+        ----------
+        edge: TopoDS_Edge
+            The edge to add
+
+        Returns
+        -------
+        edge: GraphEdge
+            The edge in the graph.
+
+        """
+        points = []
+        for v in (TopExp.FirstVertex_(edge), TopExp.LastVertex_(edge)):
+            vertex = self.add_vertex(Point(v))
+            if not points or points[0] is not vertex:
+                points.append(vertex)
+        e = GraphEdge(self.edge_count, edge, points)
+        self.edge_count += 1
+        for vertex in points:
+            self[vertex].append(e)
+        return e
+
+
 def lookup_vertex(graph, v):
     """ Lookup the vertex in the graph using the hash, if that fails,
     fallback to using equals to find points that are equal within
@@ -82,6 +221,11 @@ def lookup_vertex(graph, v):
     entry: Tuple or None
         If the vertex is found return vertex and matching item in the graph.
     """
+    if isinstance(graph, VertexGraph):
+        vertex = graph.find(v)
+        if vertex is not None:
+            return (vertex, graph[vertex])
+        return None
     item = graph.get(v)
     if item is not None:
         return (v, item)
@@ -90,7 +234,7 @@ def lookup_vertex(graph, v):
             return (vertex, item)
 
 
-def build_edge_graph(shapes):
+def build_edge_graph(shapes, tolerance=None):
     """ Build a graph of verticies and edges that connect them. This assumes
     that all edges are unique.
 
@@ -98,38 +242,76 @@ def build_edge_graph(shapes):
     ----------
     shapes: Iterable[TopoDS_Shape]
         Iterable of shapes to build an edge graph from
+    tolerance: Float
+        Distance at which points are considered the same vertex. Defaults to
+        the settings tolerance.
 
     Returns
     -------
-    graph: Dict
-        A mapping of points to the list of connected edge topologies
+    graph: VertexGraph
+        A mapping of points to the list of connected edges
 
     """
-    graph = {}
+    graph = VertexGraph(tolerance)
     for s in shapes:
         for e in Topology(shape=s).edges:
-            edge_topo = Topology(shape=e)
-            for p in edge_topo.points:
-                r = graph.get(p)
-                if r is None:
-                    # Lookup using equals instead of hash
-                    for node in graph:
-                        if node == p:
-                            r = graph[node]
-                            break
-                    if r is None:
-                        r = graph[p] = []
-                r.append(edge_topo)
+            graph.add_edge(e)
     return graph
 
 
+def walk_graph_edges(graph, vertex, edge):
+    """ Start at the given vertex and walk the edge until a leaf, branch, or
+    the start (if the edges form a loop) is found.
+
+    Parameters
+    ----------
+    graph: VertexGraph
+        The graph to walk.
+    vertex: Point
+        The vertex to start at
+    edge: GraphEdge
+        The edge to walk.
+
+    Yields
+    ------
+    result: Tuple[Point, GraphEdge or None]
+        The vertex and edge walked. When the terminating vertex is found
+        the edge is None.
+
+    """
+    used = set()
+    while True:
+        yield (vertex, edge)
+        used.add(edge.id)
+        if len(edge.points) == 1:
+            yield (vertex, None) # Closed edge, done
+            break
+
+        # Find other point
+        other_vertices = [p for p in edge.points if p is not vertex]
+        assert len(other_vertices) == 1
+        vertex = other_vertices[0]
+        edges = graph[vertex]
+        if len(edges) != 2:
+            yield (vertex, None) # Final vertex, done
+            break
+
+        # Find other edge
+        other_edges = [e for e in edges if e.id != edge.id]
+        assert len(other_edges) == 1
+        edge = other_edges[0]
+        if edge.id in used:
+            yield (vertex, None) # Back at the start of a loop
+            break
+
+
 def walk_edges(graph, vertex, edge):
     """ Start at the given vertex and walk the edge until a leaf or branch
     is found.
 
     Parameters
     ----------
-    graph: Dict
+    graph: VertexGraph
         The graph to walk.
     vertex: Point
         The point to start at
@@ -143,33 +325,54 @@ def walk_edges(graph, vertex, edge):
         the edge is None.
 
     """
-    used = set() # TODO: Detect loops
-    vertex, topos = lookup_vertex(graph, vertex)
-    topo = None
-    for t in topos:
-        if t.shape == edge:
-            topo = t
-            yield (vertex, edge)
+    entry = lookup_vertex(graph, vertex)
+    if entry is None:
+        raise ValueError("Vertex is not in the graph")
+    vertex, edges = entry
+    for e in edges:
+        if e.shape.IsSame(edge):
             break
-    if topo is None:
+    else:
         raise ValueError("Edge is not connected")
-    while True:
-        # Find other point
-        other_vertices = [p for p in topo.points if p != vertex]
-        assert len(other_vertices) == 1
-        next_vertex = other_vertices[0]
-        assert vertex != next_vertex
-        vertex, topos = lookup_vertex(graph, next_vertex)
-        if len(topos) != 2:
-            yield (vertex, None) # Final vertex, done
-            break
+    for v, e in walk_graph_edges(graph, vertex, e):
+        yield (v, e.shape if e is not None else None)
 
-        # Find other edge
-        other_edges = [t for t in topos if not t.shape.IsSame(edge)]
-        assert len(other_edges) == 1
-        topo = other_edges[0]
-        edge = topo.shape
-        yield (vertex, edge)
+
+def split_chains(graph):
+    """ Split the graph into chains of edges between leaves and branch
+    points. Edges which form closed loops are also included.
+
+    Parameters
+    ----------
+    graph: VertexGraph
+        The graph to split
+
+    Yields
+    ------
+    chain: Tuple[Point, Point, List[GraphEdge]]
+        The start vertex, end vertex, and edges of each chain in order.
+
+    """
+    visited = set()
+
+    def walk(vertex, edge):
+        walked = list(walk_graph_edges(graph, vertex, edge))
+        edges = [e for v, e in walked if e is not None]
+        visited.update(e.id for e in edges)
+        return (vertex, walked[-1][0], edges)
+
+    for vertex, edges in graph.items():
+        if len(edges) == 2:
+            continue
+        for edge in edges:
+            if edge.id not in visited:
+                yield walk(vertex, edge)
+
+    # Any edges not visited form closed loops
+    for vertex, edges in graph.items():
+        for edge in edges:
+            if edge.id not in visited:
+                yield walk(vertex, edge)
 
 
 def split_wires(graph):
@@ -177,9 +380,8 @@ def split_wires(graph):
 
     Parameters
     ----------
-    wire: List[TopoDS_Wire]
-        The list is wires to split
-    graph:
+    graph: VertexGraph
+        The graph to split
 
     Yields
     ------
@@ -187,22 +389,8 @@ def split_wires(graph):
         Each wire in the graph
 
     """
-    visited_edges = []
-    for vertex, topos in graph.items():
-        if len(topos) == 2:
-            continue
-        for topo in topos:
-            edge = topo.shape
-            if Topology.is_shape_in_list(edge, visited_edges):
-                continue
-            edges = [e for v, e in walk_edges(graph, vertex, edge)
-                     if e is not None]
-            yield Wire(edges=edges).render()
-
-            # Add first and last edges to visited list
-            visited_edges.append(edges[0])
-            if len(edges) > 1:
-                visited_edges.append(edges[-1])
+    for start, end, edges in split_chains(graph):
+        yield Wire(edges=[e.shape for e in edges]).render()
 
 
 def group_connected_wires(wires):
@@ -9,20 +9,331 @@ Created on Aug 22, 2020
 
 @author: jrm
 """
-import sys
 import time
+import numpy as np
 from OCCT.BRepAdaptor import BRepAdaptor_CompCurve
-from declaracad.occ.api import Topology
+from OCCT.TopoDS import TopoDS
+from declaracad.core.utils import log
+from declaracad.occ.api import Point, Wire
+from declaracad.occ.geom import settings
+from declaracad.occ.impl.topology import WireExplorer
 from . import interpolate
 
+try:
+    from scipy.spatial import cKDTree
+except ImportError:
+    cKDTree = None
 
-def optimize_graph(wires, optimizer_timeout=30):
-    """ Try to reduce the number of head lifts by retracing common paths.
+
+#: Direction modes of a wire in a tour. Closed wires use the index of
+#: the vertex the wire is entered at instead.
+FORWARD = -1
+REVERSED = -2
+
+
+def get_endpoints(wires):
+    """ Get the start and end point of each wire.
+
+    Parameters
+    ----------
+    wires: List[TopoDS_Wire]
+        The wires
+
+    Returns
+    -------
+    result: Tuple[numpy.ndarray, numpy.ndarray]
+        The (N, 3) arrays of start and end points
+
+    """
+    n = len(wires)
+    starts = np.empty((n, 3))
+    ends = np.empty((n, 3))
+    for i, w in enumerate(wires):
+        c = BRepAdaptor_CompCurve(w)
+        p = c.Value(c.FirstParameter())
+        starts[i] = (p.X(), p.Y(), p.Z())
+        p = c.Value(c.LastParameter())
+        ends[i] = (p.X(), p.Y(), p.Z())
+    return starts, ends
+
+
+def get_vertices(wire):
+    """ Get the start vertex of each edge of the wire in order as an array.
+
+    """
+    vertices = WireExplorer(wire=TopoDS.Wire_(wire)).ordered_vertices()
+    return np.array([Point(v)[:] for v in vertices]).reshape(-1, 3)
+
+
+def rotate_wire(wire, index):
+    """ Create a new closed wire which starts at the vertex with the given
+    index.
+
+    """
+    if index == 0:
+        return wire
+    edges = WireExplorer(wire=TopoDS.Wire_(wire)).ordered_edges()
+    return Wire(edges=edges[index:] + edges[:index]).render()
+
+
+def orient_wire(wire, start, tol=None):
+    """ Reverse the wire if it does not start at the given point.
+
+    """
+    c = BRepAdaptor_CompCurve(wire)
+    p = c.Value(c.FirstParameter())
+    d = np.linalg.norm(np.array((p.X(), p.Y(), p.Z())) - start)
+    if d > (tol or settings.tolerance):
+        return wire.Reversed()
+    return wire
+
+
+class NearestEntry(object):
+    """ Finds the nearest unused entry point. A KD-tree is used if scipy
+    is available otherwise all remaining points are checked.
+
+    """
+    def __init__(self, points, owners):
+        self.points = points
+        self.owners = owners
+        self.used = np.zeros(len(points), dtype=bool)
+        self.tree = cKDTree(points) if cKDTree and len(points) else None
+
+    def remove(self, owner):
+        self.used[self.owners == owner] = True
+
+    def query(self, p):
+        """ Return the index of the nearest unused point """
+        used = self.used
+        n = len(used)
+        if self.tree is not None:
+            k = 8
+            while True:
+                k = min(k, n)
+                d, idx = self.tree.query(p, k)
+                idx = np.atleast_1d(idx)
+                free = idx[~used[idx]]
+                if len(free):
+                    return int(free[0])
+                if k == n:
+                    return None
+                k *= 4
+        free = np.flatnonzero(~used)
+        if not len(free):
+            return None
+        d = np.linalg.norm(self.points[free] - p, axis=1)
+        return int(free[np.argmin(d)])
+
+
+def build_tour(start_point, starts, ends, vertices, allow_reverse=True):
+    """ Build an initial tour using the nearest neighbor.
+
+    Parameters
+    ----------
+    start_point: numpy.ndarray
+        Starting position
+    starts: numpy.ndarray
+        The start point of each wire
+    ends: numpy.ndarray
+        The end point of each wire
+    vertices: Dict[Int, numpy.ndarray]
+        The entry points of each closed wire
+    allow_reverse: Bool
+        Whether open wires may be cut in reverse
+
+    Returns
+    -------
+    tour: List[Tuple[Int, Int]]
+        List of the wire index and the mode
+
+    """
+    points, owners, modes = [], [], []
+    for i in range(len(starts)):
+        if i in vertices:
+            v = vertices[i]
+            points.extend(v)
+            owners.extend([i] * len(v))
+            modes.extend(range(len(v)))
+            continue
+        points.append(starts[i])
+        owners.append(i)
+        modes.append(FORWARD)
+        if allow_reverse:
+            points.append(ends[i])
+            owners.append(i)
+            modes.append(REVERSED)
+    owners = np.array(owners)
+    search = NearestEntry(np.array(points).reshape(-1, 3), owners)
+
+    tour = []
+    p = start_point
+    while True:
+        j = search.query(p)
+        if j is None:
+            break
+        i, mode = int(owners[j]), modes[j]
+        search.remove(i)
+        tour.append((i, mode))
+        p = entry_exit(i, mode, starts, ends, vertices)[1]
+    return tour
+
+
+def entry_exit(i, mode, starts, ends, vertices):
+    """ Get the entry and exit point of the wire using the mode """
+    if mode == FORWARD:
+        return starts[i], ends[i]
+    elif mode == REVERSED:
+        return ends[i], starts[i]
+    p = vertices[i][mode]
+    return p, p
+
+
+def tour_length(start_point, entries, exits):
+    """ Get the total travel distance between the wires of the tour """
+    if not len(entries):
+        return 0
+    prev = np.vstack([start_point, exits[:-1]])
+    return float(np.linalg.norm(entries - prev, axis=1).sum())
+
+
+def improve_tour(start_point, tour, entries, exits, time_limit,
+                 allow_reverse=True):
+    """ Improve the tour using 2-opt (which reverses a section of the tour)
+    and Or-opt (which moves short sections of the tour) until no
+    improvement is found or the time limit is reached.
+
+    Parameters
+    ----------
+    start_point: numpy.ndarray
+        Starting position
+    tour: List[Tuple[Int, Int]]
+        The tour to improve
+    entries: numpy.ndarray
+        The entry point of each wire in the tour
+    exits: numpy.ndarray
+        The exit point of each wire in the tour
+    time_limit: Float
+        The time at which the search is stopped
+    allow_reverse: Bool
+        Whether open wires may be cut in reverse. This is required for
+        2-opt.
+
+    Returns
+    -------
+    tour: List[Tuple[Int, Int]]
+        The improved tour
+
+    """
+    n = len(tour)
+    tour = list(tour)
+    entries = entries.copy()
+    exits = exits.copy()
+    eps = 1e-9
+    norm = np.linalg.norm
+
+    def flip(item):
+        i, mode = item
+        if mode == FORWARD:
+            return (i, REVERSED)
+        elif mode == REVERSED:
+            return (i, FORWARD)
+        return item  # Closed wires enter and exit at the same point
+
+    improved = True
+    while improved and time.time() < time_limit:
+        improved = False
+
+        # 2-opt
+        if allow_reverse:
+            for i in range(n):
+                prev = start_point if i == 0 else exits[i-1]
+                x = exits[i:]
+                e_next = entries[i+1:]
+                d_old = norm(prev - entries[i])
+                # Cost of the link after each j, the last has none
+                link_old = np.zeros(n-i)
+                link_new = np.zeros(n-i)
+                link_old[:-1] = norm(x[:-1] - e_next, axis=1)
+                link_new[:-1] = norm(entries[i] - e_next, axis=1)
+                delta = norm(prev - x, axis=1) + link_new - d_old - link_old
+                j = int(np.argmin(delta))
+                if delta[j] < -eps:
+                    j += i
+                    tour[i:j+1] = [flip(t) for t in reversed(tour[i:j+1])]
+                    entries[i:j+1], exits[i:j+1] = (
+                        exits[i:j+1][::-1].copy(), entries[i:j+1][::-1].copy())
+                    improved = True
+                if time.time() > time_limit:
+                    break
+
+        # Or-opt
+        for length in (1, 2, 3):
+            if time.time() > time_limit:
+                break
+            i = 0
+            while i + length <= n:
+                j = i + length - 1
+                prev = start_point if i == 0 else exits[i-1]
+                has_next = j + 1 < n
+                nxt = entries[j+1] if has_next else None
+                # Gain from removing the segment
+                gain = norm(prev - entries[i])
+                if has_next:
+                    gain += norm(exits[j] - nxt) - norm(prev - nxt)
+
+                # Cost to insert it after each other position k
+                # Build the tour without the segment
+                idx = np.r_[0:i, j+1:n]
+                if not len(idx):
+                    break
+                x = np.vstack([start_point, exits[idx]])
+                e = np.vstack([entries[idx], np.full((1, 3), np.nan)])
+                link = norm(x - e, axis=1)
+                link[-1] = 0
+                e_ok = ~np.isnan(e[:, 0])
+                cost = norm(x - entries[i], axis=1) - link
+                cost[e_ok] += norm(exits[j] - e[e_ok], axis=1)
+                k = int(np.argmin(cost))
+                if cost[k] < gain - eps:
+                    # Insert after position k of the reduced tour
+                    segment = tour[i:j+1]
+                    seg_entries = entries[i:j+1].copy()
+                    seg_exits = exits[i:j+1].copy()
+                    rest = [tour[m] for m in idx]
+                    tour = rest[:k] + segment + rest[k:]
+                    entries = np.vstack(
+                        [entries[idx][:k], seg_entries, entries[idx][k:]])
+                    exits = np.vstack(
+                        [exits[idx][:k], seg_exits, exits[idx][k:]])
+                    improved = True
+                i += 1
+                if time.time() > time_limit:
+                    break
+    return tour
+
+
+def optimize_moves(wires, start_point, reverse=False, optimizer_timeout=30,
+                   allow_reverse=True):
+    """ Find a short order to cut the wires in. An initial tour is built by
+    repeatedly moving to the nearest wire then improved using 2-opt and
+    Or-opt until the timeout.
+
+    Open wires can be entered from either end if `allow_reverse` is set and
+    closed wires can be entered at any of their vertices.
 
     Parameters
     ----------
     wires: List[TopoDS_Wire]
         Unordered set of wires
+    start_point: Point
+        Starting point
+    reverse: Bool
+        Whether the points of each wire are cut in reverse
+    optimizer_timeout: Float
+        Maximum time in seconds to spend improving the tour
+    allow_reverse: Bool
+        Allow changing the direction open wires are cut in
+
     Returns
     -------
     wires: List[TopoDS_Wires]
@@ -31,18 +342,58 @@ def optimize_graph(wires, optimizer_timeout=30):
     """
     if len(wires) < 2:
         return wires
+    t0 = time.time()
+    time_limit = t0 + optimizer_timeout
+
+    starts, ends = get_endpoints(wires)
+    if reverse:
+        # The toolpath cuts the points in reverse
+        starts, ends = ends, starts
+
+    # Closed wires can be entered at any vertex
+    tol = settings.tolerance
+    closed = np.linalg.norm(starts - ends, axis=1) <= tol
+    vertices = {}
+    for i in np.flatnonzero(closed):
+        v = get_vertices(wires[i])
+        vertices[int(i)] = v if len(v) else starts[i:i+1]
+
+    p = np.array(start_point[:])
+    tour = build_tour(p, starts, ends, vertices, allow_reverse)
+    entries = np.array([entry_exit(i, m, starts, ends, vertices)[0]
+                        for i, m in tour])
+    exits = np.array([entry_exit(i, m, starts, ends, vertices)[1]
+                      for i, m in tour])
+    initial = tour_length(p, entries, exits)
+    tour = improve_tour(p, tour, entries, exits, time_limit, allow_reverse)
+    entries = np.array([entry_exit(i, m, starts, ends, vertices)[0]
+                        for i, m in tour])
+    exits = np.array([entry_exit(i, m, starts, ends, vertices)[1]
+                      for i, m in tour])
+    log.debug(f"Optimized travel of {len(wires)} wires from "
+              f"{round(initial, 3)} to "
+              f"{round(tour_length(p, entries, exits), 3)} in "
+              f"{round(time.time()-t0, 3)}s")
 
-    graph = interpolate.build_edge_graph(wires)
-    standalone = []
-    #for vertex, edges in graph.items():
-    #    if len(edges)
+    result = []
+    for i, mode in tour:
+        w = wires[i]
+        if mode == REVERSED:
+            w = w.Reversed()
+        elif mode != FORWARD:
+            w = rotate_wire(w, mode)
+        result.append(w)
+    return result
 
-    return standalone
 
+def optimize_graph(wires, start_point=None, tolerance=None):
+    """ Try to reduce the number of head lifts by retracing common paths.
 
-def optimize_moves(wires, start_point, reverse=False, optimizer_timeout=30):
-    """  Use Dijkstra's algorithm to find the shortest path between
-    a set of wires. Ported from Inkcut
+    The wires are split at their branch points and each connected group is
+    walked depth first. When a dead end is reached the path is retraced back
+    to the last branch with edges left to cut instead of lifting the head.
+    Consecutive wires in the result connect so the head only has to lift
+    between groups.
 
     Parameters
     ----------
@@ -50,8 +401,9 @@ def optimize_moves(wires, start_point, reverse=False, optimizer_timeout=30):
         Unordered set of wires
     start_point: Point
         Starting point
-    reverse: Bool
-        Revers the point order
+    tolerance: Float
+        Distance at which points are considered connected
+
     Returns
     -------
     wires: List[TopoDS_Wires]
@@ -60,35 +412,65 @@ def optimize_moves(wires, start_point, reverse=False, optimizer_timeout=30):
     """
     if len(wires) < 2:
         return wires
-    now = time.time()
-    time_limit = now + optimizer_timeout
 
-    original = wires[:]
-    subpaths = [BRepAdaptor_CompCurve(w) for w in wires]
+    graph = interpolate.build_edge_graph(wires, tolerance)
+
+    chains = list(interpolate.split_chains(graph))
+
+    # Adjacency of vertices to chains
+    adjacent = {}
+    for c, (a, b, path) in enumerate(chains):
+        adjacent.setdefault(id(a), []).append(c)
+        if b is not a:
+            adjacent.setdefault(id(b), []).append(c)
+
+    def build(c, start):
+        a, b, path = chains[c]
+        w = Wire(edges=[e.shape for e in path]).render()
+        return orient_wire(w, np.array(start[:]), tolerance)
+
+    def other(c, v):
+        a, b, path = chains[c]
+        return b if v is a else a
+
     result = []
-    sp = subpaths[0]
-    p = start_point.proxy
-    while subpaths:
-        best = sys.maxsize
-        shortest = None
-        for sp in subpaths:
-            t = sp.LastParameter() if reverse else sp.FirstParameter()
-            start_point = sp.Value(t)
-            d = p.Distance(start_point)
-            if d < best:
-                best = d
-                shortest = sp
-
-        t = shortest.FirstParameter() if reverse else shortest.LastParameter()
-        p = shortest.Value(t)
-        result.append(shortest)
-        subpaths.remove(shortest)
-
-        # time.time() is slow so limit the calls
-        if time.time() > time_limit:
-            result.extend(subpaths)  # At least part of it is optimized
-            log.warning(
-                "Shortest path search aborted (time limit reached)")
-            break
+    done = set()
+    pos = np.array(start_point[:]) if start_point is not None else None
+    vertices = list(graph.keys())
+    coords = np.array([v[:] for v in vertices])
+    while len(done) < len(chains):
+        # Start at the nearest leaf with chains left, or any vertex
+        remaining = [i for i, v in enumerate(vertices)
+                     if any(c not in done for c in adjacent.get(id(v), ()))]
+        leaves = [i for i in remaining
+                  if len(adjacent.get(id(vertices[i]), ())) % 2]
+        candidates = np.array(leaves or remaining)
+        if pos is None:
+            i = candidates[0]
+        else:
+            d = np.linalg.norm(coords[candidates] - pos, axis=1)
+            i = candidates[np.argmin(d)]
+        v = vertices[i]
 
-    return [sp.Wire() for sp in result]
+        # Depth first walk retracing back to branches with chains left
+        stack = []
+        while True:
+            todo = [c for c in adjacent.get(id(v), ()) if c not in done]
+            if todo:
+                c = todo[0]
+                done.add(c)
+                result.append(build(c, v))
+                stack.append((c, v))
+                v = other(c, v)
+                continue
+            if len(done) == len(chains) or not stack:
+                break
+            # Only retrace if there is something left to cut in this group
+            if not any(c not in done for s, u in stack
+                       for c in adjacent.get(id(u), ())):
+                break
+            c, u = stack.pop()
+            result.append(build(c, v))
+            v = u
+        pos = np.array(v[:])
+    return result
@@ -13,6 +13,7 @@ import time
 import uuid
 import serial
 import asyncio
+from collections import deque
 from atom.api import (
     Atom, Instance, Subclass, Str, Int, Bool, ContainerList, Bytes, Enum,
     List, Float, observe
@@ -136,6 +137,21 @@ class DeviceConfig(Model):
     #: Send rate
     send_rate = Float(strict=False).tag(config=True)
 
+    #: Stream files using character counting. When disabled each line is
+    #: written once the previous line has been sent.
+    streaming = Bool(True).tag(config=True)
+
+    #: Size of the device's receive buffer in bytes
+    rx_buffer_size = Int(128).tag(config=True)
+
+    #: Abort the job if the device responds with an error
+    abort_on_error = Bool(True).tag(config=True)
+
+    #: Realtime commands sent to pause, resume, and abort a job
+    pause_command = Str('!').tag(config=True)
+    resume_command = Str('~').tag(config=True)
+    abort_command = Str('\x18').tag(config=True)
+
     #: Output scale
     scale_x = Float(1.0, strict=False).tag(config=True)
     scale_y = Float(1.0, strict=False).tag(config=True)
@@ -172,6 +188,83 @@ class DeviceConfig(Model):
     finalize_commands = Str().tag(config=True)
 
 
+class Job(Atom):
+    """ The state of a file being streamed to a device.
+
+    """
+    #: File being sent
+    filename = Str()
+
+    #: Job status
+    status = Enum('pending', 'running', 'paused', 'complete', 'aborted',
+                  'error')
+
+    #: Lines to send as (line number, data)
+    lines = List()
+
+    #: Number of lines sent and the number the device has completed
+    sent = Int()
+    completed = Int()
+
+    #: Percent of lines completed
+    progress = Float()
+
+    #: Lines completed per second
+    rate = Float()
+
+    #: Fraction of the device's receive buffer in use
+    buffer_fill = Float()
+
+    #: Errors as (line number, response)
+    errors = ContainerList()
+
+    #: Time the job started
+    started = Float()
+
+    #: Time and number of lines completed when the rate was last updated
+    _rate_time = Float()
+    _rate_count = Int()
+
+    #: Interval in seconds the rate is measured over
+    RATE_INTERVAL = 0.5
+
+    def load(self):
+        """ Read the lines of the file skipping empty lines and comments.
+
+        """
+        lines = []
+        with open(self.filename, 'rb') as f:
+            for i, line in enumerate(f, 1):
+                data = gcode.COMMENT_RE.split(line.decode(errors='replace'),
+                                              maxsplit=1)[0].strip()
+                if data:
+                    lines.append((i, f'{data}\n'.encode()))
+        self.lines = lines
+
+    def start(self):
+        self.status = 'running'
+        self.started = self._rate_time = time.time()
+
+    def line_sent(self, buffer_fill):
+        self.sent += 1
+        self.buffer_fill = buffer_fill
+
+    def line_completed(self, buffer_fill):
+        self.completed += 1
+        self.buffer_fill = buffer_fill
+        self.progress = 100 * self.completed / (len(self.lines) or 1)
+        now = time.time()
+        dt = now - self._rate_time
+        if dt >= self.RATE_INTERVAL:
+            self.rate = (self.completed - self._rate_count) / dt
+            self._rate_time = now
+            self._rate_count = self.completed
+
+    @property
+    def done(self):
+        return self.status in ('complete', 'aborted', 'error')
+
+
 class Device(Model, asyncio.Protocol):
     #: Name
     name = Str().tag(config=True)
@@ -195,6 +288,22 @@ class Device(Model, asyncio.Protocol):
     #: The connection
     connection = Instance(Connection).tag(config=True)
 
+    #: Job being streamed
+    job = Instance(Job)
+
+    #: Length and line number of each line sent which the device has not
+    #: responded to
+    _unacknowledged = Instance(deque, ())
+
+    #: Bytes in use in the device's receive buffer
+    rx_buffer_used = Int()
+
+    #: Incomplete line received from the device
+    _read_buffer = Bytes()
+
+    #: Futures of tasks waiting for the device state to change
+    _waiters = Instance(set, ())
+
     def _default_uuid(self):
         return str(uuid.uuid4().hex)
 
@@ -212,24 +321,87 @@ class Device(Model, asyncio.Protocol):
     def connection_made(self, transport):
         self.connected = True
         self.connection.transport = transport
+        self.notify()
 
     def connection_lost(self, exc):
         self.connected = False
         self.errors = f'{exc}'
+        self.notify()
 
     def data_received(self, data):
         self.last_read = data
+        lines = (self._read_buffer + data).split(b'\n')
+
+        # Limit the size in case the device never sends a newline
+        self._read_buffer = lines.pop()[-1024:]
+        for line in lines:
+            line = line.strip()
+            if line:
+                self.response_received(line)
+        self.notify()
+
+    def response_received(self, response):
+        """ Handle a line received from the device. Each `ok` or `error`
+        acknowledges the oldest line sent which frees up space in the
+        device's receive buffer.
+
+        Parameters
+        ----------
+        response: Bytes
+            The line received without the line ending
+
+        """
+        if response == b'ok':
+            error = None
+        elif response.startswith(b'error'):
+            error = response.decode(errors='replace')
+        else:
+            return
+        pending = self._unacknowledged
+        if not pending:
+            return
+        length, line = pending.popleft()
+        self.rx_buffer_used -= length
+        job = self.job
+        if job is not None:
+            job.line_completed(
+                self.rx_buffer_used / self.config.rx_buffer_size)
+            if error:
+                log.warning(f"Line {line} failed: {error}")
+                job.errors.append((line, error))
+                if self.config.abort_on_error and not job.done:
+                    job.status = 'error'
 
     def pause_writing(self):
         #print(self.connection.transport.get_write_buffer_size())
         pass
 
     def resume_writing(self):
-        #print(self.connection.transport.get_write_buffer_size())
-        pass
+        self.notify()
+
+    def write_flushed(self):
+        """ Called by the transport when all buffered data is written """
+        self.notify()
 
-    async def wait_until(self, fn, timeout=30, message="Timeout hit", rate=0.1):
-        """ Wait for the fn to return true or until the timeout hits
+    def notify(self):
+        """ Wake up any tasks waiting for the device state to change so
+        they can check if their condition is met.
+
+        """
+        waiters = self._waiters
+        if not waiters:
+            return
+        self._waiters = set()
+        for f in waiters:
+            if not f.done():
+                f.set_result(None)
+
+    async def wait_until(self, fn, timeout=30, message="Timeout hit",
+                         rate=None):
+        """ Wait for the fn to return true or until the timeout hits. The
+        fn is checked whenever the device is notified of a change such as
+        the connection being made or lost, a write completing, a response
+        being received, or the job state changing.
 
         Parameters
         ----------
@@ -240,15 +412,29 @@ class Device(Model, asyncio.Protocol):
             to block forever
         message: Str
             Message to set on the error if a timeout occurs
-        rate: Float
-            Time in seconds to wait before checking the fn again
+        rate: Float or None
+            If given also check the fn at this interval in seconds. Only
+            needed if the fn depends on something that does not notify
+            the device.
 
         """
-        start = time.time()
+        loop = asyncio.get_event_loop()
+        deadline = None if timeout is None else loop.time() + timeout
         while not fn():
-            await asyncio.sleep(rate)
-            if timeout is not None and (time.time() - start) > timeout:
-                raise TimeoutError(message)
+            wait = rate
+            if deadline is not None:
+                remaining = deadline - loop.time()
+                if remaining <= 0:
+                    raise TimeoutError(message)
+                wait = remaining if wait is None else min(wait, remaining)
+            f = loop.create_future()
+            self._waiters.add(f)
+            try:
+                await asyncio.wait_for(f, wait)
+            except asyncio.TimeoutError:
+                pass
+            finally:
+                self._waiters.discard(f)
 
     # -------------------------------------------------------------------------
     # Device API
@@ -300,6 +486,104 @@ class Device(Model, asyncio.Protocol):
             return
         await self.connection.disconnect()
 
+    async def stream(self, job):
+        """ Stream the lines of the job using character counting flow
+        control. Lines are sent as long as they fit in the device's receive
+        buffer and more are sent as the device acknowledges each line with
+        an `ok` or `error`.
+
+        Parameters
+        ----------
+        job: Job
+            The job to send. The lines must be loaded.
+
+        """
+        if not self.connected:
+            raise IOError("Not connected")
+        size = self.config.rx_buffer_size
+        pending = self._unacknowledged
+        pending.clear()
+        self.rx_buffer_used = 0
+        self.job = job
+        transport = self.connection.transport
+        job.start()
+
+        async def wait_until(fn):
+            await self.wait_until(lambda: fn() or not self.connected,
+                                  timeout=None)
+            if not self.connected:
+                raise IOError("Connection dropped")
+
+        try:
+            for line, data in job.lines:
+                n = len(data)
+                if n > size:
+                    log.warning(f"Line {line} is larger than the rx buffer")
+                await wait_until(lambda: job.done or (
+                    job.status == 'running' and (
+                        not pending or self.rx_buffer_used + n <= size)))
+                if job.done:
+                    break
+                pending.append((n, line))
+                self.rx_buffer_used += n
+                self.last_write = data
+                transport.write(data)
+                job.line_sent(self.rx_buffer_used / size)
+
+            # Wait for the device to complete the remaining lines
+            await wait_until(lambda: job.done or not pending)
+            if not job.done:
+                job.status = 'complete'
+        except Exception:
+            if not job.done:
+                job.status = 'error'
+            raise
+
+    def send_realtime_command(self, command):
+        """ Write a realtime command. These are handled by the device
+        immediately and do not use the receive buffer.
+
+        """
+        if command and self.connected:
+            self.connection.transport.write(command.encode())
+
+    def pause(self):
+        """ Stop sending lines of the job and send the pause command.
+
+        """
+        job = self.job
+        if job is None or job.status != 'running':
+            return
+        job.status = 'paused'
+        self.send_realtime_command(self.config.pause_command)
+        self.notify()
+
+    def resume(self):
+        """ Send the resume command and continue sending the job.
+
+        """
+        job = self.job
+        if job is None or job.status != 'paused':
+            return
+        self.send_realtime_command(self.config.resume_command)
+        job.status = 'running'
+        self.notify()
+
+    def abort(self):
+        """ Stop the job and send the abort command. The abort command
+        should reset the device which clears it's receive buffer.
+
+        """
+        job = self.job
+        if job is None or job.done:
+            return
+        job.status = 'aborted'
+        self.send_realtime_command(self.config.abort_command)
+        self._unacknowledged.clear()
+        self.rx_buffer_used = 0
+        job.buffer_fill = 0
+        self.notify()
+
     def convert(self, point):
         """ Convert a point based on this device's configuration
 
@@ -327,6 +611,34 @@ class Device(Model, asyncio.Protocol):
             x, y = y, x
         return (x, y, z)
 
+    def convert_array(self, points):
+        """ Convert an array of points based on this device's configuration
+
+        Parameters
+        ----------
+        points: numpy.ndarray
+            An (N, 3) array of the points to convert
+
+        Returns
+        -------
+        converted_points: List[Tuple]
+            List of converted values
+
+        """
+        config = self.config
+        precision = config.PRECISIONS.get(config.precision)
+        o = config.origin
+        px, py, pz = points[:, 0], points[:, 1], points[:, 2]
+        x = o.x - px if config.mirror_x else px - o.x
+        y = o.y - py if config.mirror_y else py - o.y
+        z = o.z - pz if config.mirror_z else pz - o.z
+        x = gcode.convert_array(x, config.scale_x, precision)
+        y = gcode.convert_array(y, config.scale_y, precision)
+        z = gcode.convert_array(z, config.scale_z, precision)
+        if config.swap_xy:
+            x, y = y, x
+        return list(zip(x.tolist(), y.tolist(), z.tolist()))
+
     async def rapid_move_to(self, point):
         """ Send a G0 to the point
 
@@ -415,7 +727,9 @@ class CncPlugin(Plugin):
             await device.rapid_move_to(point)
 
     async def send_file(self, filename):
-        """ Send a file to the device line by line
+        """ Send a file to the device. If streaming is enabled the
+        device's receive buffer is kept full using character counting
+        otherwise it is sent line by line.
 
         Parameters
         ----------
@@ -428,6 +742,12 @@ class CncPlugin(Plugin):
         device.busy = True
         rate = device.config.send_rate
         try:
+            if device.config.streaming:
+                job = Job(filename=filename)
+                job.load()
+                await device.connect()
+                await device.stream(job)
+                return
             with open(filename, 'rb') as f:
                 await device.connect()
                 for line in f:
@@ -439,3 +759,15 @@ class CncPlugin(Plugin):
 
         finally:
             device.busy = False
+
+    def pause(self):
+        if self.device:
+            self.device.pause()
+
+    def resume(self):
+        if self.device:
+            self.device.resume()
+
+    def abort(self):
+        if self.device:
+            self.device.abort()
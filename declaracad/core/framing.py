@@ -0,0 +1,173 @@
+"""
+Copyright (c) 2020, Jairus Martin.
+
+Distributed under the terms of the GPL v3 License.
+
+The full license is in the file LICENSE, distributed with this software.
+
+Length prefixed message framing used between the editor and the viewer
+processes. Each frame is:
+
+    MAGIC (4 bytes) | codec (1 byte) | length (4 bytes big endian) | payload
+
+Data outside of a frame is split into lines so newline delimited json
+messages and any other output written to the pipe (such as prints from a
+script) can still be handled.
+
+"""
+import struct
+import jsonpickle
+
+
+#: Marks the start of a frame
+MAGIC = b'\x00DCF'
+
+#: Header after the magic
+HEADER = struct.Struct('>cI')
+
+#: Largest payload that will be accepted
+MAX_FRAME_SIZE = 1 << 30
+
+
+def encode_json(message):
+    return jsonpickle.dumps(message).encode()
+
+
+def decode_json(data):
+    return jsonpickle.loads(data.decode())
+
+
+def encode_msgpack(message):
+    import msgpack
+    return msgpack.packb(jsonpickle.Pickler().flatten(message),
+                         use_bin_type=True)
+
+
+def decode_msgpack(data):
+    import msgpack
+    return jsonpickle.Unpickler().restore(msgpack.unpackb(data, raw=False))
+
+
+#: Supported codecs, the key is the name used when negotiating and the
+#: first value is the id used in the header
+CODECS = {
+    'json': (b'j', encode_json, decode_json),
+    'msgpack': (b'm', encode_msgpack, decode_msgpack),
+}
+
+#: Lookup by codec id
+DECODERS = {v[0]: v[2] for v in CODECS.values()}
+
+
+def available_codecs():
+    """ Get the codec names that can be used in this process in order of
+    preference.
+
+    Returns
+    -------
+    codecs: List[str]
+        The codec names.
+
+    """
+    codecs = ['json']
+    try:
+        import msgpack
+        codecs.insert(0, 'msgpack')
+    except ImportError:
+        pass
+    return codecs
+
+
+def encode_frame(message, codec='json'):
+    """ Encode the message in a frame
+
+    Parameters
+    ----------
+    message: Object
+        The message to encode
+    codec: String
+        Name of the codec to encode the payload with
+
+    Returns
+    -------
+    frame: Bytes
+        The framed message.
+
+    """
+    codec_id, encode, decode = CODECS[codec]
+    payload = encode(message)
+    return MAGIC + HEADER.pack(codec_id, len(payload)) + payload
+
+
+def encode_line(message):
+    """ Encode the message using the newline delimited protocol """
+    return encode_json(message) + b'\r\n'
+
+
+class FrameDecoder(object):
+    """ Buffers partial reads and splits received data into messages.
+
+    Calling `feed` returns a list of `(framed, message)` tuples. If the item
+    was received in a frame the message is the decoded payload otherwise it
+    is the line as a string without the line ending.
+
+    """
+    def __init__(self):
+        self.buffer = bytearray()
+
+    def feed(self, data):
+        """ Add data to the buffer and return any complete messages.
+
+        Parameters
+        ----------
+        data: Bytes
+            The data received
+
+        Returns
+        -------
+        messages: List[Tuple[Bool, Object]]
+            The messages received.
+
+        """
+        buf = self.buffer
+        buf.extend(data)
+        messages = []
+        header_size = len(MAGIC) + HEADER.size
+        while buf:
+            start = buf.find(MAGIC)
+            if start != 0:
+                # Handle any lines before the frame
+                end = len(buf) if start < 0 else start
+                i = buf.rfind(b'\n', 0, end)
+                if i < 0:
+                    if start < 0:
+                        # Wait for the rest of the line
+                        break
+                    # Text without a newline before a frame
+                    i = start - 1
+                for line in bytes(buf[:i+1]).split(b'\n'):
+                    line = line.rstrip(b'\r')
+                    if line:
+                        messages.append(
+                            (False, line.decode(errors='replace')))
+                del buf[:i+1]
+                continue
+
+            if len(buf) < header_size:
+                break
+            codec_id, length = HEADER.unpack_from(buf, len(MAGIC))
+            decode = DECODERS.get(codec_id)
+            if decode is None or length > MAX_FRAME_SIZE:
+                # Not a valid frame, drop the magic and treat it as text
+                del buf[:len(MAGIC)]
+                continue
+            if len(buf) < header_size + length:
+                break
+            payload = bytes(buf[header_size:header_size+length])
+            del buf[:header_size+length]
+            try:
+                messages.append((True, decode(payload)))
+            except Exception:
+                # Pass it on as text so it's handled like an invalid line
+                messages.append((False, payload.decode(errors='replace')))
+        return messages
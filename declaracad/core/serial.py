@@ -258,6 +258,8 @@ class SerialTransport(asyncio.Transport):
                 assert self._flushed()
                 self._remove_writer()
                 self._maybe_resume_protocol()  # May cause further writes
+                if self._flushed():
+                    self._notify_flushed()
                 # _write_ready may have been invoked by the event loop
                 # after the transport was closed, as part of the ongoing
                 # process of flushing buffered data. If the buffer
@@ -351,6 +353,22 @@ class SerialTransport(asyncio.Transport):
         """True if the write buffer is empty, otherwise False."""
         return self.get_write_buffer_size() == 0
 
+    def _notify_flushed(self):
+        """Let the protocol know the write buffer is empty if it defines
+        a write_flushed() method so it does not need to poll for it."""
+        write_flushed = getattr(self._protocol, 'write_flushed', None)
+        if write_flushed is None:
+            return
+        try:
+            write_flushed()
+        except Exception as exc:
+            self._loop.call_exception_handler({
+                'message': 'protocol.write_flushed() failed',
+                'exception': exc,
+                'transport': self,
+                'protocol': self._protocol,
+            })
+
     def _close(self, exc=None):
         """Close the transport gracefully.
 
@@ -408,16 +426,14 @@ class SerialTransport(asyncio.Transport):
             self._loop = None
 
 
-@asyncio.coroutine
-def create_serial_connection(loop, protocol_factory, *args, **kwargs):
+async def create_serial_connection(loop, protocol_factory, *args, **kwargs):
     ser = serial.serial_for_url(*args, **kwargs)
     protocol = protocol_factory()
     transport = SerialTransport(loop, protocol, ser)
     return (transport, protocol)
 
 
-@asyncio.coroutine
-def open_serial_connection(
+async def open_serial_connection(
         *, loop=None, limit=asyncio.streams._DEFAULT_LIMIT, **kwargs):
     """A wrapper for create_serial_connection() returning a (reader,
     writer) pair.
@@ -436,7 +452,7 @@ def open_serial_connection(
         loop = asyncio.get_event_loop()
     reader = asyncio.StreamReader(limit=limit, loop=loop)
     protocol = asyncio.StreamReaderProtocol(reader, loop=loop)
-    transport, _ = yield from create_serial_connection(
+    transport, _ = await create_serial_connection(
         loop=loop,
         protocol_factory=lambda: protocol,
         **kwargs)
@@ -0,0 +1,143 @@
+"""
+Copyright (c) 2020, Jairus Martin.
+
+Distributed under the terms of the GPL v3 License.
+
+The full license is in the file LICENSE, distributed with this software.
+
+Measures the time spent importing modules during startup. This module must
+only import from the standard library so it can be installed before
+anything else is imported.
+
+"""
+import sys
+import atexit
+import builtins
+from time import perf_counter
+from importlib.util import resolve_name
+
+
+#: Subsystems that import time is attributed to. The first matching
+#: module prefix is used.
+SUBSYSTEMS = (
+    ('declaracad.occ.impl', 'declaracad occ toolkit'),
+    ('declaracad.occ.qt', 'declaracad viewer'),
+    ('declaracad.occ', 'declaracad occ'),
+    ('declaracad', 'declaracad'),
+    ('OCCT', 'OCCT'),
+    ('enaml.qt', 'Qt'),
+    ('PyQt5', 'Qt'),
+    ('PySide2', 'Qt'),
+    ('qtpy', 'Qt'),
+    ('asyncqt', 'Qt'),
+    ('enaml', 'enaml'),
+    ('atom', 'atom'),
+    ('IPython', 'ipython'),
+    ('ipykernel', 'ipython'),
+    ('qtconsole', 'ipython'),
+)
+
+
+def get_subsystem(name):
+    for prefix, subsystem in SUBSYSTEMS:
+        if name == prefix or name.startswith(prefix + '.'):
+            return subsystem
+    return 'other'
+
+
+class ImportProfiler(object):
+    """ Wraps the builtin import to measure the time spent importing each
+    module excluding the time spent importing it's dependencies.
+
+    """
+
+    def __init__(self):
+        self.times = {}
+        self.stack = []
+        self.started = None
+        self.reported = False
+        self._import = None
+
+    def install(self):
+        """ Start measuring imports. The report is printed at exit if it has
+        not been printed already.
+
+        """
+        if self._import is not None:
+            return
+        self.started = perf_counter()
+        self._import = builtins.__import__
+        builtins.__import__ = self.profiled_import
+        atexit.register(self.report)
+
+    def uninstall(self):
+        if self._import is not None:
+            builtins.__import__ = self._import
+            self._import = None
+
+    def profiled_import(self, name, globals=None, locals=None, fromlist=(),
+                        level=0):
+        module = name
+        if level and globals:
+            try:
+                package = globals.get('__package__') or \
+                    globals.get('__name__', '').rpartition('.')[0]
+                module = resolve_name('.' * level + name, package)
+            except (ImportError, ValueError):
+                pass
+        if module in sys.modules:
+            return self._import(name, globals, locals, fromlist, level)
+
+        stack = self.stack
+        stack.append(0)
+        t0 = perf_counter()
+        try:
+            return self._import(name, globals, locals, fromlist, level)
+        finally:
+            elapsed = perf_counter() - t0
+            children = stack.pop()
+            if stack:
+                stack[-1] += elapsed
+            times = self.times
+            times[module] = times.get(module, 0) + elapsed - children
+
+    def report(self, file=None, limit=15):
+        """ Print the time spent importing each subsystem and the slowest
+        modules.
+
+        Parameters
+        ----------
+        file: File
+            File to write to. Defaults to stderr.
+        limit: Int
+            Number of modules to list
+
+        """
+        if self.reported or self.started is None:
+            return
+        self.reported = True
+        self.uninstall()
+        file = file or sys.stderr
+        elapsed = perf_counter() - self.started
+        total = sum(self.times.values())
+        subsystems = {}
+        for name, t in self.times.items():
+            key = get_subsystem(name)
+            subsystems[key] = subsystems.get(key, 0) + t
+
+        def fmt(t):
+            return "{:8.3f}s {:5.1f}%".format(t, 100 * t / (total or 1))
+
+        print("Startup took {:.3f}s, {:.3f}s spent importing".format(
+            elapsed, total), file=file)
+        for key, t in sorted(subsystems.items(), key=lambda it: -it[1]):
+            print("  {:<24} {}".format(key, fmt(t)), file=file)
+        print("Slowest imports:", file=file)
+        modules = sorted(self.times.items(), key=lambda it: -it[1])
+        for name, t in modules[:limit]:
+            print("  {:<40} {}".format(name, fmt(t)), file=file)
+        file.flush()
+
+
+#: Global profiler
+PROFILER = ImportProfiler()
@@ -13,6 +13,7 @@ import io
 import os
 import sys
 import asyncio
+import threading
 import logging
 import functools
 import traceback
@@ -20,12 +21,16 @@ import jsonpickle
 from contextlib import contextmanager
 from logging.handlers import RotatingFileHandler
 
-from atom.api import Atom, Value, Int, Bool, Bytes, ContainerList
+from atom.api import Atom, Value, Int, Bool, Bytes, Str, ContainerList
 
 from enaml.image import Image
 from enaml.icon import Icon, IconImage
 from enaml.application import timed_call
 
+from declaracad.core.framing import (
+    FrameDecoder, available_codecs, encode_frame, encode_line
+)
+
 
 # -----------------------------------------------------------------------------
 # Logger
@@ -132,6 +137,54 @@ def capture_output():
         sys.stdout = _stdout
 
 
+class ThreadOutput(object):
+    """ A stdout replacement that sends what is written from a thread which
+    is capturing output to that thread's buffer and everything else to the
+    original stream.
+
+    """
+    def __init__(self, stream):
+        self.stream = stream
+        self.local = threading.local()
+
+    def __getattr__(self, name):
+        return getattr(self.stream, name)
+
+    def write(self, text):
+        capture = getattr(self.local, 'capture', None)
+        if capture is not None:
+            return capture.write(text)
+        return self.stream.write(text)
+
+    def flush(self):
+        capture = getattr(self.local, 'capture', None)
+        if capture is None:
+            self.stream.flush()
+
+
+_output_lock = threading.Lock()
+
+
+@contextmanager
+def capture_thread_output():
+    """ Capture the output written from the current thread only. Unlike
+    capture_output, anything written from other threads while the capture
+    is active is not captured.
+
+    """
+    with _output_lock:
+        if not isinstance(sys.stdout, ThreadOutput):
+            sys.stdout = ThreadOutput(sys.stdout)
+        output = sys.stdout
+    local = output.local
+    previous = getattr(local, 'capture', None)
+    capture = local.capture = io.StringIO()
+    try:
+        yield capture
+    finally:
+        local.capture = previous
+
+
 def get_bootstrap_cmd():
     """ Get the command to the main executable depending on how it's run
 
@@ -151,14 +204,25 @@ class JSONRRCProtocol(Atom, asyncio.Protocol):
     #: Process transport
     transport = Value()
 
+    #: Codec used to frame messages. When empty messages are sent using the
+    #: newline delimited protocol.
+    codec = Str()
+
+    #: Buffers partial reads
+    decoder = Value(factory=FrameDecoder)
+
     def send_message(self, message):
         response = {'jsonrpc': '2.0'}
         response.update(message)
-        encoded_msg = jsonpickle.dumps(response).encode()+b'\r\n'
+        if self.codec:
+            encoded_msg = encode_frame(response, self.codec)
+        else:
+            encoded_msg = encode_line(response)
         self.transport.write(encoded_msg)
 
     def data_received(self, data):
-        """ Process stdin as json-rpc request
+        """ Process stdin as json-rpc request. Both framed messages and
+        newline delimited messages are accepted.
 
         Parameters
         ----------
@@ -166,9 +230,26 @@ class JSONRRCProtocol(Atom, asyncio.Protocol):
             The data received from stdin.
 
         """
-        # TODO: Handle partial reads
-        for line in data.split(b'\n'):
-            self.line_received(line.decode())
+        for framed, message in self.decoder.feed(data):
+            if framed:
+                self.request_received(message)
+            else:
+                self.line_received(message)
+
+    def handle_set_framing(self, codec):
+        """ Switch to sending framed messages using the given codec.
+
+        Parameters
+        ----------
+        codec: String
+            The codec name. An empty string switches back to the newline
+            delimited protocol.
+
+        """
+        if codec and codec not in available_codecs():
+            raise ValueError(f"Unsupported codec: {codec}")
+        self.codec = codec
+        return True
 
     def line_received(self, line):
         """ Called when a newline is received
@@ -186,7 +267,20 @@ class JSONRRCProtocol(Atom, asyncio.Protocol):
         except Exception as e:
             return self.send_message({'id': None, 'error': {
                 'code': -32700, 'message': f'Parse error: "{line}"'}})
+        self.request_received(request)
+
+    def request_received(self, request):
+        """ Called when a request is received and invokes the handler
+
+        Parameters
+        ----------
+        request: Dict
+            The decoded json-rpc request
 
+        """
+        if not isinstance(request, dict):
+            return self.send_message({"id": None, "error": {
+                'code': -32600, 'message': "Invalid request"}})
         request_id = request.get('id')
         method = request.get('method')
         if method is None:
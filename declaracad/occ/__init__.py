@@ -4,3 +4,18 @@ def install():
     """
     from .impl import occ_factories
     from .qt import factories
+
+
+def install_headless():
+    """ Create an application which builds shapes without importing Qt.
+    If an application already exists it is returned instead.
+
+    Returns
+    -------
+    app: enaml.application.Application
+        The application instance
+
+    """
+    from enaml.application import Application
+    from .headless import HeadlessApplication
+    return Application.instance() or HeadlessApplication()
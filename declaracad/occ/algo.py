@@ -36,6 +36,15 @@ class ProxyBooleanOperation(ProxyOperation):
     def set_unify(self, unify):
         raise NotImplementedError
 
+    def set_parallel(self, parallel):
+        raise NotImplementedError
+
+    def set_fuzzy_value(self, value):
+        raise NotImplementedError
+
+    def set_use_obb(self, use_obb):
+        raise NotImplementedError
+
     def _do_operation(self, shape1, shape2):
         raise NotImplementedError
 
@@ -254,6 +263,14 @@ class BooleanOperation(Operation):
         The first shape argument of the operation.
     shape2: Shape
         The second shape argument of the operation.
+    parallel: Bool
+        Run the operation in parallel mode. When enabled all the tools
+        are passed to a single operation instead of applying each one to
+        the result of the previous one.
+    fuzzy_value: Float
+        Additional tolerance used by the operation.
+    use_obb: Bool
+        Use oriented bounding boxes to filter the shapes which interfere.
 
     """
 
@@ -264,7 +281,17 @@ class BooleanOperation(Operation):
     #: Unify using ShapeUpgrade_UnifySameDomain
     unify = d_(Bool(False))
 
-    @observe('shape1', 'shape2', 'unify')
+    #: Pass all the tools to a single operation and run it in parallel
+    parallel = d_(Bool(False))
+
+    #: Fuzzy value (additional tolerance) of the operation
+    fuzzy_value = d_(Float(0, strict=False))
+
+    #: Use oriented bounding boxes
+    use_obb = d_(Bool(False))
+
+    @observe('shape1', 'shape2', 'unify', 'parallel', 'fuzzy_value',
+             'use_obb')
     def _update_proxy(self, change):
         super(BooleanOperation, self)._update_proxy(change)
 
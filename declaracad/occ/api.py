@@ -40,7 +40,9 @@ from .shape import (
 )
 from .impl.topology import Topology
 from .loaders import LoadedPart
-from .display import DisplayLine, DisplayArrow, DisplayText, DisplayPlane
+from .display import (
+    DisplayLine, DisplayArrow, DisplayText, DisplayPlane, DisplayToolpath
+)
 
 Loft = ThruSections
 Sweep = Pipe
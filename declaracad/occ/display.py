@@ -12,7 +12,8 @@ Created on Dec 27, 2020
 
 import math
 from atom.api import (
-    Bool, Coerced, Float, List, Str, Typed, ForwardTyped, observe
+    Bool, Coerced, Dict, Float, List, Str, Typed, ForwardTyped, Value,
+    observe
 )
 from enaml.colors import ColorMember, Color
 from enaml.core.declarative import d_
@@ -68,6 +69,29 @@ class ProxyDisplayText(ProxyDisplayItem):
         raise NotImplementedError
 
 
+class ProxyDisplayToolpath(ProxyDisplayItem):
+    #: A reference to the Shape declaration.
+    declaration = ForwardTyped(lambda: DisplayToolpath)
+
+    def set_points(self, points):
+        raise NotImplementedError
+
+    def set_moves(self, moves):
+        raise NotImplementedError
+
+    def set_lines(self, lines):
+        raise NotImplementedError
+
+    def set_colors(self, colors):
+        raise NotImplementedError
+
+    def set_line_width(self, width):
+        raise NotImplementedError
+
+    def set_lod(self, lod):
+        raise NotImplementedError
+
+
 class DisplayItem(ToolkitObject):
     """ Basic display item. This represents an item in the display
     that has no effect on the model.
@@ -167,3 +191,50 @@ class DisplayText(DisplayItem):
         super()._update_proxy(change)
 
 
+class DisplayToolpath(DisplayItem):
+    """ Display a toolpath as polylines colored by the type of each move.
+    All the moves of a type are drawn as a single primitive array so large
+    programs can be displayed. When zoomed out, vertices closer together
+    than the `lod` are merged.
+
+    """
+    #: Reference to the implementation control
+    proxy = Typed(ProxyDisplayToolpath)
+
+    #: Types of moves, the moves are an index into this
+    MOVES = ('rapid', 'normal', 'arc', 'plunge')
+
+    #: Vertices of the toolpath as an (N, 3) array
+    points = d_(Value())
+
+    #: Index in MOVES of the move ending at each vertex. A negative value
+    #: means the vertex is not connected to the previous one.
+    moves = d_(Value())
+
+    #: Source line number of the move ending at each vertex
+    lines = d_(Value())
+
+    #: File the toolpath was loaded from. Used to describe picked moves.
+    filename = d_(Str())
+
+    #: Color of each type of move
+    colors = d_(Dict())
+
+    def _default_colors(self):
+        return {
+            'rapid': 'green',
+            'normal': 'red',
+            'arc': 'orange',
+            'plunge': 'blue',
+        }
+
+    #: Line width in pixels
+    line_width = d_(Float(1, strict=False))
+
+    #: Distance in pixels below which vertices are merged. Set to zero to
+    #: always display every vertex.
+    lod = d_(Float(1, strict=False))
+
+    @observe('points', 'moves', 'lines', 'colors', 'line_width', 'lod')
+    def _update_proxy(self, change):
+        super()._update_proxy(change)
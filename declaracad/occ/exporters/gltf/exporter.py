@@ -0,0 +1,360 @@
+"""
+Copyright (c) 2020, Jairus Martin.
+
+Distributed under the terms of the GPL v3 License.
+
+The full license is in the file LICENSE, distributed with this software.
+
+Exports models to binary glTF 2.0. Shapes that share the same geometry,
+such as parts repeated with a Looper, are meshed and written once and
+referenced by each node that uses them.
+
+"""
+import json
+import struct
+import enaml
+import numpy as np
+from textwrap import dedent
+from atom.api import Bool, Float
+from declaracad.occ.plugin import ModelExporter, load_model
+from declaracad.occ.impl.occ_mesh import MESH_CACHE, face_mesh
+from declaracad.occ.impl.occ_shape import OccShape, OccPart
+from declaracad.occ.impl.utils import material_to_material_aspect
+from enaml.colors import parse_color
+
+from OCCT.TopAbs import TopAbs_FACE
+from OCCT.TopExp import TopExp_Explorer
+from OCCT.TopLoc import TopLoc_Location
+from OCCT.TopoDS import TopoDS
+
+
+#: glTF constants
+GLB_MAGIC = 0x46546C67
+CHUNK_JSON = 0x4E4F534A
+CHUNK_BIN = 0x004E4942
+ARRAY_BUFFER = 34962
+ELEMENT_ARRAY_BUFFER = 34963
+FLOAT = 5126
+UNSIGNED_INT = 5125
+TRIANGLES = 4
+
+#: Rotation from z up to the y up used by glTF as a quaternion
+Z_UP_TO_Y_UP = [-0.7071067811865476, 0, 0, 0.7071067811865476]
+
+
+def location_to_matrix(location):
+    """ Convert a location to a column major glTF matrix or None if it is
+    the identity.
+
+    """
+    if location.IsIdentity():
+        return None
+    trsf = location.Transformation()
+    matrix = []
+    for c in range(1, 5):
+        matrix.extend(trsf.Value(r, c) for r in range(1, 4))
+        matrix.append(1.0 if c == 4 else 0.0)
+    return matrix
+
+
+def shape_mesh(shape):
+    """ Merge the triangulation of each face of a meshed shape.
+
+    Returns
+    -------
+    result: Tuple[numpy.ndarray, numpy.ndarray] or None
+        The float32 points and uint32 indices or None if the shape has no
+        triangles.
+
+    """
+    points, indices = [], []
+    offset = 0
+    explorer = TopExp_Explorer(shape, TopAbs_FACE)
+    while explorer.More():
+        mesh = face_mesh(TopoDS.Face_(explorer.Current()))
+        explorer.Next()
+        if mesh is None:
+            continue
+        points.append(mesh[0])
+        indices.append(mesh[1] + offset)
+        offset += len(mesh[0])
+    if not points:
+        return None
+    return (np.concatenate(points).astype('<f4'),
+            np.concatenate(indices).astype('<u4').ravel())
+
+
+def color_factor(color):
+    return [color.red/255.0, color.green/255.0, color.blue/255.0,
+            color.alpha/255.0]
+
+
+class GltfExporter(ModelExporter):
+    extension = 'glb'
+    linear_deflection = Float(0.05, strict=False)
+    angular_deflection = Float(0.5, strict=False)
+    unit_scale = Float(0.001, strict=False).tag(help=dedent("""
+        Scale applied to the model. glTF uses meters so the default converts
+        from millimeters.
+        """).strip())
+    y_up = Bool(True).tag(help=dedent("""
+        Rotate the model so the z axis points up in viewers that expect the
+        y axis to be up as defined by glTF.
+        """).strip())
+
+    @classmethod
+    def get_options_view(cls):
+        with enaml.imports():
+            from .options import OptionsForm
+            return OptionsForm
+
+    def export(self, parts=None):
+        """ Export a DeclaraCAD model from an enaml file to a binary glTF
+        based on the given options.
+
+        Parameters
+        ----------
+        parts: List[occ.shape.Shape]
+            The parts to export. If not given they are loaded from the
+            filename.
+
+        """
+        # Load the enaml model file
+        if parts is None:
+            parts = load_model(self.filename)
+
+        builder = GltfBuilder(self.linear_deflection, self.angular_deflection)
+        roots = []
+        for part in parts:
+            # Render the part from the declaration
+            part.render()
+            node = builder.add_node(part.proxy)
+            if node is not None:
+                roots.append(node)
+
+        root = {'name': 'root', 'children': roots}
+        if self.unit_scale != 1:
+            root['scale'] = [self.unit_scale] * 3
+        if self.y_up:
+            root['rotation'] = Z_UP_TO_Y_UP
+        builder.write(self.path, root)
+
+
+class GltfBuilder(object):
+    """ Builds the glTF document and binary buffer from the proxies of
+    the model.
+
+    """
+    def __init__(self, linear_deflection, angular_deflection):
+        self.linear_deflection = linear_deflection
+        self.angular_deflection = angular_deflection
+        self.nodes = []
+        self.meshes = []
+        self.materials = []
+        self.accessors = []
+        self.buffer_views = []
+        self.arrays = []
+        self.offset = 0
+        self.geometry = {}
+        self.mesh_ids = {}
+        self.material_ids = {}
+
+    def add_node(self, proxy):
+        """ Add a node for the proxy and it's children.
+
+        Returns
+        -------
+        index: Int or None
+            The index of the node or None if nothing is displayed.
+
+        """
+        d = proxy.declaration
+        if not d.display or proxy.shape is None:
+            return None
+        node = {}
+        name = getattr(d, 'name', '')
+        if name:
+            node['name'] = name
+        if isinstance(proxy, OccPart):
+            matrix = location_to_matrix(proxy.location)
+            children = []
+            for c in proxy.children():
+                if isinstance(c, OccShape):
+                    index = self.add_node(c)
+                    if index is not None:
+                        children.append(index)
+            if not children:
+                return None
+            node['children'] = children
+        else:
+            shape = proxy.shape
+            matrix = location_to_matrix(shape.Location())
+            mesh = self.add_mesh(shape.Located(TopLoc_Location()), d)
+            if mesh is None:
+                return None
+            node['mesh'] = mesh
+        if matrix is not None:
+            node['matrix'] = matrix
+        self.nodes.append(node)
+        return len(self.nodes) - 1
+
+    def add_mesh(self, shape, declaration):
+        """ Add a mesh for the shape using the material of the declaration.
+        Shapes that are partners (share the same TShape) with the same
+        orientation reuse the same geometry.
+
+        Returns
+        -------
+        index: Int or None
+            The index of the mesh or None if the shape has no triangles.
+
+        """
+        key = shape.HashCode(2**31-1)
+        geometry = None
+        for other, accessors in self.geometry.get(key, []):
+            if other.IsPartner(shape) and \
+                    other.Orientation() == shape.Orientation():
+                geometry = accessors
+                break
+        if geometry is None:
+            MESH_CACHE.mesh(shape, self.linear_deflection,
+                            self.angular_deflection)
+            mesh = shape_mesh(shape)
+            if mesh is None:
+                geometry = ()
+            else:
+                points, indices = mesh
+                geometry = (
+                    self.add_accessor(points, ARRAY_BUFFER, FLOAT, 'VEC3',
+                                      points.min(axis=0).tolist(),
+                                      points.max(axis=0).tolist()),
+                    self.add_accessor(indices, ELEMENT_ARRAY_BUFFER,
+                                      UNSIGNED_INT, 'SCALAR'),
+                )
+            self.geometry.setdefault(key, []).append((shape, geometry))
+        if not geometry:
+            return None
+
+        material = self.add_material(declaration)
+        mesh_key = (geometry, material)
+        index = self.mesh_ids.get(mesh_key)
+        if index is None:
+            self.meshes.append({'primitives': [{
+                'attributes': {'POSITION': geometry[0]},
+                'indices': geometry[1],
+                'material': material,
+                'mode': TRIANGLES,
+            }]})
+            index = self.mesh_ids[mesh_key] = len(self.meshes) - 1
+        return index
+
+    def add_accessor(self, array, target, component_type, type,
+                     min=None, max=None):
+        """ Add the array to the binary buffer and create an accessor for it.
+
+        """
+        view = {
+            'buffer': 0,
+            'byteOffset': self.offset,
+            'byteLength': array.nbytes,
+            'target': target,
+        }
+        self.arrays.append(array)
+        self.offset += array.nbytes
+        # Keep views aligned to 4 bytes
+        self.offset += -self.offset % 4
+        self.buffer_views.append(view)
+        accessor = {
+            'bufferView': len(self.buffer_views) - 1,
+            'componentType': component_type,
+            'count': len(array),
+            'type': type,
+        }
+        if min is not None:
+            accessor['min'] = min
+            accessor['max'] = max
+        self.accessors.append(accessor)
+        return len(self.accessors) - 1
+
+    def add_material(self, declaration):
+        """ Create a pbr material from the color, transparency, and material
+        of the declaration.
+
+        """
+        d = declaration
+        material = d.material
+        if d.color:
+            color = color_factor(d.color)
+        elif material.color:
+            color = color_factor(material.color)
+        elif material.name:
+            c = material_to_material_aspect(material).Color()
+            color = [c.Red(), c.Green(), c.Blue(), 1.0]
+        else:
+            color = color_factor(parse_color('steelblue'))
+        color[3] *= 1 - max(d.transparency, material.transparency)
+
+        pbr = {
+            'baseColorFactor': color,
+            'metallicFactor': 0.0,
+            'roughnessFactor': 1 - material.shininess,
+        }
+        m = {'pbrMetallicRoughness': pbr, 'doubleSided': True}
+        if material.name:
+            m['name'] = material.name
+        if material.emissive_color:
+            m['emissiveFactor'] = color_factor(material.emissive_color)[:3]
+        if color[3] < 1:
+            m['alphaMode'] = 'BLEND'
+
+        key = json.dumps(m, sort_keys=True)
+        index = self.material_ids.get(key)
+        if index is None:
+            self.materials.append(m)
+            index = self.material_ids[key] = len(self.materials) - 1
+        return index
+
+    def write(self, path, root):
+        """ Write the glb file. The arrays are written directly from their
+        memory without building the binary chunk first.
+
+        Parameters
+        ----------
+        path: String
+            The file to write
+        root: Dict
+            The node added to the scene
+
+        """
+        self.nodes.append(root)
+        gltf = {
+            'asset': {'version': '2.0', 'generator': 'DeclaraCAD'},
+            'scene': 0,
+            'scenes': [{'nodes': [len(self.nodes)-1]}],
+            'nodes': self.nodes,
+        }
+        # Arrays must not be empty
+        for name, items in (('meshes', self.meshes),
+                            ('materials', self.materials),
+                            ('accessors', self.accessors),
+                            ('bufferViews', self.buffer_views)):
+            if items:
+                gltf[name] = items
+        size = self.offset
+        if size:
+            gltf['buffers'] = [{'byteLength': size}]
+
+        content = json.dumps(gltf, separators=(',', ':')).encode()
+        content += b' ' * (-len(content) % 4)
+        length = 12 + 8 + len(content)
+        if size:
+            length += 8 + size
+        with open(path, 'wb') as f:
+            f.write(struct.pack('<III', GLB_MAGIC, 2, length))
+            f.write(struct.pack('<II', len(content), CHUNK_JSON))
+            f.write(content)
+            if size:
+                f.write(struct.pack('<II', size, CHUNK_BIN))
+                for array in self.arrays:
+                    f.write(memoryview(array))
+                    f.write(b'\0' * (-array.nbytes % 4))
@@ -57,13 +57,15 @@ class StepExporter(ModelExporter):
             from .options import OptionsForm
             return OptionsForm
 
-    def export(self):
+    def export(self, parts=None):
         """ Export a DeclaraCAD model from an enaml file to an STL based on the
         given options.
 
         Parameters
         ----------
-        options: declaracad.occ.plugin.ExportOptions
+        parts: List[occ.shape.Shape]
+            The parts to export. If not given they are loaded from the
+            filename.
 
         """
         # Set all params
@@ -81,7 +83,8 @@ class StepExporter(ModelExporter):
         SetIVal("write.step.vertex.mode", VERTEX_MODES[self.vertex_mode])
 
         # Load the enaml model file
-        parts = load_model(self.filename)
+        if parts is None:
+            parts = load_model(self.filename)
 
         for part in parts:
             # Render the part from the declaration
@@ -10,15 +10,95 @@ Created on Oct 10, 2018
 @author: jrm
 """
 import os
+import re
 import time
 import enaml
+import numpy as np
 from atom.api import Constant, Enum, Float, Str, Bool
 from declaracad.occ.plugin import ModelExporter, load_model
+from declaracad.occ.impl.occ_mesh import MESH_CACHE, face_mesh
 
 from OCCT.BRep import BRep_Builder
-from OCCT.BRepMesh import BRepMesh_IncrementalMesh
 from OCCT.StlAPI import StlAPI_Writer
-from OCCT.TopoDS import TopoDS_Compound
+from OCCT.TopAbs import TopAbs_FACE, TopAbs_SOLID
+from OCCT.TopExp import TopExp_Explorer
+from OCCT.TopoDS import TopoDS, TopoDS_Compound
+
+
+#: Record of a triangle in a binary stl
+FACET = np.dtype([
+    ('normal', '<f4', (3,)),
+    ('vertices', '<f4', (3, 3)),
+    ('attr', '<u2'),
+])
+
+
+def face_triangles(face):
+    """ Get the triangles of a meshed face
+
+    Parameters
+    ----------
+    face: TopoDS_Face
+        The face to read the triangulation from
+
+    Returns
+    -------
+    triangles: numpy.ndarray or None
+        An array of shape (n, 3, 3) with the vertices of each triangle in
+        counter clockwise order.
+
+    """
+    mesh = face_mesh(face)
+    if mesh is None:
+        return None
+    points, indices = mesh
+    return points[indices]
+
+
+def write_binary_stl(shape, path, name=''):
+    """ Write the triangulation of each face of a meshed shape to a binary
+    stl. Triangles are written one face at a time and the count is updated
+    in the header once all faces are written.
+
+    Parameters
+    ----------
+    shape: TopoDS_Shape
+        The meshed shape to write
+    path: String
+        The file to write
+    name: String
+        Text added to the header
+
+    Returns
+    -------
+    count: Int
+        The number of triangles written
+
+    """
+    count = 0
+    header = "DeclaraCAD {}".format(name).encode()[:80].ljust(80, b' ')
+    with open(path, 'wb', buffering=1 << 20) as f:
+        f.write(header)
+        f.write(np.uint32(0).tobytes())
+        explorer = TopExp_Explorer(shape, TopAbs_FACE)
+        while explorer.More():
+            face = TopoDS.Face_(explorer.Current())
+            explorer.Next()
+            triangles = face_triangles(face)
+            if triangles is None:
+                continue
+            normals = np.cross(triangles[:, 1] - triangles[:, 0],
+                               triangles[:, 2] - triangles[:, 0])
+            lengths = np.linalg.norm(normals, axis=1)
+            lengths[lengths == 0] = 1
+            facets = np.zeros(len(triangles), dtype=FACET)
+            facets['normal'] = normals / lengths[:, None]
+            facets['vertices'] = triangles
+            f.write(facets.tobytes())
+            count += len(facets)
+        f.seek(80)
+        f.write(np.uint32(count).tobytes())
+    return count
 
 
 class StlExporter(ModelExporter):
@@ -26,7 +106,11 @@ class StlExporter(ModelExporter):
     linear_deflection = Float(0.05, strict=False)
     angular_deflection = Float(0.5, strict=False)
     relative = Bool()
-    binary = Bool()
+    binary = Bool(True)
+
+    #: Write one file for each part or solid named after the exported file
+    #: and the name of the part or index of the solid.
+    split = Enum('none', 'part', 'solid')
 
     @classmethod
     def get_options_view(cls):
@@ -34,13 +118,15 @@ class StlExporter(ModelExporter):
             from .options import OptionsForm
             return OptionsForm
 
-    def export(self):
+    def export(self, parts=None):
         """ Export a DeclaraCAD model from an enaml file to an STL based on the
         given options.
 
         Parameters
         ----------
-        options: declaracad.occ.plugin.ExportOptions
+        parts: List[occ.shape.Shape]
+            The parts to export. If not given they are loaded from the
+            filename.
 
         """
 
@@ -50,33 +136,48 @@ class StlExporter(ModelExporter):
         builder.MakeCompound(compound)
 
         # Load the enaml model file
-        parts = load_model(self.filename)
+        if parts is None:
+            parts = load_model(self.filename)
 
-        for part in parts:
+        shapes = []
+        for i, part in enumerate(parts):
             # Render the part from the declaration
             shape = part.render()
-
-            # Must mesh the shape firsts
             if hasattr(shape, 'Shape'):
-                builder.Add(compound, shape.Shape())
-            else:
-                builder.Add(compound, shape)
+                shape = shape.Shape()
+            builder.Add(compound, shape)
+            shapes.append((getattr(part, 'name', '') or str(i), shape))
 
         #: Build the mesh
-        exporter = StlAPI_Writer()
-        # TODO: pyOCCT needs to support updating the reference
-        # exporter.SetASCIIMode(not self.binary)
-        mesh = BRepMesh_IncrementalMesh(
+        MESH_CACHE.mesh(
             compound,
             self.linear_deflection,
-            self.relative,
-            self.angular_deflection
+            self.angular_deflection,
+            self.relative
         )
-        mesh.Perform()
-        if not mesh.IsDone():
-            raise RuntimeError("Failed to create the mesh")
 
-        exporter.Write(compound, self.path)
+        if self.split == 'none':
+            files = [(self.path, compound)]
+        else:
+            if self.split == 'solid':
+                solids = []
+                explorer = TopExp_Explorer(compound, TopAbs_SOLID)
+                while explorer.More():
+                    solids.append((str(len(solids)), explorer.Current()))
+                    explorer.Next()
+                shapes = solids
+            base, ext = os.path.splitext(self.path)
+            files = []
+            for name, shape in shapes:
+                name = re.sub(r'[^\w\-.]+', '_', name)
+                files.append(("{}-{}{}".format(base, name, ext), shape))
+
+        for path, shape in files:
+            if self.binary:
+                write_binary_stl(shape, path, os.path.basename(path))
+            else:
+                exporter = StlAPI_Writer()
+                exporter.Write(shape, path)
 
-        if not os.path.exists(self.path):
-            raise RuntimeError("Failed to write shape")
+            if not os.path.exists(path):
+                raise RuntimeError("Failed to write shape")
@@ -37,13 +37,15 @@ class VrmlExporter(ModelExporter):
             from .options import OptionsForm
             return OptionsForm
 
-    def export(self):
+    def export(self, parts=None):
         """ Export a DeclaraCAD model from an enaml file to VRML based on the
         given options.
 
         Parameters
         ----------
-        options: declaracad.occ.plugin.ExportOptions
+        parts: List[occ.shape.Shape]
+            The parts to export. If not given they are loaded from the
+            filename.
 
         """
         # Set all params
@@ -58,7 +60,8 @@ class VrmlExporter(ModelExporter):
         output_path = self.path
 
         # Load the enaml model file
-        parts = load_model(self.filename)
+        if parts is None:
+            parts = load_model(self.filename)
 
         # Remove old file
         if os.path.exists(output_path):
@@ -10,7 +10,7 @@ Created on Dec 26, 2020
 @author: jrm
 """
 import math
-from atom.api import Atom, Float, Typed, Property
+from atom.api import Atom, Float, Int, Typed, Property
 from contextlib import contextmanager
 
 from OCCT.gp import gp, gp_Pnt, gp_Dir, gp_Vec
@@ -19,11 +19,15 @@ from OCCT.TopoDS import TopoDS_Shape
 
 
 class Settings(Atom):
-    """ Used to manage tolerance settings
+    """ Used to manage tolerance and evaluation settings
 
     """
     tolerance = Float(1e-6)
 
+    #: Number of worker threads used to build independent shapes when a
+    #: model is loaded. If less than two shapes are built sequentially.
+    workers = Int(0)
+
 
 settings = Settings()
 
@@ -0,0 +1,99 @@
+"""
+Copyright (c) 2020, Jairus Martin.
+
+Distributed under the terms of the GPL v3 License.
+
+The full license is in the file LICENSE, distributed with this software.
+
+"""
+import time
+import heapq
+import itertools
+import threading
+from atom.api import Bool, Typed, Value
+from enaml.application import Application, ProxyResolver
+
+from declaracad.core.utils import log
+from .impl.occ_factories import OCC_FACTORIES
+
+
+class HeadlessApplication(Application):
+    """ An application which builds shapes using the occ toolkit without a
+    gui. This does not import Qt so it can be used for pure geometry
+    workloads such as exporting models in a worker process or container.
+
+    Deferred and timed calls are run when `process_events` is called or
+    while the application is started.
+
+    """
+    #: Pending calls as (due time, order, callback, args, kwargs)
+    _calls = Typed(list, ())
+
+    #: Used to keep the call order stable
+    _call_counter = Value(factory=itertools.count)
+
+    #: Lock for access to the pending calls
+    _call_lock = Value(factory=threading.Lock)
+
+    #: Thread which created the application
+    _thread_id = Value(factory=threading.get_ident)
+
+    #: Whether the application is running
+    _running = Bool()
+
+    def __init__(self):
+        super().__init__()
+        self.resolver = ProxyResolver(factories=OCC_FACTORIES)
+
+    # -------------------------------------------------------------------------
+    # Application API
+    # -------------------------------------------------------------------------
+    def start(self):
+        """ Run pending calls until stopped or there are none left.
+
+        """
+        self._running = True
+        while self._running:
+            with self._call_lock:
+                if not self._calls:
+                    break
+                delay = self._calls[0][0] - time.time()
+            if delay > 0:
+                time.sleep(delay)
+            self.process_events()
+        self._running = False
+
+    def stop(self):
+        self._running = False
+
+    def deferred_call(self, callback, *args, **kwargs):
+        self.timed_call(0, callback, *args, **kwargs)
+
+    def timed_call(self, ms, callback, *args, **kwargs):
+        item = (time.time() + ms / 1000.0, next(self._call_counter),
+                callback, args, kwargs)
+        with self._call_lock:
+            heapq.heappush(self._calls, item)
+
+    def is_main_thread(self):
+        return threading.get_ident() == self._thread_id
+
+    def create_mime_data(self):
+        raise NotImplementedError("Mime data requires a gui toolkit")
+
+    def process_events(self):
+        """ Run all the calls that are due. Calls added while processing
+        are run on the next call.
+
+        """
+        now = time.time()
+        calls = self._calls
+        while True:
+            with self._call_lock:
+                if not calls or calls[0][0] > now:
+                    return
+                t, i, callback, args, kwargs = heapq.heappop(calls)
+            try:
+                callback(*args, **kwargs)
+            except Exception as e:
+                log.exception(e)
@@ -9,13 +9,12 @@ Created on Sep 27, 2016
 
 @author: jrm
 """
-from atom.api import Int, Dict, Instance, Subclass, set_default
+from atom.api import Bool, Int, Dict, Instance, Subclass, set_default
 from enaml.application import timed_call
 
 from OCCT.BOPAlgo import (
     BOPAlgo_Splitter, BOPAlgo_Section, BOPAlgo_MakeConnected
 )
-from OCCT.BRep import BRep_Builder
 from OCCT.BRepAlgoAPI import (
     BRepAlgoAPI_BooleanOperation, BRepAlgoAPI_Fuse, BRepAlgoAPI_Common,
     BRepAlgoAPI_Cut
@@ -36,7 +35,6 @@ from OCCT.BRepOffset import (
     BRepOffset_Skin, BRepOffset_Pipe,
     BRepOffset_RectoVerso
 )
-from OCCT.BRepLib import BRepLib_FuseEdges
 from OCCT.ChFi3d import (
     ChFi3d_Rational, ChFi3d_QuasiAngular, ChFi3d_Polynomial
 )
@@ -53,7 +51,6 @@ from OCCT.GeomFill import (
 from OCCT.gp import (
     gp_Trsf, gp_Vec, gp_Pnt, gp_Ax1, gp_Ax2, gp_Ax3, gp_Dir, gp_Pnt2d
 )
-from OCCT.ShapeAnalysis import ShapeAnalysis_FreeBounds
 from OCCT.ShapeUpgrade import ShapeUpgrade_UnifySameDomain
 from OCCT.TColgp import TColgp_Array1OfPnt2d
 from OCCT.TopTools import TopTools_ListOfShape, TopTools_HSequenceOfShape
@@ -70,6 +67,7 @@ from declaracad.occ.algo import (
     ProxyPipe, ProxyThruSections, ProxySplit, ProxyIntersection, ProxySew,
     ProxyGlue, ProxyTransform, Translate, Rotate, Scale, Mirror, Shape
 )
+from declaracad.occ.shape import in_parallel_build
 
 from .occ_shape import (
     OccShape, OccDependentShape, Topology, coerce_axis, coerce_shape
@@ -81,11 +79,13 @@ class OccOperation(OccDependentShape, ProxyOperation):
     perform the operation once all changes have settled because
     in general these operations are expensive.
     """
+    cacheable = set_default(True)
+
     def set_direction(self, direction):
-        self.update_shape()
+        self.request_update()
 
     def set_axis(self, axis):
-        self.update_shape()
+        self.request_update()
 
 
 class OccBooleanOperation(OccOperation, ProxyBooleanOperation):
@@ -94,20 +94,25 @@ class OccBooleanOperation(OccOperation, ProxyBooleanOperation):
     """
     op = Subclass(BRepAlgoAPI_BooleanOperation)
 
+    #: Whether the result is the same when all the tools are passed to a
+    #: single operation instead of applying each one at a time.
+    group_tools = Bool(True)
+
     def update_shape(self, change=None):
-        op = self.op()
         d = self.declaration
         if d.shape1 and d.shape2:
-            shape = self.op(coerce_shape(d.shape1),
-                            coerce_shape(d.shape2)).Shape()
+            shapes = [coerce_shape(d.shape1), coerce_shape(d.shape2)]
         else:
-            shape = None
+            shapes = []
+        shapes.extend(c.shape for c in self.children())
 
-        for c in self.children():
-            if shape is not None:
-                shape = self.op(shape, c.shape).Shape()
+        shape = shapes[0] if shapes else None
+        if len(shapes) > 1:
+            if d.parallel and self.group_tools:
+                shape = self.do_operation(shapes[:1], shapes[1:])
             else:
-                shape = c.shape
+                for tool in shapes[1:]:
+                    shape = self.do_operation([shape], [tool])
 
         if d.unify:
             tool = ShapeUpgrade_UnifySameDomain(shape)
@@ -116,6 +121,67 @@ class OccBooleanOperation(OccOperation, ProxyBooleanOperation):
 
         self.shape = Topology.cast_shape(shape)
 
+    def do_operation(self, arguments, tools):
+        """ Perform the operation on the given arguments and tools.
+
+        Parameters
+        ----------
+        arguments: List[TopoDS_Shape]
+            The object shapes of the operation.
+        tools: List[TopoDS_Shape]
+            The tool shapes of the operation.
+
+        Returns
+        -------
+        shape: TopoDS_Shape
+            The result of the operation.
+
+        """
+        op = self.op()
+        args = TopTools_ListOfShape()
+        for s in arguments:
+            args.Append(s)
+        op.SetArguments(args)
+        args = TopTools_ListOfShape()
+        for s in tools:
+            args.Append(s)
+        op.SetTools(args)
+        self.set_options(op)
+        op.Build()
+        if op.HasErrors():
+            raise ValueError("Boolean operation failed %s" % self.declaration)
+        return op.Shape()
+
+    def set_options(self, algo):
+        """ Apply the options from the declaration to the algorithm """
+        d = self.declaration
+        algo.SetRunParallel(d.parallel)
+        algo.SetUseOBB(d.use_obb)
+        if d.fuzzy_value:
+            algo.SetFuzzyValue(d.fuzzy_value)
+        if in_parallel_build():
+            # The inputs may be shared with other operations being built at
+            # the same time (ex from the shape cache) so leave them unchanged
+            algo.SetNonDestructive(True)
+
+    def set_shape1(self, shape):
+        self.request_update()
+
+    def set_shape2(self, shape):
+        self.request_update()
+
+    def set_unify(self, unify):
+        self.request_update()
+
+    def set_parallel(self, parallel):
+        self.request_update()
+
+    def set_fuzzy_value(self, value):
+        self.request_update()
+
+    def set_use_obb(self, use_obb):
+        self.request_update()
+
 
 class OccCommon(OccBooleanOperation, ProxyCommon):
     """ Common of all the child shapes together. """
@@ -123,6 +189,9 @@ class OccCommon(OccBooleanOperation, ProxyCommon):
                             'class_b_rep_algo_a_p_i___common.html')
     op = set_default(BRepAlgoAPI_Common)
 
+    #: The common of a group of tools is their union
+    group_tools = set_default(False)
+
 
 class OccCut(OccBooleanOperation, ProxyCut):
     """ Cut all the child shapes from the first shape. """
@@ -153,6 +222,7 @@ class OccIntersection(OccBooleanOperation, ProxyIntersection):
             section.AddArgument(coerce_shape(d.shape2))
         for c in self.children():
             section.AddArgument(c.shape)
+        self.set_options(section)
         section.Perform()
         if section.HasErrors():
             raise ValueError("Could not intersect shape %s" % d)
@@ -183,6 +253,7 @@ class OccSplit(OccBooleanOperation, ProxySplit):
                 shape = c.shape
                 splitter.AddArgument(shape)
         splitter.SetTools(tools)
+        self.set_options(splitter)
         splitter.Perform()
         if splitter.HasErrors():
             raise ValueError("Could not split shape %s" % d)
@@ -235,13 +306,13 @@ class OccFillet(OccOperation, ProxyFillet):
         self.shape = fillet.Shape()
 
     def set_shape_type(self, shape_type):
-        self.update_shape()
+        self.request_update()
 
     def set_radius(self, r):
-        self.update_shape()
+        self.request_update()
 
     def set_operations(self, operations):
-        self.update_shape()
+        self.request_update()
 
 
 class OccChamfer(OccOperation, ProxyChamfer):
@@ -289,13 +360,13 @@ class OccChamfer(OccOperation, ProxyChamfer):
         self.shape = chamfer.Shape()
 
     def set_distance(self, d):
-        self.update_shape()
+        self.request_update()
 
     def set_distance2(self, d):
-        self.update_shape()
+        self.request_update()
 
     def set_operations(self, operations):
-        self.update_shape()
+        self.request_update()
 
 
 class OccOffset(OccOperation, ProxyOffset):
@@ -339,19 +410,19 @@ class OccOffset(OccOperation, ProxyOffset):
         self.shape = offset_shape.Shape()
 
     def set_shape(self, shape):
-        self.update_shape()
+        self.request_update()
 
     def set_offset(self, offset):
-        self.update_shape()
+        self.request_update()
 
     def set_offset_mode(self, mode):
-        self.update_shape()
+        self.request_update()
 
     def set_join_type(self, mode):
-        self.update_shape()
+        self.request_update()
 
     def set_intersection(self, enabled):
-        self.update_shape()
+        self.request_update()
 
 
 class OccOffsetShape(OccOffset, ProxyOffsetShape):
@@ -416,7 +487,7 @@ class OccThickSolid(OccOffset, ProxyThickSolid):
         self.shape = thick_solid.Shape()
 
     def set_faces(self, faces):
-        self.update_shape()
+        self.request_update()
 
 
 class OccPipe(OccOperation, ProxyPipe):
@@ -467,13 +538,13 @@ class OccPipe(OccOperation, ProxyPipe):
         self.shape = pipe.Shape()
 
     def set_spline(self, spline):
-        self.update_shape()
+        self.request_update()
 
     def set_profile(self, profile):
-        self.update_shape()
+        self.request_update()
 
     def set_fill_mode(self, mode):
-        self.update_shape()
+        self.request_update()
 
 
 class OccThruSections(OccOperation, ProxyThruSections):
@@ -500,13 +571,13 @@ class OccThruSections(OccOperation, ProxyThruSections):
         self.shape = loft.Shape()
 
     def set_solid(self, solid):
-        self.update_shape()
+        self.request_update()
 
     def set_ruled(self, ruled):
-        self.update_shape()
+        self.request_update()
 
     def set_precision(self, pres3d):
-        self.update_shape()
+        self.request_update()
 
 
 class OccTransform(OccOperation, ProxyTransform):
@@ -572,21 +643,21 @@ class OccTransform(OccOperation, ProxyTransform):
 
     def set_shape(self, shape):
         if self._old_shape:
-            self._old_shape.unobserve('shape', self.update_shape)
+            self._old_shape.unobserve('shape', self.request_update)
         self._old_shape = shape.proxy
-        self._old_shape.observe('shape', self.update_shape)
+        self._old_shape.observe('shape', self.request_update)
 
     def set_translate(self, translation):
-        self.update_shape()
+        self.request_update()
 
     def set_rotate(self, rotation):
-        self.update_shape()
+        self.request_update()
 
     def set_scale(self, scale):
-        self.update_shape()
+        self.request_update()
 
     def set_mirror(self, axis):
-        self.update_shape()
+        self.request_update()
 
 
 class OccSew(OccOperation, ProxySew):
@@ -0,0 +1,325 @@
+"""
+Copyright (c) 2020, Jairus Martin.
+
+Distributed under the terms of the GPL v3 License.
+
+The full license is in the file LICENSE, distributed with this software.
+
+"""
+import os
+import hashlib
+import tempfile
+import threading
+from collections import OrderedDict
+from atom.api import Atom, Bool, Int, Str, Typed, Value, Event, Property
+from enaml.core.enamldef_meta import EnamlDefMeta
+
+from OCCT import __version__ as OCCT_VERSION
+from OCCT.BRep import BRep_Builder
+from OCCT.BRepTools import BRepTools
+from OCCT.TopoDS import TopoDS_Shape
+
+from declaracad.core.utils import log
+from ..shape import Shape, Point
+from .topology import Topology
+
+
+#: Bump this whenever the key generation or stored format changes so old
+#: entries are never reused.
+CACHE_VERSION = 1
+
+#: Declaration members which only change how a shape is displayed and
+#: therefore are not part of the cache key.
+DISPLAY_MEMBERS = {
+    'cached', 'color', 'description', 'display', 'material', 'name',
+    'texture', 'transparency',
+}
+
+
+def cache_dir():
+    return os.path.expanduser('~/.config/declaracad/cache/shapes')
+
+
+def key_value(value):
+    """ Convert a declaration parameter into a value that can be hashed
+    consistently between processes.
+
+    Raises
+    ------
+    TypeError:
+        If the value cannot be used as part of a key (ex a TopoDS_Shape).
+
+    """
+    if value is None or isinstance(value, (bool, int, float, str)):
+        return value
+    if isinstance(value, Point):
+        return (value.__class__.__name__, value.x, value.y, value.z)
+    if isinstance(value, (list, tuple)):
+        return tuple(key_value(v) for v in value)
+    if isinstance(value, dict):
+        return tuple(sorted((k, key_value(v)) for k, v in value.items()))
+    if isinstance(value, Shape):
+        if not value.proxy_is_active:
+            raise TypeError("Shape %s is not active" % value)
+        key = value.proxy.get_cache_key()
+        if key is None:
+            raise TypeError("Shape %s has no cache key" % value)
+        return key
+    if isinstance(value, Atom):
+        return (value.__class__.__name__, tuple(
+            (name, key_value(getattr(value, name)))
+            for name in sorted(value.members())))
+    raise TypeError("Cannot create a key for %s" % type(value))
+
+
+def declaration_members(declaration):
+    """ Get the declaration members of the builtin shape class. Members
+    added by an enamldef are skipped since they only affect the shape
+    through other parameters or children.
+
+    """
+    cls = type(declaration)
+    while isinstance(cls, EnamlDefMeta):
+        cls = cls.__bases__[0]
+    for name, m in sorted(cls.members().items()):
+        if not m.metadata or not m.metadata.get('d_member'):
+            continue
+        if name in DISPLAY_MEMBERS or isinstance(m, (Event, Property)):
+            continue
+        yield name
+
+
+def make_key(proxy):
+    """ Generate a content addressed key for the shape the proxy builds from
+    the class, declaration parameters and the keys of any child shapes.
+
+    Parameters
+    ----------
+    proxy: OccShape
+        The proxy to generate a key for.
+
+    Returns
+    -------
+    key: String or None
+        The hex digest or None if the shape cannot be keyed.
+
+    """
+    d = proxy.declaration
+    children = []
+    for child in d.children:
+        if not isinstance(child, Shape):
+            continue
+        if not child.proxy_is_active:
+            return None
+        key = child.proxy.get_cache_key()
+        if key is None:
+            return None
+        children.append(key)
+
+    try:
+        params = tuple((name, key_value(getattr(d, name)))
+                       for name in declaration_members(d))
+    except TypeError:
+        return None
+
+    data = (CACHE_VERSION, OCCT_VERSION, proxy.__class__.__name__,
+            d.__class__.__name__, params, tuple(children))
+    return hashlib.sha1(repr(data).encode()).hexdigest()
+
+
+class ShapeCache(Atom):
+    """ A persistent content addressed cache of shapes stored as brep files.
+    Least recently used entries are removed once the total size exceeds the
+    `max_size`.
+
+    Recently used shapes are also kept in memory so an unchanged shape
+    is the same TopoDS_Shape between renders and it's presentation can be
+    reused by the viewer.
+
+    The cache is used by the workers of a parallel build so access to the
+    memory and size bookkeeping is guarded by a lock.
+
+    """
+    #: Whether the cache stored on disk is used
+    enabled = Bool(True)
+
+    #: Number of recently used shapes kept in memory
+    memory_size = Int(1000)
+
+    #: Recently used shapes
+    _memory = Typed(OrderedDict, ())
+
+    #: Lock for access to the recently used shapes and statistics
+    _lock = Value(factory=threading.RLock)
+
+    #: Directory to store cached shapes
+    path = Str()
+
+    def _default_path(self):
+        return cache_dir()
+
+    #: Max size in bytes of all entries
+    max_size = Int(512*1024*1024)
+
+    #: Statistics
+    hits = Int()
+    misses = Int()
+
+    #: Total size of the entries, computed when first needed
+    _size = Int(-1)
+
+    def get_filename(self, key):
+        return os.path.join(self.path, '%s.brep' % key)
+
+    def load(self, key):
+        """ Load the shape stored with the given key
+
+        Parameters
+        ----------
+        key: String
+            The key of the shape
+
+        Returns
+        -------
+        shape: TopoDS_Shape or None
+            The shape or None if it is not in the cache
+
+        """
+        with self._lock:
+            memory = self._memory
+            shape = memory.get(key)
+            if shape is not None:
+                memory.move_to_end(key)
+                self.hits += 1
+                return shape
+
+        path = self.get_filename(key)
+        if not self.enabled or not os.path.exists(path):
+            with self._lock:
+                self.misses += 1
+            return None
+        shape = TopoDS_Shape()
+        builder = BRep_Builder()
+        try:
+            BRepTools.Read_(shape, path, builder, None)
+        except Exception as e:
+            log.warning(f"Discarding invalid cache entry {path}: {e}")
+            self.discard(path)
+            return None
+        if shape.IsNull():
+            self.discard(path)
+            return None
+
+        # Update the mtime so it is kept
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        shape = Topology.cast_shape(shape)
+        with self._lock:
+            self.hits += 1
+            self.remember(key, shape)
+        return shape
+
+    def remember(self, key, shape):
+        """ Keep the shape in memory """
+        with self._lock:
+            memory = self._memory
+            memory[key] = shape
+            memory.move_to_end(key)
+            while len(memory) > self.memory_size:
+                memory.popitem(last=False)
+
+    def save(self, key, shape):
+        """ Store the shape with the given key
+
+        Parameters
+        ----------
+        key: String
+            The key of the shape
+        shape: TopoDS_Shape
+            The shape to save
+
+        """
+        self.remember(key, shape)
+        if not self.enabled:
+            return
+        path = self.get_filename(key)
+        try:
+            if not os.path.exists(self.path):
+                os.makedirs(self.path)
+            # Each writer uses it's own temp file so concurrent saves of
+            # the same key never install a partially written file
+            fd, tmp = tempfile.mkstemp(suffix='.tmp', dir=self.path)
+            os.close(fd)
+            try:
+                if not BRepTools.Write_(shape, tmp, None):
+                    raise IOError("Failed to write %s" % tmp)
+                os.replace(tmp, path)
+            finally:
+                self.discard(tmp)
+            size = os.path.getsize(path)
+        except Exception as e:
+            log.warning(f"Failed to save shape to cache: {e}")
+            return
+
+        with self._lock:
+            if self._size < 0:
+                self._size = self.compute_size()
+            else:
+                self._size += size
+            if self._size > self.max_size:
+                self.evict()
+
+    def entries(self):
+        """ Return a list of (mtime, size, path) for each entry """
+        entries = []
+        if not os.path.exists(self.path):
+            return entries
+        for name in os.listdir(self.path):
+            if not name.endswith('.brep'):
+                continue
+            path = os.path.join(self.path, name)
+            try:
+                st = os.stat(path)
+            except OSError:
+                continue
+            entries.append((st.st_mtime, st.st_size, path))
+        return entries
+
+    def compute_size(self):
+        return sum(size for mtime, size, path in self.entries())
+
+    def evict(self):
+        """ Remove the least recently used entries until the cache is
+        below the max size.
+
+        """
+        with self._lock:
+            entries = sorted(self.entries())
+            size = sum(e[1] for e in entries)
+            for mtime, n, path in entries:
+                if size <= self.max_size:
+                    break
+                if self.discard(path):
+                    size -= n
+            self._size = size
+
+    def discard(self, path):
+        try:
+            os.remove(path)
+            return True
+        except OSError:
+            return False
+
+    def clear(self):
+        """ Remove all entries """
+        with self._lock:
+            self._memory.clear()
+            for mtime, size, path in self.entries():
+                self.discard(path)
+            self._size = 0
+
+
+#: Global cache
+SHAPE_CACHE = ShapeCache()
@@ -9,10 +9,19 @@ Created on Dec 27, 2020
 
 @author: jrm
 """
-from atom.api import Typed, Instance
+import math
+import time
+import linecache
+import numpy as np
+from atom.api import Typed, Instance, Float
+from enaml.colors import parse_color
 from OCCT.AIS import AIS_Line, AIS_TextLabel, AIS_Plane
+from OCCT.Aspect import Aspect_TOL_SOLID
 from OCCT.gp import gp_Ax2
-from OCCT.Graphic3d import Graphic3d_Text
+from OCCT.Graphic3d import (
+    Graphic3d_Text, Graphic3d_Structure, Graphic3d_ArrayOfPolylines,
+    Graphic3d_AspectLine3d
+)
 from OCCT.Geom import Geom_Line, Geom_Plane
 from OCCT.Prs3d import (
     Prs3d_Arrow, Prs3d_ArrowAspect, Prs3d_Text, Prs3d_TextAspect
@@ -24,7 +33,7 @@ from declaracad.core.utils import log
 
 from ..display import (
     ProxyDisplayItem, ProxyDisplayArrow, ProxyDisplayText, ProxyDisplayLine,
-    ProxyDisplayPlane,
+    ProxyDisplayPlane, ProxyDisplayToolpath
 )
 from ..shape import Point
 from .occ_shape import coerce_axis
@@ -142,3 +151,323 @@ class OccDisplayText(OccDisplayItem, ProxyDisplayText):
 
     def set_font(self, font):
         self.update_item()
+
+
+def decimate(points, moves, tolerance):
+    """ Merge consecutive vertices of the same move that are in the same cell
+    of a grid with the given size.
+
+    Parameters
+    ----------
+    points: numpy.ndarray
+        The (N, 3) array of vertices
+    moves: numpy.ndarray
+        The move type of each vertex
+    tolerance: Float
+        The grid size
+
+    Returns
+    -------
+    keep: numpy.ndarray
+        A boolean mask of the vertices to keep
+
+    """
+    keep = np.ones(len(points), dtype=bool)
+    if tolerance <= 0 or len(points) < 2:
+        return keep
+    cells = np.floor(points / tolerance).astype(np.int64)
+    same = (cells[1:] == cells[:-1]).all(axis=1) & (moves[1:] == moves[:-1])
+    keep[1:] = ~same
+    return keep
+
+
+def split_polylines(moves, move, keep=None):
+    """ Split the vertices of the given move type into polylines. Each
+    polyline starts at the vertex before the first move in it.
+
+    Parameters
+    ----------
+    moves: numpy.ndarray
+        The move type of each vertex
+    move: Int
+        The move type of the polylines
+    keep: numpy.ndarray
+        An optional mask of the vertices to keep. The first and last vertex
+        of each polyline are always kept.
+
+    Returns
+    -------
+    result: Tuple[numpy.ndarray, numpy.ndarray]
+        The index of each vertex of the polylines and the number of vertices
+        in each polyline.
+
+    """
+    mask = moves == move
+    if len(mask):
+        mask[0] = False  # The first vertex has no previous vertex
+    prev = np.zeros_like(mask)
+    prev[1:] = mask[:-1]
+    following = np.zeros_like(mask)
+    following[:-1] = mask[1:]
+    starts = np.flatnonzero(mask & ~prev)
+    ends = np.flatnonzero(mask & ~following)
+    if not len(starts):
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+    anchors = starts - 1
+    lengths = ends - anchors + 1
+    offsets = np.cumsum(lengths) - lengths
+    indices = np.arange(lengths.sum()) - np.repeat(offsets - anchors, lengths)
+    if keep is not None:
+        selected = keep[indices]
+        selected[offsets] = True
+        selected[offsets + lengths - 1] = True
+        runs = np.repeat(np.arange(len(lengths)), lengths)
+        indices = indices[selected]
+        lengths = np.bincount(runs[selected], minlength=len(lengths))
+    return indices, lengths
+
+
+def nearest_segment(points, moves, origin, direction, tolerance):
+    """ Find the segment nearest to the line through the origin in the given
+    direction.
+
+    Parameters
+    ----------
+    points: numpy.ndarray
+        The (N, 3) array of vertices
+    moves: numpy.ndarray
+        The move type of each vertex. Vertices with a negative move are not
+        connected to the previous vertex.
+    origin: Tuple
+        A point on the line
+    direction: Tuple
+        The direction of the line
+    tolerance: Float
+        The maximum distance from the line
+
+    Returns
+    -------
+    index: Int
+        The index of the vertex at the end of the nearest segment or -1 if
+        no segment is within the tolerance.
+
+    """
+    if len(points) < 2:
+        return -1
+    direction = np.asarray(direction, dtype=float)
+    length = np.linalg.norm(direction)
+    if length == 0:
+        return -1
+    direction /= length
+
+    # Project onto the plane normal to the line
+    rel = points - np.asarray(origin, dtype=float)
+    rel -= np.outer(rel @ direction, direction)
+    a = rel[:-1]
+    ab = rel[1:] - a
+    denom = (ab * ab).sum(axis=1)
+    t = -(a * ab).sum(axis=1) / np.where(denom > 0, denom, 1)
+    t = t.clip(0, 1)
+    closest = a + ab * t[:, None]
+    dist = np.sqrt((closest * closest).sum(axis=1))
+    dist[moves[1:] < 0] = np.inf
+    i = int(np.argmin(dist))
+    if dist[i] > tolerance:
+        return -1
+    return i + 1
+
+
+class OccDisplayToolpath(OccDisplayItem, ProxyDisplayToolpath):
+    #: A reference to the toolkit item created by the proxy. This is drawn
+    #: directly in the view instead of through the ais context.
+    item = Typed(Graphic3d_Structure)
+
+    #: Vertices of the toolpath
+    points = Typed(np.ndarray)
+
+    #: Move type of each vertex
+    moves = Typed(np.ndarray)
+
+    #: Source line of each vertex
+    lines = Typed(np.ndarray)
+
+    #: Size of a pixel in model units when last drawn
+    pixel_size = Float()
+
+    #: Grid size the displayed vertices are decimated with
+    tolerance = Float()
+
+    def create_item(self):
+        d = self.declaration
+        points = d.points
+        if points is None:
+            points = np.empty((0, 3))
+        points = self.points = np.asarray(points, dtype=float).reshape(-1, 3)
+        n = len(points)
+        if d.moves is None:
+            moves = np.ones(n, dtype=np.int8)
+            if n:
+                moves[0] = -1
+        else:
+            moves = np.asarray(d.moves, dtype=np.int8)
+        if d.lines is None:
+            lines = np.zeros(n, dtype=np.int64)
+        else:
+            lines = np.asarray(d.lines, dtype=np.int64)
+        if len(moves) != n or len(lines) != n:
+            raise ValueError(
+                "Toolpath moves and lines must be the same length as points")
+        self.moves = moves
+        self.lines = lines
+
+    def update_item(self):
+        """ Recreates the toolpath catching any errors
+
+        """
+        try:
+            self.create_item()
+            self.draw()
+        except Exception as e:
+            log.exception(e)
+
+    def display(self, manager, pixel_size):
+        """ Create the structure and draw the toolpath in it.
+
+        Parameters
+        ----------
+        manager: Graphic3d_StructureManager
+            The structure manager of the viewer
+        pixel_size: Float
+            Size of a pixel in model units
+
+        """
+        if self.item is None:
+            self.item = Graphic3d_Structure(manager)
+        self.pixel_size = pixel_size
+        self.draw()
+
+    def erase(self):
+        """ Remove the toolpath from the view """
+        if self.item is not None:
+            self.item.Erase()
+
+    def get_tolerance(self, pixel_size):
+        """ Get the grid size used to decimate the vertices at the given
+        pixel size. It is rounded down to a power of two so the toolpath is
+        only redrawn when the zoom changes significantly.
+
+        """
+        lod = self.declaration.lod
+        if lod <= 0 or pixel_size <= 0:
+            return 0
+        return 2.0 ** math.floor(math.log2(lod * pixel_size))
+
+    def set_pixel_size(self, pixel_size):
+        """ Update the level of detail for the new size of a pixel.
+
+        Returns
+        -------
+        redrawn: Bool
+            Whether the toolpath was redrawn.
+
+        """
+        self.pixel_size = pixel_size
+        if self.item is None or self.get_tolerance(pixel_size) == \
+                self.tolerance:
+            return False
+        self.draw()
+        return True
+
+    def draw(self):
+        """ Draw the moves of each type as a single polyline array.
+
+        """
+        structure = self.item
+        if structure is None:
+            return
+        t0 = time.perf_counter()
+        structure.Clear()
+        d = self.declaration
+        points, moves = self.points, self.moves
+        tolerance = self.tolerance = self.get_tolerance(self.pixel_size)
+        keep = decimate(points, moves, tolerance) if tolerance else None
+        count = 0
+        for move, name in enumerate(d.MOVES):
+            indices, bounds = split_polylines(moves, move, keep)
+            if not len(bounds):
+                continue
+            array = Graphic3d_ArrayOfPolylines(len(indices), len(bounds))
+            for n in bounds.tolist():
+                array.AddBound(n)
+            add_vertex = array.AddVertex
+            for x, y, z in points[indices].tolist():
+                add_vertex(x, y, z)
+
+            color = d.colors.get(name)
+            if isinstance(color, str):
+                color = parse_color(color)
+            if color is None:
+                color = d.color
+            color, alpha = color_to_quantity_color(color)
+            group = structure.NewGroup()
+            group.SetGroupPrimitivesAspect(Graphic3d_AspectLine3d(
+                color, Aspect_TOL_SOLID, d.line_width))
+            group.AddPrimitiveArray(array)
+            count += len(indices)
+        if d.display:
+            structure.Display()
+        log.debug(f"Drew {count}/{len(points)} toolpath vertices in "
+                  f"{round(1000*(time.perf_counter()-t0), 3)}ms")
+
+    def pick(self, view, x, y, tolerance):
+        """ Find the source line of the move at the given screen position.
+
+        Parameters
+        ----------
+        view: V3d_View
+            The view
+        x: Int
+            The x screen coordinate
+        y: Int
+            The y screen coordinate
+        tolerance: Float
+            The maximum distance in model units
+
+        Returns
+        -------
+        line: Int
+            The line number of the move or 0 if no move was picked.
+
+        """
+        if self.item is None or not self.declaration.display:
+            return 0
+        ox, oy, oz, dx, dy, dz = view.ConvertWithProj(x, y, 0, 0, 0, 0, 0, 0)
+        i = nearest_segment(self.points, self.moves, (ox, oy, oz),
+                            (dx, dy, dz), tolerance)
+        if i < 0:
+            return 0
+        return int(self.lines[i])
+
+    def describe_line(self, line):
+        """ Get the source of the given line """
+        filename = self.declaration.filename
+        source = linecache.getline(filename, line).strip() if filename else ''
+        return source or f"Line {line}"
+
+    def set_points(self, points):
+        self.update_item()
+
+    def set_moves(self, moves):
+        self.update_item()
+
+    def set_lines(self, lines):
+        self.update_item()
+
+    def set_colors(self, colors):
+        self.update_item()
+
+    def set_line_width(self, width):
+        self.update_item()
+
+    def set_lod(self, lod):
+        self.update_item()
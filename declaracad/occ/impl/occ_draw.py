@@ -21,7 +21,6 @@ from OCCT.BRepBuilderAPI import (
     BRepBuilderAPI_MakeVertex, BRepBuilderAPI_MakeWire
 )
 from OCCT.BRepLib import BRepLib
-from OCCT.BRepOffsetAPI import BRepOffsetAPI_MakeOffset
 from OCCT.Font import (
     Font_FontMgr, Font_BRepFont, Font_BRepTextBuilder, Font_FontAspect,
     Font_FA_Regular
@@ -60,7 +59,6 @@ from declaracad.core.utils import log
 
 
 #: Track registered fonts
-FONT_MANAGER = Font_FontMgr.GetInstance_()
 FONT_REGISTRY = set()
 FONT_CACHE = {}
 
@@ -103,7 +101,7 @@ class OccPlane(OccShape, ProxyPlane):
         self.shape = face.Face()
 
     def set_bounds(self, bounds):
-        self.create_shape()
+        self.request_update()
 
 
 class OccVertex(OccShape, ProxyVertex):
@@ -147,7 +145,7 @@ class OccEdge(OccShape, ProxyEdge):
         return Topology.get_value_at(self.curve, t, derivative)
 
     def set_surface(self, surface):
-        self.create_shape()
+        self.request_update()
 
 
 class OccLine(OccEdge, ProxyLine):
@@ -172,7 +170,7 @@ class OccLine(OccEdge, ProxyLine):
         self.shape = self.make_edge(curve)
 
     def set_points(self, points):
-        self.create_shape()
+        self.request_update()
 
 
 class OccSegment(OccLine, ProxySegment):
@@ -241,22 +239,22 @@ class OccArc(OccLine, ProxyArc):
         self.shape = self.make_edge(arc)
 
     def set_radius(self, r):
-        self.create_shape()
+        self.request_update()
 
     def set_radius2(self, r):
-        self.create_shape()
+        self.request_update()
 
     def set_alpha1(self, a):
-        self.create_shape()
+        self.request_update()
 
     def set_alpha2(self, a):
-        self.create_shape()
+        self.request_update()
 
     def set_reverse(self, reverse):
-        self.create_shape()
+        self.request_update()
 
     def set_clockwise(self, clockwise):
-        self.create_shape()
+        self.request_update()
 
 
 class OccCircle(OccEdge, ProxyCircle):
@@ -272,7 +270,7 @@ class OccCircle(OccEdge, ProxyCircle):
         self.shape = self.make_edge(curve)
 
     def set_radius(self, r):
-        self.create_shape()
+        self.request_update()
 
 
 class OccEllipse(OccEdge, ProxyEllipse):
@@ -290,10 +288,10 @@ class OccEllipse(OccEdge, ProxyEllipse):
         self.shape = self.make_edge(curve)
 
     def set_major_radius(self, r):
-        self.create_shape()
+        self.request_update()
 
     def set_minor_radius(self, r):
-        self.create_shape()
+        self.request_update()
 
 
 class OccHyperbola(OccEdge, ProxyHyperbola):
@@ -311,10 +309,10 @@ class OccHyperbola(OccEdge, ProxyHyperbola):
         self.shape = self.make_edge(curve)
 
     def set_major_radius(self, r):
-        self.create_shape()
+        self.request_update()
 
     def set_minor_radius(self, r):
-        self.create_shape()
+        self.request_update()
 
 
 class OccParabola(OccEdge, ProxyParabola):
@@ -330,7 +328,7 @@ class OccParabola(OccEdge, ProxyParabola):
         self.shape = self.make_edge(curve)
 
     def set_focal_length(self, l):
-        self.create_shape()
+        self.request_update()
 
 
 class OccBSpline(OccLine, ProxyBSpline):
@@ -398,7 +396,8 @@ class OccText(OccShape, ProxyText):
         font_family = d.font
         if font_family and os.path.exists(font_family) \
                 and font_family not in FONT_REGISTRY:
-            FONT_MANAGER.RegisterFont(font_family, True)
+            # The font manager scans the system fonts when first created
+            Font_FontMgr.GetInstance_().RegisterFont(font_family, True)
             FONT_REGISTRY.add(font_family)
 
         attr = "Font_FA_{}".format(d.style.title().replace("-", ""))
@@ -428,28 +427,28 @@ class OccText(OccShape, ProxyText):
         self.shape = self.builder.Perform(self.font, text, axis, halign, valign)
 
     def set_text(self, text):
-        self.create_shape()
+        self.request_update()
 
     def set_font(self, font):
         self.update_font()
-        self.create_shape()
+        self.request_update()
 
     def set_size(self, size):
         self.update_font()
-        self.create_shape()
+        self.request_update()
 
     def set_style(self, style):
         self.update_font()
-        self.create_shape()
+        self.request_update()
 
     def set_composite(self, composite):
-        self.create_shape()
+        self.request_update()
 
     def set_vertical_alignment(self, alignment):
-        self.create_shape()
+        self.request_update()
 
     def set_horizontal_alignment(self, alignment):
-        self.create_shape()
+        self.request_update()
 
 
 class OccTrimmedCurve(OccEdge, ProxyTrimmedCurve):
@@ -467,7 +466,7 @@ class OccTrimmedCurve(OccEdge, ProxyTrimmedCurve):
         for child in self.children():
             if not isinstance(child, OccShape):
                 continue
-            child.observe('shape', self.update_shape)
+            child.observe('shape', self.request_update)
 
     def update_shape(self, change=None):
         d = self.declaration
@@ -479,11 +478,14 @@ class OccTrimmedCurve(OccEdge, ProxyTrimmedCurve):
         trimmed_curve = self.curve = Geom_TrimmedCurve(curve, d.u, d.v)
         self.shape = self.make_edge(trimmed_curve)
 
-    def set_u(self, u):
+    def rebuild(self):
         self.update_shape()
 
+    def set_u(self, u):
+        self.request_update()
+
     def set_v(self, v):
-        self.update_shape()
+        self.request_update()
 
 
 class OccWire(OccDependentShape, ProxyWire):
@@ -570,7 +572,7 @@ class OccPolyline(OccWire, ProxyPolyline):
         self.create_shape()
 
     def set_closed(self, closed):
-        self.create_shape()
+        self.request_update()
 
 
 class OccRectangle(OccWire, ProxyRectangle):
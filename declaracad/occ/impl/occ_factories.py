@@ -9,7 +9,6 @@ Created on Sep 28, 2016
 
 @author: jrm
 """
-from enaml.qt.qt_factories import QT_FACTORIES
 
 
 def occ_arc_factory():
@@ -297,6 +296,11 @@ def occ_display_plane_factory():
     return OccDisplayPlane
 
 
+def occ_display_toolpath_factory():
+    from .occ_display import OccDisplayToolpath
+    return OccDisplayToolpath
+
+
 #: Part
 OCC_FACTORIES = {
     'Part': occ_part_factory,
@@ -370,8 +374,5 @@ OCC_FACTORIES = {
     'DisplayLine': occ_display_line_factory,
     'DisplayText': occ_display_text_factory,
     'DisplayPlane': occ_display_plane_factory,
+    'DisplayToolpath': occ_display_toolpath_factory,
 }
-
-#: Install it
-QT_FACTORIES.update(OCC_FACTORIES)
-
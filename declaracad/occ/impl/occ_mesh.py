@@ -0,0 +1,260 @@
+"""
+Copyright (c) 2020, Jairus Martin.
+
+Distributed under the terms of the GPL v3 License.
+
+The full license is in the file LICENSE, distributed with this software.
+
+Tessellation shared by the exporters and the viewer.
+
+OCCT stores the triangulation of a face on the face itself so meshing the
+same shape with a different deflection replaces it. The triangulation of each
+face is kept for every set of parameters it was meshed with and restored
+before meshing so a face is never meshed twice with the same parameters.
+
+"""
+import numpy as np
+from collections import OrderedDict
+from atom.api import Atom, Bool, Int, Typed
+
+from OCCT.BRep import BRep_Builder, BRep_Tool
+from OCCT.BRepMesh import BRepMesh_IncrementalMesh
+from OCCT.IMeshTools import IMeshTools_Parameters
+from OCCT.TopAbs import TopAbs_FACE, TopAbs_REVERSED
+from OCCT.TopExp import TopExp_Explorer
+from OCCT.TopLoc import TopLoc_Location
+from OCCT.TopoDS import TopoDS
+
+
+def location_matrix(location):
+    """ Get the transformation of a location as a matrix
+
+    Parameters
+    ----------
+    location: TopLoc_Location
+        The location
+
+    Returns
+    -------
+    matrix: numpy.ndarray
+        A 3x4 matrix of the rotation and translation.
+
+    """
+    trsf = location.Transformation()
+    return np.array([[trsf.Value(r, c) for c in range(1, 5)]
+                     for r in range(1, 4)])
+
+
+def face_mesh(face):
+    """ Get the triangulation of a meshed face. The location of the face is
+    applied to the points and the triangles are ordered counter clockwise
+    based on the orientation of the face.
+
+    Parameters
+    ----------
+    face: TopoDS_Face
+        The face to read the triangulation from
+
+    Returns
+    -------
+    result: Tuple[numpy.ndarray, numpy.ndarray] or None
+        The points as an (n, 3) array and the zero based indices of the
+        points of each triangle as an (m, 3) array. If the face is not
+        meshed None is returned.
+
+    """
+    location = TopLoc_Location()
+    triangulation = BRep_Tool.Triangulation_(face, location)
+    if triangulation is None:
+        return None
+    nodes = triangulation.Nodes()
+    points = []
+    for i in range(nodes.Lower(), nodes.Upper()+1):
+        p = nodes.Value(i)
+        points.append((p.X(), p.Y(), p.Z()))
+    triangles = triangulation.Triangles()
+    indices = [triangles.Value(i).Get(0, 0, 0)
+               for i in range(triangles.Lower(), triangles.Upper()+1)]
+    if not indices:
+        return None
+    points = np.array(points)
+    indices = np.array(indices) - nodes.Lower()
+    if face.Orientation() == TopAbs_REVERSED:
+        indices = indices[:, ::-1]
+    if not location.IsIdentity():
+        m = location_matrix(location)
+        points = points.dot(m[:, :3].T) + m[:, 3]
+    return points, indices
+
+
+class MeshCache(Atom):
+    """ Meshes shapes and caches the triangulation of each face per
+    deflection. Least recently used faces are dropped once the cached
+    triangulations have more than `max_triangles` triangles. Shapes that
+    are no longer used, such as those removed from the viewer, should be
+    discarded so their geometry is not kept alive.
+
+    """
+    #: Mesh the faces of a shape in parallel
+    parallel = Bool(True)
+
+    #: Max number of triangles of all the cached triangulations
+    max_triangles = Int(5000000)
+
+    #: Number of triangles of all the cached triangulations
+    triangles = Int()
+
+    #: Maps the hash of a face to a list of (face, triangulations) where the
+    #: triangulations are keyed by the mesh parameters
+    _faces = Typed(OrderedDict, ())
+
+    #: Statistics
+    hits = Int()
+    misses = Int()
+
+    def get_faces(self, shape):
+        """ Get the unique faces of the shape """
+        faces = []
+        seen = set()
+        explorer = TopExp_Explorer(shape, TopAbs_FACE)
+        while explorer.More():
+            face = TopoDS.Face_(explorer.Current())
+            explorer.Next()
+            key = face.Located(TopLoc_Location()).HashCode(2**31-1)
+            if key in seen and any(f.IsPartner(face) for f in faces):
+                continue
+            seen.add(key)
+            faces.append(face)
+        return faces
+
+    def get_triangulations(self, face):
+        """ Get the triangulations cached for the face. Faces which share
+        the same geometry (partners) share the same triangulation.
+
+        Parameters
+        ----------
+        face: TopoDS_Face
+            The face to lookup
+
+        Returns
+        -------
+        triangulations: Dict
+            The triangulations of the face keyed by the mesh parameters.
+
+        """
+        faces = self._faces
+        key = face.Located(TopLoc_Location()).HashCode(2**31-1)
+        entries = faces.get(key)
+        if entries is None:
+            entries = faces[key] = []
+        else:
+            faces.move_to_end(key)
+        for f, triangulations in entries:
+            if f.IsPartner(face):
+                return triangulations
+        triangulations = {}
+        entries.append((face, triangulations))
+        return triangulations
+
+    def mesh(self, shape, linear_deflection, angular_deflection=0.5,
+             relative=False):
+        """ Mesh the shape. Faces already meshed with the same parameters use
+        the cached triangulation and only the remaining faces are meshed.
+
+        Parameters
+        ----------
+        shape: TopoDS_Shape
+            The shape to mesh
+        linear_deflection: Float
+            The linear deflection
+        angular_deflection: Float
+            The angular deflection in radians
+        relative: Bool
+            Whether the linear deflection is relative to the size of each
+            edge
+
+        """
+        params = (float(linear_deflection), float(angular_deflection),
+                  bool(relative))
+        builder = BRep_Builder()
+        missing = []
+        for face in self.get_faces(shape):
+            triangulations = self.get_triangulations(face)
+            triangulation = triangulations.get(params)
+            if triangulation is None:
+                missing.append((face, triangulations))
+            else:
+                # Restore it in case the face was meshed with other params
+                builder.UpdateFace(face, triangulation)
+                self.hits += 1
+        if not missing:
+            return
+        self.misses += len(missing)
+
+        parameters = IMeshTools_Parameters()
+        parameters.Deflection = params[0]
+        parameters.Angle = params[1]
+        parameters.Relative = params[2]
+        parameters.InParallel = self.parallel
+        mesh = BRepMesh_IncrementalMesh(shape, parameters)
+        if not mesh.IsDone():
+            raise RuntimeError("Failed to create the mesh")
+
+        location = TopLoc_Location()
+        for face, triangulations in missing:
+            triangulation = BRep_Tool.Triangulation_(face, location)
+            if triangulation is not None:
+                triangulations[params] = triangulation
+                self.triangles += triangulation.NbTriangles()
+        if self.triangles > self.max_triangles:
+            self.evict()
+
+    def count_triangles(self, entries):
+        return sum(t.NbTriangles() for face, triangulations in entries
+                   for t in triangulations.values())
+
+    def evict(self):
+        """ Drop the least recently used faces until the number of cached
+        triangles is below the max.
+
+        """
+        faces = self._faces
+        while faces and self.triangles > self.max_triangles:
+            key, entries = faces.popitem(last=False)
+            self.triangles -= self.count_triangles(entries)
+
+    def discard(self, shape):
+        """ Remove the triangulations cached for the faces of the shape.
+
+        Parameters
+        ----------
+        shape: TopoDS_Shape
+            The shape that is no longer used
+
+        """
+        if shape is None or shape.IsNull():
+            return
+        faces = self._faces
+        for face in self.get_faces(shape):
+            key = face.Located(TopLoc_Location()).HashCode(2**31-1)
+            entries = faces.get(key)
+            if not entries:
+                continue
+            removed = [e for e in entries if e[0].IsPartner(face)]
+            if not removed:
+                continue
+            self.triangles -= self.count_triangles(removed)
+            entries = [e for e in entries if not e[0].IsPartner(face)]
+            if entries:
+                faces[key] = entries
+            else:
+                del faces[key]
+
+    def clear(self):
+        """ Remove all entries """
+        self._faces.clear()
+        self.triangles = 0
+
+
+#: Global cache
+MESH_CACHE = MeshCache()
@@ -12,11 +12,13 @@ Created on Sep 30, 2016
 import os
 from math import pi
 from atom.api import (
-    Atom, Bool, Instance, List, Typed, Str, Property, observe, set_default
+    Atom, Bool, Instance, List, Typed, Str, Property, Value, observe,
+    set_default
 )
 
 from OCCT.AIS import (
-    AIS_Shape, AIS_TexturedShape, AIS_MultipleConnectedInteractive
+    AIS_InteractiveObject, AIS_Shape, AIS_TexturedShape,
+    AIS_MultipleConnectedInteractive
 )
 from OCCT.Bnd import Bnd_Box
 from OCCT.BRep import BRep_Builder
@@ -53,6 +55,8 @@ from ..shape import (
 
 from .utils import color_to_quantity_color, material_to_material_aspect
 from .topology import Topology
+from .occ_cache import SHAPE_CACHE, make_key
+from .occ_update import UPDATE_SCHEDULER
 
 from declaracad.core.utils import log
 
@@ -91,8 +95,10 @@ class OccShape(ProxyShape):
     #: A reference to the toolkit shape created by the proxy.
     shape = Typed(TopoDS_Shape)
 
-    #: The shape that was shown on the screen
-    ais_shape = Instance(AIS_Shape)
+    #: The shape that was shown on the screen. This is an
+    #: AIS_ConnectedInteractive when the viewer displays it as an instance
+    #: of a shape with the same geometry.
+    ais_shape = Instance(AIS_InteractiveObject)
 
     #: Whether this is currently displayed
     displayed = Bool()
@@ -114,6 +120,13 @@ class OccShape(ProxyShape):
 
     location = Typed(TopLoc_Location)
 
+    #: Whether the shape can be restored from the shape cache. This should
+    #: only be enabled when the shape is the only state the proxy builds.
+    cacheable = Bool()
+
+    #: Cache key of the parameters the current shape was built from
+    _cache_key = Value()
+
     # -------------------------------------------------------------------------
     # Initialization API
     # -------------------------------------------------------------------------
@@ -147,7 +160,9 @@ class OccShape(ProxyShape):
         """ Activate the proxy for the top-down pass.
 
         """
-        self.create_shape()
+        if not self.restore_shape():
+            self.create_shape()
+            self.store_shape()
         self.init_shape()
 
     def activate_bottom_up(self):
@@ -166,6 +181,7 @@ class OccShape(ProxyShape):
 
     @observe('shape')
     def on_shape_changed(self, change):
+        self._cache_key = None
         if self.shape is not None:
             self.topology = self._default_topology()
         if self.displayed:
@@ -202,12 +218,31 @@ class OccShape(ProxyShape):
         """ Generate the AIS shape for the viewer to display.
         This is only invoked when the viewer wants to display the shape.
 
+        """
+        ais_shape = self.create_ais_shape(self.shape)
+        ais_shape.SetLocalTransformation(self.location.Transformation())
+        return ais_shape
+
+    def create_ais_shape(self, shape):
+        """ Create an AIS shape for the given shape with the color, material,
+        and texture of the declaration.
+
+        Parameters
+        ----------
+        shape: TopoDS_Shape
+            The shape to display
+
+        Returns
+        -------
+        ais_shape: AIS_Shape
+            The AIS shape without any transformation.
+
         """
         d = self.declaration
 
         if d.texture is not None:
             texture = d.texture
-            ais_shape = AIS_TexturedShape(self.shape)
+            ais_shape = AIS_TexturedShape(shape)
 
             if os.path.exists(texture.path):
                 path = TCollection_AsciiString(texture.path)
@@ -221,7 +256,7 @@ class OccShape(ProxyShape):
                 ais_shape.SetTextureMapOn()
                 ais_shape.SetDisplayMode(3)
         else:
-            ais_shape = AIS_Shape(self.shape)
+            ais_shape = AIS_Shape(shape)
 
         ais_shape.SetTransparency(d.transparency)
         if d.color:
@@ -232,7 +267,6 @@ class OccShape(ProxyShape):
         if d.material.name:
             ma = material_to_material_aspect(d.material)
             ais_shape.SetMaterial(ma)
-        ais_shape.SetLocalTransformation(self.location.Transformation())
         return ais_shape
 
     def _default_location(self):
@@ -246,6 +280,76 @@ class OccShape(ProxyShape):
             parent = parent.parent()
         return location
 
+    # -------------------------------------------------------------------------
+    # Shape cache API
+    # -------------------------------------------------------------------------
+    def get_cache_key(self):
+        """ Get the key which identifies the shape built from the current
+        declaration parameters and child shapes.
+
+        Returns
+        -------
+        key: String or None
+            The key or None if the shape cannot be identified by it's
+            parameters alone.
+
+        """
+        key = self._cache_key
+        if key is None:
+            key = self._cache_key = make_key(self)
+        return key
+
+    def restore_shape(self):
+        """ Restore the shape from the shape cache if possible.
+
+        Returns
+        -------
+        result: Bool
+            Whether the shape was restored from the cache.
+
+        """
+        if not self.cacheable:
+            return False
+        key = self.get_cache_key()
+        if key is None:
+            return False
+        shape = SHAPE_CACHE.load(key)
+        if shape is None:
+            return False
+        self.shape = shape
+        self._cache_key = key
+        return True
+
+    def store_shape(self):
+        """ Save the shape in the shape cache if possible.
+
+        """
+        if not self.cacheable:
+            return
+        if self.shape is None or self.shape.IsNull():
+            return
+        key = self.get_cache_key()
+        if key is not None:
+            SHAPE_CACHE.save(key, self.shape)
+
+    # -------------------------------------------------------------------------
+    # Update API
+    # -------------------------------------------------------------------------
+    def request_update(self, change=None):
+        """ Mark the shape as needing to be rebuilt. The rebuild is deferred
+        so changing several parameters or child shapes at once only rebuilds
+        the shape once.
+
+        """
+        UPDATE_SCHEDULER.mark(self)
+
+    def rebuild(self):
+        """ Rebuild the shape from the current parameters. This is invoked
+        by the update scheduler.
+
+        """
+        self.create_shape()
+
     # -------------------------------------------------------------------------
     # Proxy API
     # -------------------------------------------------------------------------
@@ -282,13 +386,13 @@ class OccShape(ProxyShape):
         return t
 
     def set_position(self, position):
-        self.create_shape()
+        self.request_update()
 
     def set_direction(self, direction):
-        self.create_shape()
+        self.request_update()
 
     def set_axis(self, axis):
-        self.create_shape()
+        self.request_update()
 
     def parent_shape(self):
         p = self.parent()
@@ -326,13 +430,15 @@ class OccDependentShape(OccShape):
         will be fully initialized and layed out when this is called.
 
         """
-        self.update_shape()
+        if not self.restore_shape():
+            self.update_shape()
+            self.store_shape()
         # log.debug('init_layout %s shape %s' % (self, self.shape))
         assert self.shape is not None, "Shape was not created %s" % self
 
         # When they change re-compute
         for child in self.children():
-            child.observe('shape', self.update_shape)
+            child.observe('shape', self.request_update)
 
     def update_shape(self, change=None):
         """ Must be implmented in subclasses to create the shape
@@ -340,21 +446,24 @@ class OccDependentShape(OccShape):
         """
         raise NotImplementedError
 
+    def rebuild(self):
+        self.update_shape()
+
     def child_added(self, child):
         super().child_added(child)
         if isinstance(child, OccShape):
-            child.observe('shape', self.update_shape)
+            child.observe('shape', self.request_update)
 
     def child_removed(self, child):
         super().child_removed(child)
         if isinstance(child, OccShape):
-            child.unobserve('shape', self.update_shape)
+            child.unobserve('shape', self.request_update)
 
     def set_direction(self, direction):
-        self.update_shape()
+        self.request_update()
 
     def set_axis(self, axis):
-        self.update_shape()
+        self.request_update()
 
 
 class OccPart(OccDependentShape, ProxyPart):
@@ -408,9 +517,10 @@ class OccPart(OccDependentShape, ProxyPart):
 
 
 class OccFace(OccDependentShape, ProxyFace):
+    cacheable = set_default(True)
 
     def set_wires(self, wires):
-        self.update_shape()
+        self.request_update()
 
     def shape_to_face(self, shape):
         if isinstance(shape, OccShape):
@@ -444,6 +554,7 @@ class OccFace(OccDependentShape, ProxyFace):
 class OccBox(OccShape, ProxyBox):
     reference = set_default('https://dev.opencascade.org/doc/refman/html/'
                             'class_b_rep_prim_a_p_i___make_box.html')
+    cacheable = set_default(True)
 
     def create_shape(self):
         d = self.declaration
@@ -451,18 +562,19 @@ class OccBox(OccShape, ProxyBox):
         self.shape = box.Shape()
 
     def set_dx(self, dx):
-        self.create_shape()
+        self.request_update()
 
     def set_dy(self, dy):
-        self.create_shape()
+        self.request_update()
 
     def set_dz(self, dz):
-        self.create_shape()
+        self.request_update()
 
 
 class OccCone(OccShape, ProxyCone):
     reference = set_default('https://dev.opencascade.org/doc/refman/html/'
                             'class_b_rep_prim_a_p_i___make_cone.html')
+    cacheable = set_default(True)
 
     def create_shape(self):
         d = self.declaration
@@ -473,21 +585,22 @@ class OccCone(OccShape, ProxyCone):
         self.shape = cone.Shape()
 
     def set_radius(self, r):
-        self.create_shape()
+        self.request_update()
 
     def set_radius2(self, r):
-        self.create_shape()
+        self.request_update()
 
     def set_height(self, height):
-        self.create_shape()
+        self.request_update()
 
     def set_angle(self, a):
-        self.create_shape()
+        self.request_update()
 
 
 class OccCylinder(OccShape, ProxyCylinder):
     reference = set_default('https://dev.opencascade.org/doc/refman/html/'
                             'class_b_rep_prim_a_p_i___make_cylinder.html')
+    cacheable = set_default(True)
 
     def create_shape(self):
         d = self.declaration
@@ -498,18 +611,19 @@ class OccCylinder(OccShape, ProxyCylinder):
         self.shape = cylinder.Shape()
 
     def set_radius(self, r):
-        self.create_shape()
+        self.request_update()
 
     def set_angle(self, angle):
-        self.create_shape()
+        self.request_update()
 
     def set_height(self, height):
-        self.create_shape()
+        self.request_update()
 
 
 class OccHalfSpace(OccDependentShape, ProxyHalfSpace):
     reference = set_default('https://dev.opencascade.org/doc/refman/html/'
                             'class_b_rep_prim_a_p_i___make_half_space.html')
+    cacheable = set_default(True)
 
     def update_shape(self, change=None):
         d = self.declaration
@@ -528,15 +642,16 @@ class OccHalfSpace(OccDependentShape, ProxyHalfSpace):
         self.shape = half_space.Solid()
 
     def set_surface(self, surface):
-        self.update_shape()
+        self.request_update()
 
     def set_side(self, side):
-        self.update_shape()
+        self.request_update()
 
 
 class OccPrism(OccDependentShape, ProxyPrism):
     reference = set_default('https://dev.opencascade.org/doc/refman/html/'
                             'class_b_rep_prim_a_p_i___make_prism.html')
+    cacheable = set_default(True)
 
     def update_shape(self, change=None):
         d = self.declaration
@@ -562,22 +677,22 @@ class OccPrism(OccDependentShape, ProxyPrism):
                 return child
 
     def set_shape(self, shape):
-        self.update_shape()
+        self.request_update()
 
     def set_infinite(self, infinite):
-        self.update_shape()
+        self.request_update()
 
     def set_copy(self, copy):
-        self.update_shape()
+        self.request_update()
 
     def set_canonize(self, canonize):
-        self.update_shape()
+        self.request_update()
 
     def set_direction(self, direction):
-        self.update_shape()
+        self.request_update()
 
     def set_vector(self, vector):
-        self.update_shape()
+        self.request_update()
 
 
 class OccRevol(OccDependentShape, ProxyRevol):
@@ -585,6 +700,7 @@ class OccRevol(OccDependentShape, ProxyRevol):
     #: Update the class reference
     reference = set_default('https://dev.opencascade.org/doc/refman/html/'
                             'class_b_rep_prim_a_p_i___make_wedge.html')
+    cacheable = set_default(True)
 
     def update_shape(self, change=None):
         d = self.declaration
@@ -611,21 +727,22 @@ class OccRevol(OccDependentShape, ProxyRevol):
                 return child
 
     def set_shape(self, shape):
-        self.update_shape()
+        self.request_update()
 
     def set_angle(self, angle):
-        self.update_shape()
+        self.request_update()
 
     def set_copy(self, copy):
-        self.update_shape()
+        self.request_update()
 
     def set_direction(self, direction):
-        self.update_shape()
+        self.request_update()
 
 
 class OccSphere(OccShape, ProxySphere):
     reference = set_default('https://dev.opencascade.org/doc/refman/html/'
                             'class_b_rep_prim_a_p_i___make_sphere.html')
+    cacheable = set_default(True)
 
     def create_shape(self):
         d = self.declaration
@@ -637,22 +754,23 @@ class OccSphere(OccShape, ProxySphere):
         self.shape = sphere.Shape()
 
     def set_radius(self, r):
-        self.create_shape()
+        self.request_update()
 
     def set_angle(self, a):
-        self.create_shape()
+        self.request_update()
 
     def set_angle2(self, a):
-        self.create_shape()
+        self.request_update()
 
     def set_angle3(self, a):
-        self.create_shape()
+        self.request_update()
 
 
 class OccTorus(OccShape, ProxyTorus):
 
     reference = set_default('https://dev.opencascade.org/doc/refman/html/'
                             'class_b_rep_prim_a_p_i___make_torus.html')
+    cacheable = set_default(True)
 
     def create_shape(self):
         d = self.declaration
@@ -668,25 +786,26 @@ class OccTorus(OccShape, ProxyTorus):
         self.shape = torus.Shape()
 
     def set_radius(self, r):
-        self.create_shape()
+        self.request_update()
 
     def set_radius2(self, r):
-        self.create_shape()
+        self.request_update()
 
     def set_angle(self, a):
-        self.create_shape()
+        self.request_update()
 
     def set_angle2(self, a):
-        self.create_shape()
+        self.request_update()
 
     def set_angle3(self, a):
-        self.create_shape()
+        self.request_update()
 
 
 class OccWedge(OccShape, ProxyWedge):
 
     reference = set_default('https://dev.opencascade.org/doc/refman/html/'
                             'class_b_rep_prim_a_p_i___make_wedge.html')
+    cacheable = set_default(True)
 
     def create_shape(self):
         d = self.declaration
@@ -695,16 +814,16 @@ class OccWedge(OccShape, ProxyWedge):
         self.shape = wedge.Shape()
 
     def set_dx(self, dx):
-        self.create_shape()
+        self.request_update()
 
     def set_dy(self, dy):
-        self.create_shape()
+        self.request_update()
 
     def set_dz(self, dz):
-        self.create_shape()
+        self.request_update()
 
     def set_itx(self, itx):
-        self.create_shape()
+        self.request_update()
 
 
 class OccRawShape(OccShape, ProxyRawShape):
@@ -716,6 +835,10 @@ class OccRawShape(OccShape, ProxyRawShape):
         """ Delegate shape creation to the declaration implementation. """
         self.shape = self.declaration.create_shape(self.parent_shape())
 
+    def get_cache_key(self):
+        """ The shape is created by user code so it cannot be keyed. """
+        return None
+
     # -------------------------------------------------------------------------
     # ProxyRawShape API
     # -------------------------------------------------------------------------
@@ -736,6 +859,10 @@ class OccRawPart(OccPart, ProxyRawPart):
         """ Delegate shape creation to the declaration implementation. """
         self.shapes = self.declaration.create_shapes(self.parent_shape())
 
+    def get_cache_key(self):
+        """ The shapes are created by user code so they cannot be keyed. """
+        return None
+
     # -------------------------------------------------------------------------
     # ProxyRawShape API
     # -------------------------------------------------------------------------
@@ -11,13 +11,12 @@ Created on Sep 20, 2018
 """
 import os
 import re
+import hashlib
 import warnings
-from atom.api import Atom, List, Instance, set_default
-from lxml import etree
+from atom.api import Atom, List, Instance, ForwardInstance, set_default
 from math import radians, sqrt, tan, atan, atan2, cos, acos, sin, pi
 
 from OCCT.BRep import BRep_Builder
-from OCCT.BRepAdaptor import BRepAdaptor_CompCurve, BRepAdaptor_HCompCurve
 from OCCT.BRepBuilderAPI import (
     BRepBuilderAPI_MakeEdge, BRepBuilderAPI_MakeWire, BRepBuilderAPI_MakeFace,
     BRepBuilderAPI_MakePolygon, BRepBuilderAPI_Transform
@@ -33,10 +32,16 @@ from OCCT.TopoDS import TopoDS_Shape, TopoDS_Compound#, topods
 
 
 from .occ_shape import OccShape
+from .occ_cache import make_key
 from ..draw import ProxySvg
 
 from declaracad.core.utils import log
 
+def lxml_element():
+    from lxml import etree
+    return etree._Element
+
+
 Z_DIR = gp_Dir(0, 0, 1)
 NEG_Z_DIR = gp_Dir(0, 0, -1)
 Z_AXIS = gp_Ax1(gp_Pnt(0, 0, 0), Z_DIR)
@@ -163,7 +168,7 @@ def compute_arc_center(x1, y1, rx, ry, phi, large_arc_flag, sweep_flag,
 
 class OccSvgNode(Atom):
     #: Element
-    element = Instance(etree._Element)
+    element = ForwardInstance(lxml_element)
 
     def create_shape(self):
         """ Create and return the shape for the given svg node.
@@ -540,6 +545,7 @@ class OccSvg(OccShape, ProxySvg):
     doc = Instance(OccSvgDoc)
 
     def create_shape(self):
+        from lxml import etree
         d = self.declaration
         if not d.source:
             return
@@ -584,8 +590,21 @@ class OccSvg(OccShape, ProxySvg):
 
         self.shape = BRepBuilderAPI_Transform(shape, t, False).Shape()
 
+    def get_cache_key(self):
+        """ Include the modified time and size when the source is a file """
+        key = self._cache_key
+        if key is None:
+            key = make_key(self)
+            path = os.path.expanduser(self.declaration.source)
+            if key is not None and os.path.exists(path):
+                st = os.stat(path)
+                data = (key, st.st_mtime, st.st_size)
+                key = hashlib.sha1(repr(data).encode()).hexdigest()
+            self._cache_key = key
+        return key
+
     def set_source(self, source):
-        self.create_shape()
+        self.request_update()
 
     def set_mirror(self, mirror):
-        self.create_shape()
+        self.request_update()
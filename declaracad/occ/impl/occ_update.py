@@ -0,0 +1,118 @@
+"""
+Copyright (c) 2020, Jairus Martin.
+
+Distributed under the terms of the GPL v3 License.
+
+The full license is in the file LICENSE, distributed with this software.
+
+"""
+import heapq
+import itertools
+import threading
+from atom.api import Atom, Bool, Int, Typed, Value
+from enaml.application import Application, deferred_call
+
+from declaracad.core.utils import log
+
+
+def get_depth(proxy):
+    """ Get the depth of the proxy in the tree """
+    depth = 0
+    parent = proxy.parent()
+    while parent is not None:
+        depth += 1
+        parent = parent.parent()
+    return depth
+
+
+class UpdateScheduler(Atom):
+    """ Coalesces shape rebuilds. Instead of rebuilding immediately when a
+    parameter or child shape changes the proxy is marked dirty and all
+    dirty proxies are rebuilt once in the next event loop iteration,
+    deepest first, so each operation in the tree is only recomputed once
+    no matter how many of it's inputs changed.
+
+    """
+    #: Whether rebuilds are deferred. When disabled, when no application
+    #: is running, or when marked from a background thread shapes are
+    #: rebuilt immediately.
+    enabled = Bool(True)
+
+    #: Proxies waiting to be rebuilt
+    pending = Typed(set, ())
+
+    #: Queue of (-depth, order, proxy) so the deepest are rebuilt first
+    queue = Typed(list, ())
+
+    #: Whether a flush is scheduled
+    scheduled = Bool()
+
+    #: Statistics
+    rebuilds = Int()
+    flushes = Int()
+
+    #: Used to keep the queue order stable
+    _counter = Value(factory=itertools.count)
+
+    def mark(self, proxy):
+        """ Mark the proxy as needing to be rebuilt.
+
+        Parameters
+        ----------
+        proxy: OccShape
+            The proxy to rebuild.
+
+        """
+        if not self.enabled or Application.instance() is None:
+            return self.rebuild(proxy)
+        if threading.current_thread() is not threading.main_thread():
+            # Models built in the background are not displayed yet
+            return self.rebuild(proxy)
+        if proxy in self.pending:
+            return
+        self.pending.add(proxy)
+        heapq.heappush(
+            self.queue, (-get_depth(proxy), next(self._counter), proxy))
+        if not self.scheduled:
+            self.scheduled = True
+            deferred_call(self.flush)
+
+    def flush(self):
+        """ Rebuild all the pending proxies. Children are always rebuilt
+        before their parents. Proxies marked dirty as a result of a rebuild
+        are handled in the same flush.
+
+        """
+        self.scheduled = False
+        pending, queue = self.pending, self.queue
+        if not queue:
+            return
+        self.flushes += 1
+        while queue:
+            depth, i, proxy = heapq.heappop(queue)
+            pending.discard(proxy)
+            self.rebuild(proxy)
+
+    def flush_main_thread(self):
+        """ Rebuild the pending proxies if called from the main thread.
+        Proxies are only deferred when marked from the main thread so they
+        must not be rebuilt by a background thread.
+
+        """
+        if self.queue and \
+                threading.current_thread() is threading.main_thread():
+            self.flush()
+
+    def rebuild(self, proxy):
+        """ Rebuild the shape of the proxy if it is still active """
+        if proxy.declaration is None:
+            return
+        try:
+            self.rebuilds += 1
+            proxy.rebuild()
+        except Exception as e:
+            log.exception(e)
+
+
+#: Global scheduler
+UPDATE_SCHEDULER = UpdateScheduler()
@@ -758,6 +758,71 @@ class Topology(Atom):
             param = lambda i: a.Value(i)
         return [coerce_point(param(i)) for i in range(1, a.NbPoints()+1)]
 
+    @classmethod
+    def discretize_array(cls, wire, deflection, method='quasi-deflection'):
+        """ Convert a wire to an array of points. This is the same as
+        `discretize` but avoids creating a Point for every sample.
+
+        Parameters
+        ----------
+        wire: TopoDS_Wire or TopoDS_Edge
+            The wire to discretize
+        deflection: Float or Int
+            Maximum deflection allowed if method is 'deflection' or
+            'quasi-'defelction' else this is the number of points
+        method: Str
+            A value of either 'deflection' or 'abissca'
+
+        Returns
+        -------
+        points: numpy.ndarray
+            An (N, 3) array of the points that make up the curve
+
+        """
+        import numpy as np
+        c = BRepAdaptor_CompCurve(wire)
+        start = c.FirstParameter()
+        end = c.LastParameter()
+        fn = DISCRETIZE_METHODS[method.lower().replace('uniform', '')]
+        a = fn(c, deflection, start, end)
+        n = a.NbPoints()
+        if method.endswith('abscissa'):
+            values = map(c.Value, map(a.Parameter, range(1, n+1)))
+        else:
+            values = map(a.Value, range(1, n+1))
+        coords = [v for p in values for v in (p.X(), p.Y(), p.Z())]
+        return np.array(coords, dtype=np.float64).reshape(n, 3)
+
+    @classmethod
+    def discretize_arrays(cls, wires, deflection, method='quasi-deflection'):
+        """ Convert many wires to a single array of points.
+
+        Parameters
+        ----------
+        wires: Iterable[TopoDS_Wire]
+            The wires to discretize
+        deflection: Float or Int
+            Maximum deflection allowed if method is 'deflection' or
+            'quasi-'defelction' else this is the number of points
+        method: Str
+            A value of either 'deflection' or 'abissca'
+
+        Returns
+        -------
+        result: Tuple[numpy.ndarray, numpy.ndarray]
+            An (N, 3) array of the points of all the wires and an array of
+            the offset of each wire in the points followed by N. The points
+            of wire i are `points[offsets[i]:offsets[i+1]]`.
+
+        """
+        import numpy as np
+        arrays = [cls.discretize_array(w, deflection, method) for w in wires]
+        offsets = np.zeros(len(arrays)+1, dtype=np.int64)
+        np.cumsum([len(a) for a in arrays], out=offsets[1:])
+        if not arrays:
+            return (np.empty((0, 3)), offsets)
+        return (np.concatenate(arrays), offsets)
+
     @classmethod
     def bbox(cls, shapes, optimal=False, tolerance=0):
         """ Compute the bounding box of the shape or list of shapes
@@ -9,10 +9,13 @@ Created on Aug 31, 2020
 
 @author: jrm
 """
+import math
 import cmath
+import numpy as np
+from array import array
 from declaracad.cnc import gcode
 from declaracad.occ.api import (
-    Vertex, Point, Polyline, Bezier, Arc, Wire, Circle
+    Vertex, Point, Polyline, Bezier, Arc, Wire, Circle, DisplayToolpath
 )
 from declaracad.core.utils import log
 
@@ -24,8 +27,274 @@ COLORMAP = {
 }
 
 
+def tessellate_arc(start, end, center, clockwise, tolerance, turns=1):
+    """ Tessellate an arc in the XY plane. The Z value is linearly
+    interpolated so helical arcs are supported.
+
+    Parameters
+    ----------
+    start: Tuple
+        The (x, y, z) start of the arc
+    end: Tuple
+        The (x, y, z) end of the arc
+    center: Tuple
+        The (x, y) center of the arc
+    clockwise: Bool
+        The direction of the arc
+    tolerance: Float
+        The maximum distance between the arc and the segments
+    turns: Int
+        The number of full or partial turns
+
+    Returns
+    -------
+    points: numpy.ndarray
+        An (N, 3) array of the points after the start
+
+    """
+    sx, sy, sz = start
+    ex, ey, ez = end
+    cx, cy = center
+    r = math.hypot(sx - cx, sy - cy)
+    a0 = math.atan2(sy - cy, sx - cx)
+    sweep = math.atan2(ey - cy, ex - cx) - a0
+    if clockwise:
+        if sweep >= 0:
+            sweep -= 2 * math.pi
+        sweep -= 2 * math.pi * (turns - 1)
+    else:
+        if sweep <= 0:
+            sweep += 2 * math.pi
+        sweep += 2 * math.pi * (turns - 1)
+    if r > tolerance:
+        step = 2 * math.acos(1 - tolerance / r)
+    else:
+        step = math.pi / 2
+    n = max(1, math.ceil(abs(sweep) / step))
+    t = np.arange(1, n + 1) / n
+    angles = a0 + sweep * t
+    points = np.column_stack((
+        cx + r * np.cos(angles),
+        cy + r * np.sin(angles),
+        sz + (ez - sz) * t))
+    points[-1] = end
+    return points
+
+
+def tessellate_bezier(points, n=16):
+    """ Tessellate a bezier curve with the given control points.
+
+    Returns
+    -------
+    points: numpy.ndarray
+        An (n, 3) array of the points after the start
+
+    """
+    controls = np.asarray(points, dtype=float)
+    degree = len(controls) - 1
+    t = np.arange(1, n + 1)[:, None] / n
+    result = np.zeros((n, 3))
+    f = math.factorial
+    for i, p in enumerate(controls):
+        b = f(degree) // (f(i) * f(degree - i)) * t**i * (1 - t)**(degree - i)
+        result += b * p
+    return result
+
+
+def build_toolpath(doc, arc_tolerance=0.01):
+    """ Build the vertices of the toolpath of a parsed GCode file.
+
+    Parameters
+    ----------
+    doc: declaracad.cnc.gcode.GCode
+        The parsed gcode
+    arc_tolerance: Float
+        The maximum distance between arcs and the segments they are
+        tessellated into
+
+    Returns
+    -------
+    result: Tuple
+        A tuple of the (N, 3) array of vertices, the index in
+        `DisplayToolpath.MOVES` of the move ending at each vertex, the line
+        number of each vertex, and a list of (position, dwell time, line)
+        of each dwell.
+
+    """
+    RAPID, NORMAL, ARC, PLUNGE = range(4)
+    xs, ys, zs = array('d', [0]), array('d', [0]), array('d', [0])
+    moves = array('b', [-1])
+    lines = array('q', [0])
+    dwells = []
+
+    def add_points(points, move, line):
+        n = len(points)
+        xs.extend(points[:, 0].tolist())
+        ys.extend(points[:, 1].tolist())
+        zs.extend(points[:, 2].tolist())
+        moves.extend([move] * n)
+        lines.extend([line] * n)
+
+    columns = {k: v.tolist() for k, v in doc.columns.items()}
+    X, Y, Z = columns['X'], columns['Y'], columns['Z']
+    I, J, R, P, Q = (columns[k] for k in 'IJRPQ')
+    nan = math.isnan
+    codes = doc.codes
+    x = y = z = 0.0
+    absolute = True
+    last_id = ''
+    for row, (opcode, line) in enumerate(zip(doc.opcodes.tolist(),
+                                             doc.lines.tolist())):
+        cmd_id = codes[opcode]
+        if cmd_id in ('G0', 'G1', 'G2', 'G3'):
+            dx, dy, dz = X[row], Y[row], Z[row]
+            if absolute:
+                px = x if nan(dx) else dx
+                py = y if nan(dy) else dy
+                pz = z if nan(dz) else dz
+            else:
+                px = x + (0 if nan(dx) else dx)
+                py = y + (0 if nan(dy) else dy)
+                pz = z + (0 if nan(dz) else dz)
+
+            if cmd_id in ('G0', 'G1'):
+                if px == x and py == y and pz == z:
+                    continue
+                if cmd_id == 'G0':
+                    move = RAPID
+                elif last_id == 'G0':
+                    move = PLUNGE
+                else:
+                    move = NORMAL
+                xs.append(px)
+                ys.append(py)
+                zs.append(pz)
+                moves.append(move)
+                lines.append(line)
+            else:
+                clockwise = cmd_id == 'G2'
+                r = R[row]
+                if not nan(r):
+                    # Solve for center
+                    ddx, ddy = px - x, py - y
+                    q = math.hypot(ddx, ddy)
+                    if q == 0:
+                        raise ValueError(
+                            f"Invalid arc on line {line} (d=0)")
+                    u = math.sqrt(max(r**2 - (q/2)**2, 0))
+                    if clockwise == (r > 0):
+                        u = -u
+                    cx = (x + px) / 2 - u * ddy / q
+                    cy = (y + py) / 2 + u * ddx / q
+                else:
+                    i, j = I[row], J[row]
+                    if nan(i) and nan(j):
+                        raise ValueError(
+                            f"Invalid arc on line {line} "
+                            "(both I and J missing)")
+                    cx = x + (0 if nan(i) else i)
+                    cy = y + (0 if nan(j) else j)
+                p = P[row]
+                turns = 1 if nan(p) else max(1, int(p))
+                points = tessellate_arc((x, y, z), (px, py, pz), (cx, cy),
+                                        clockwise, arc_tolerance, turns)
+                add_points(points, ARC, line)
+            x, y, z = px, py, pz
+            last_id = cmd_id
+        elif cmd_id == 'G4':
+            t = P[row]
+            if nan(t) or t <= 0:
+                raise ValueError(f"Invalid dwell time on line {line}")
+            dwells.append(((x, y, z), t, line))
+            last_id = cmd_id
+        elif cmd_id in ('G5', 'G5.1'):
+            start = np.array([x, y, z])
+            c1 = start + (X[row], Y[row], 0)
+            i, j = I[row], J[row]
+            if cmd_id == 'G5':
+                controls = [start, c1]
+                if last_id != 'G5' or not (nan(i) or nan(j)):
+                    controls.append(c1 + (i, j, 0))
+                elif not (nan(i) and nan(j)):
+                    # Must both be specified or nether
+                    raise ValueError(f"Incomplete G5 command on line {line}")
+                controls.append(controls[-1] + (P[row], Q[row], 0))
+            else:
+                if nan(i) and nan(j):
+                    raise ValueError(
+                        f"Incomplete G5.1 command on line {line}")
+                controls = [start, c1, c1 + (0 if nan(i) else i,
+                                             0 if nan(j) else j, 0)]
+            controls = np.array(controls)
+            if np.isnan(controls).any():
+                raise ValueError(f"Invalid spline on line {line}")
+            add_points(tessellate_bezier(controls), NORMAL, line)
+            x, y, z = controls[-1].tolist()
+            last_id = cmd_id
+        elif cmd_id == 'G90':
+            absolute = True
+        elif cmd_id == 'G91':
+            absolute = False
+
+    points = np.column_stack((np.frombuffer(xs), np.frombuffer(ys),
+                              np.frombuffer(zs)))
+    return (points, np.frombuffer(moves, dtype=np.int8),
+            np.frombuffer(lines, dtype=np.int64), dwells)
+
+
 def load_gcode(filename, **options):
-    """ Load a GCode file into a list of shapes to render
+    """ Load a GCode file into a toolpath to display. All the moves are
+    displayed in a single DisplayToolpath so large files can be viewed.
+
+    Parameters
+    ----------
+    filename: String
+        The file path to load
+    options: Dict
+        toolpath: Bool
+            If false create a shape for each command (much slower but each
+            move can be selected as an edge).
+        arc_tolerance: Float
+            Maximum distance between an arc and the segments it is displayed
+            with.
+        lod: Float
+            Distance in pixels below which vertices are merged
+        colors: Dict
+            A dict to update the colormap
+
+    Returns
+    -------
+    toolpath: List[DisplayItem or Shape]
+        List of items to visualize the toolpath
+
+    """
+    if not options.get('toolpath', True):
+        return load_gcode_shapes(filename, **options)
+    doc = gcode.parse(filename)
+    log.debug(doc)
+    colors = COLORMAP.copy()
+    if 'colors' in options:
+        colors.update(options['colors'])
+    points, moves, lines, dwells = build_toolpath(
+        doc, options.get('arc_tolerance', 0.01))
+    items = [DisplayToolpath(
+        points=points,
+        moves=moves,
+        lines=lines,
+        filename=filename,
+        colors=colors,
+        lod=options.get('lod', 1))]
+    for position, t, line in dwells:
+        items.append(Vertex(
+            position=position,
+            description=f"Dwell {t}s",
+        ))
+    return items
+
+
+def load_gcode_shapes(filename, **options):
+    """ Load a GCode file into a list of shapes to render. Each command
+    is a separate shape.
 
     Parameters
     ----------
@@ -179,7 +448,7 @@ def load_gcode(filename, **options):
                 raise ValueError(f"Incomplete G5 command {cmd}")
 
             # Last point
-            points.append(points[-1] + Point(cmd['P'], cmd['Q']))
+            points.append(points[-1] + Point(data['P'], data['Q']))
 
             items.append(Bezier(
                 points=points,
@@ -9,18 +9,13 @@ Created on Aug 31, 2020
 
 @author: jrm
 """
-from OCCT.IGESControl import IGESControl_Reader
-from OCCT.IFSelect import IFSelect_RetDone, IFSelect_ItemsByEntity
 from declaracad.occ.api import TopoShape
+from .transfer import import_shapes
 
 
-def load_iges(filename):
-    """ Load an iges model """
-    reader = IGESControl_Reader()
-    status = reader.ReadFile(filename)
-    if status != IFSelect_RetDone:
-        raise ValueError("Failed to load: {}".format(filename))
-    reader.PrintCheckLoad(False, IFSelect_ItemsByEntity)
-    reader.PrintCheckTransfer(False, IFSelect_ItemsByEntity)
-    ok = reader.TransferRoots()
-    return [TopoShape(shape=reader.Shape(1))]
+def load_iges(filename, cache=True):
+    """ Load an iges model. Each root is transferred in a worker process and
+    the result is cached.
+
+    """
+    return [TopoShape(shape=s) for s in import_shapes(filename, 'iges', cache)]
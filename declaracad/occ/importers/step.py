@@ -9,18 +9,17 @@ Created on Aug 31, 2020
 
 @author: jrm
 """
-from OCCT.IFSelect import IFSelect_RetDone, IFSelect_ItemsByEntity
-from OCCT.STEPControl import STEPControl_Reader
 from declaracad.occ.api import TopoShape
+from .transfer import import_shapes
 
 
-def load_stp(filename):
-    """ Load a stp model """
-    reader = STEPControl_Reader()
-    status = reader.ReadFile(filename)
-    if status != IFSelect_RetDone:
-        raise ValueError("Failed to load: {}".format(filename))
-    reader.PrintCheckLoad(False, IFSelect_ItemsByEntity)
-    reader.PrintCheckTransfer(False, IFSelect_ItemsByEntity)
-    ok = reader.TransferRoot()
-    return [TopoShape(shape=reader.Shape(1))]
+def load_step(filename, cache=True):
+    """ Load a stp model. Each root is transferred in a worker process and
+    the result is cached.
+
+    """
+    return [TopoShape(shape=s) for s in import_shapes(filename, 'step', cache)]
+
+
+#: Alias of load_step
+load_stp = load_step
@@ -0,0 +1,228 @@
+"""
+Copyright (c) 2020, Jairus Martin.
+
+Distributed under the terms of the GPL v3 License.
+
+The full license is in the file LICENSE, distributed with this software.
+
+Imports STEP and IGES files in a worker process. Each root is sent back as
+soon as it is transferred so it can be displayed while the rest of the file
+is imported. The result is stored in the shape cache keyed by the hash and
+modification time of the file so the file is only transferred once.
+
+"""
+import os
+import time
+import queue
+import hashlib
+import tempfile
+import traceback
+import multiprocessing
+
+from OCCT import __version__ as OCCT_VERSION
+from OCCT.BRep import BRep_Builder
+from OCCT.BRepTools import BRepTools
+from OCCT.IFSelect import IFSelect_RetDone
+from OCCT.TopoDS import TopoDS_Shape, TopoDS_Compound, TopoDS_Iterator
+
+from declaracad.core.utils import log
+
+
+#: Bump this whenever the stored format changes
+IMPORT_VERSION = 1
+
+#: Seconds between checks for cancellation while waiting on the worker
+POLL_INTERVAL = 0.1
+
+#: Digests of files keyed by (path, size, mtime) so unchanged files are
+#: not hashed again
+_digests = {}
+
+
+def create_reader(kind):
+    if kind == 'step':
+        from OCCT.STEPControl import STEPControl_Reader
+        return STEPControl_Reader()
+    elif kind == 'iges':
+        from OCCT.IGESControl import IGESControl_Reader
+        return IGESControl_Reader()
+    raise ValueError("Unsupported file type: {}".format(kind))
+
+
+def file_digest(filename):
+    """ Compute the sha1 of the file contents. The result is remembered
+    until the file changes.
+
+    """
+    st = os.stat(filename)
+    key = (os.path.abspath(filename), st.st_size, st.st_mtime_ns)
+    digest = _digests.get(key)
+    if digest is None:
+        h = hashlib.sha1()
+        with open(filename, 'rb') as f:
+            for chunk in iter(lambda: f.read(1 << 20), b''):
+                h.update(chunk)
+        digest = _digests[key] = h.hexdigest()
+    return digest
+
+
+def import_key(filename, kind):
+    """ Get the shape cache key for the imported file """
+    st = os.stat(filename)
+    data = (IMPORT_VERSION, OCCT_VERSION, kind, file_digest(filename),
+            st.st_mtime_ns)
+    return 'import-%s' % hashlib.sha1(repr(data).encode()).hexdigest()
+
+
+def read_brep(path):
+    shape = TopoDS_Shape()
+    builder = BRep_Builder()
+    BRepTools.Read_(shape, path, builder, None)
+    return shape
+
+
+def transfer_roots(kind, filename, output_dir, results):
+    """ Read the file and transfer each root. This is run in the worker
+    process. Each shape transferred is written to a brep in the output
+    directory and the path is put on the results queue.
+
+    Parameters
+    ----------
+    kind: String
+        Either 'step' or 'iges'
+    filename: String
+        The file to import
+    output_dir: String
+        Directory to write the transferred shapes to
+    results: multiprocessing.Queue
+        Queue to put messages on for the parent process
+
+    """
+    try:
+        reader = create_reader(kind)
+        status = reader.ReadFile(filename)
+        if status != IFSelect_RetDone:
+            raise ValueError("Failed to load: {}".format(filename))
+        n = reader.NbRootsForTransfer()
+        results.put(('started', n))
+        for i in range(1, n+1):
+            start = reader.NbShapes()
+            reader.TransferOneRoot(i)
+            # Shapes are only added if the transfer succeeds
+            for j in range(start+1, reader.NbShapes()+1):
+                path = os.path.join(output_dir, '%s.brep' % j)
+                if not BRepTools.Write_(reader.Shape(j), path, None):
+                    raise IOError("Failed to write %s" % path)
+                results.put(('shape', i, n, path))
+        results.put(('done', reader.NbShapes()))
+    except Exception:
+        results.put(('error', traceback.format_exc()))
+
+
+def transfer_in_process(kind, filename, monitor=None):
+    """ Transfer the file in a worker process.
+
+    Parameters
+    ----------
+    kind: String
+        Either 'step' or 'iges'
+    filename: String
+        The file to import
+    monitor: BuildMonitor
+        Monitor to report progress and partial results to and check for
+        cancellation.
+
+    Returns
+    -------
+    shapes: List[TopoDS_Shape]
+        The shape of each root transferred.
+
+    """
+    from declaracad.occ.shape import BuildCancelled, process_events
+    ctx = multiprocessing.get_context('spawn')
+    results = ctx.Queue()
+    shapes = []
+    with tempfile.TemporaryDirectory(prefix='declaracad-import-') as tmp:
+        process = ctx.Process(
+            target=transfer_roots, args=(kind, filename, tmp, results),
+            daemon=True)
+        process.start()
+        try:
+            while True:
+                try:
+                    msg = results.get(timeout=POLL_INTERVAL)
+                except queue.Empty:
+                    process_events()
+                    if monitor is not None and monitor.cancelled:
+                        raise BuildCancelled()
+                    if process.is_alive():
+                        continue
+                    # It may have exited right after sending the last
+                    # messages so check for them before failing
+                    try:
+                        msg = results.get_nowait()
+                    except queue.Empty:
+                        raise RuntimeError(
+                            "Import of {} failed: The worker exited with "
+                            "code {}".format(filename, process.exitcode))
+                if msg[0] == 'shape':
+                    i, n, path = msg[1:]
+                    shapes.append(read_brep(path))
+                    os.remove(path)
+                    if monitor is not None:
+                        monitor.update(100 * i / n)
+                        monitor.show_partial(shapes)
+                elif msg[0] == 'done':
+                    break
+                elif msg[0] == 'error':
+                    raise ValueError(msg[1])
+        finally:
+            if process.is_alive():
+                process.terminate()
+            process.join()
+    return shapes
+
+
+def import_shapes(filename, kind, cache=True):
+    """ Import the shapes from a STEP or IGES file. If the file was imported
+    before the shapes are loaded from the shape cache.
+
+    Parameters
+    ----------
+    filename: String
+        The file to import
+    kind: String
+        Either 'step' or 'iges'
+    cache: Bool
+        Whether the shape cache is used
+
+    Returns
+    -------
+    shapes: List[TopoDS_Shape]
+        The shape of each root in the file.
+
+    """
+    from declaracad.occ.impl.occ_cache import SHAPE_CACHE
+    from declaracad.occ.shape import BuildMonitor
+    key = import_key(filename, kind) if cache else None
+    if key is not None:
+        compound = SHAPE_CACHE.load(key)
+        if compound is not None:
+            shapes = []
+            it = TopoDS_Iterator(compound)
+            while it.More():
+                shapes.append(it.Value())
+                it.Next()
+            return shapes
+
+    t0 = time.time()
+    shapes = transfer_in_process(kind, filename, BuildMonitor.current())
+    log.debug(f"Imported {filename} in {round(time.time()-t0, 3)}s")
+    if key is not None:
+        compound = TopoDS_Compound()
+        builder = BRep_Builder()
+        builder.MakeCompound(compound)
+        for shape in shapes:
+            builder.Add(compound, shape)
+        SHAPE_CACHE.save(key, compound)
+    return shapes
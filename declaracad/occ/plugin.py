@@ -20,19 +20,25 @@ import asyncio
 import functools
 import jsonpickle
 from types import ModuleType
+from concurrent.futures import ThreadPoolExecutor
 from atom.api import (
     Atom, ContainerList, Str, Float, Dict, Bool, Int, Instance, Enum,
     ForwardInstance, Constant, observe, set_default
 )
-from declaracad.core.api import Plugin, Model, log
-from declaracad.core.utils import ProcessLineReceiver, get_bootstrap_cmd
+from declaracad.core.models import Plugin, Model
+from declaracad.core.utils import (
+    ProcessLineReceiver, get_bootstrap_cmd, capture_thread_output, log
+)
+from declaracad.core.framing import (
+    FrameDecoder, available_codecs, encode_frame, encode_line
+)
 
 from enaml.application import timed_call, deferred_call
 from enaml.core.parser import parse
 from enaml.core.import_hooks import EnamlCompiler
 from enaml.colors import ColorMember
 
-from .shape import Part
+from .shape import Part, Shape, BuildMonitor, BuildCancelled
 
 
 @functools.lru_cache
@@ -111,6 +117,122 @@ def load_model(filename, source=None):
         return []
 
 
+class ModelLoader(Atom):
+    """ Loads and builds models in a background thread so the UI is not
+    blocked. Only the latest version requested is displayed, any build in
+    progress when a newer version is requested is cancelled.
+
+    """
+    #: Version of the source of the latest request
+    version = Int()
+
+    #: Id of the latest build. Each request gets a new id since the same
+    #: version may be loaded more than once.
+    _build_id = Int()
+
+    #: Whether a build is in progress
+    loading = Bool()
+
+    #: Progress of the build in percent
+    progress = Float()
+
+    #: Monitor of the latest build
+    monitor = Instance(BuildMonitor)
+
+    #: Thread models are built on
+    executor = Instance(ThreadPoolExecutor)
+
+    def _default_executor(self):
+        return ThreadPoolExecutor(1, thread_name_prefix='model-loader')
+
+    def load(self, filename, source, version, callback, partial=None):
+        """ Load and build the model in the background.
+
+        Parameters
+        ----------
+        filename: String
+            Path to the file to load
+        source: String
+            Source code to parse (optional)
+        version: Int
+            Version of the source
+        callback: Callable
+            Called on the main thread with the list of parts, the error if
+            loading failed, and the output captured while loading. It is not
+            called if the build is superseded by a newer version.
+        partial: Callable
+            Called on the main thread with a list of TopoDS_Shapes that can
+            be displayed while the model is still loading (optional).
+
+        """
+        if self.monitor is not None:
+            self.monitor.cancelled = True
+        self._build_id += 1
+        build_id = self._build_id
+        self.version = version
+        self.loading = True
+        self.progress = 0
+        monitor = self.monitor = BuildMonitor(
+            callback=functools.partial(self._report_progress, build_id))
+        if partial is not None:
+            monitor.partial = functools.partial(
+                self._report_partial, build_id, partial)
+        future = self.executor.submit(self.build, filename, source, monitor)
+        future.add_done_callback(lambda f: deferred_call(
+            self._build_done, build_id, f, callback))
+        return future
+
+    def build(self, filename, source, monitor):
+        """ Load the model and build the shapes. This is run in the worker
+        thread.
+
+        Returns
+        -------
+        result: Tuple[List[Part], String]
+            The parts and any output captured while building them.
+
+        """
+        with capture_thread_output() as stdout, monitor:
+            monitor.check()
+            start_time = time.time()
+            parts = load_model(filename, source)
+            monitor.total = sum(
+                1 for part in parts for d in part.traverse()
+                if isinstance(d, Shape))
+            for part in parts:
+                part.render()
+            print(f"Load took {round(time.time()-start_time, 3)}s")
+            return parts, stdout.getvalue()
+
+    def _report_progress(self, build_id, progress):
+        deferred_call(self._set_progress, build_id, progress)
+
+    def _set_progress(self, build_id, progress):
+        if build_id == self._build_id:
+            self.progress = progress
+
+    def _report_partial(self, build_id, callback, shapes):
+        deferred_call(self._show_partial, build_id, callback, shapes)
+
+    def _show_partial(self, build_id, callback, shapes):
+        if build_id == self._build_id and self.loading:
+            callback(shapes)
+
+    def _build_done(self, build_id, future, callback):
+        if build_id != self._build_id:
+            return  # Superseded
+        self.loading = False
+        self.monitor = None
+        parts, error, output = [], None, ''
+        try:
+            parts, output = future.result()
+        except BuildCancelled:
+            return
+        except Exception as e:
+            error = e
+        callback(parts, error, output)
+
+
 class ModelExporter(Atom):
     extension = ''
     path = Str()
@@ -121,10 +243,17 @@ class ModelExporter(Atom):
         filename = os.path.splitext(self.filename)[0]
         return "{}.{}".format(filename, ext)
 
-    def export(self):
+    def export(self, parts=None):
         """ Export a DeclaraCAD model from an enaml file to a 3D model format
         with the given options.
 
+        Parameters
+        ----------
+        parts: List[occ.shape.Shape]
+            The parts to export. If not given the model is loaded from the
+            filename. This allows the same model to be exported to several
+            formats while only being loaded once.
+
         """
         raise NotImplementedError
 
@@ -137,6 +266,15 @@ class ModelExporter(Atom):
         raise NotImplementedError
 
 
+def get_exporters():
+    """ Get the list of available ModelExporter classes """
+    from .exporters.stl.exporter import StlExporter
+    from .exporters.step.exporter import StepExporter
+    from .exporters.vrml.exporter import VrmlExporter
+    from .exporters.gltf.exporter import GltfExporter
+    return [StlExporter, StepExporter, VrmlExporter, GltfExporter]
+
+
 class ScreenshotOptions(Atom):
     #: Path to save
     path = Str()
@@ -168,6 +306,9 @@ class ViewerProcess(ProcessLineReceiver):
     #: Process handle
     process = Instance(object)
 
+    #: Whether a start is scheduled or in progress
+    starting = Bool()
+
     #: Reference to the plugin
     plugin = ForwardInstance(lambda: ViewerPlugin)
 
@@ -192,33 +333,146 @@ class ViewerProcess(ProcessLineReceiver):
     #: Holds responses temporarily
     _responses = Dict()
 
+    #: Messages sent before the viewer was ready. These are sent in order
+    #: once the window id is received.
+    _pending = ContainerList()
+
+    #: Codec negotiated with the viewer to frame messages. When empty the
+    #: newline delimited protocol is used.
+    codec = Str()
+
+    #: Buffers partial reads from the viewer
+    decoder = Instance(FrameDecoder, ())
+
+    #: Milliseconds to wait for more changes before rendering
+    render_delay = Int(250)
+
+    #: Number of renders being built or waiting to be sent. At most one
+    #: render is in progress and one is waiting.
+    render_queue = Int()
+
+    #: Number of requested renders that were replaced by a newer request
+    #: before they were sent
+    renders_dropped = Int()
+
+    #: Parameters of the render the viewer is building
+    _rendering = Dict()
+
+    #: Parameters of the next render. Requests made while a render is
+    #: in progress are merged so only the latest version is sent.
+    _render_pending = Dict()
+
+    #: Filename and version the viewer was last sent
+    _render_state = Dict()
+
+    #: Incremented to invalidate any debounce timer already scheduled
+    _render_timer = Int()
+
     #: Seconds to ping
     _ping_rate = Int(40)
 
     #: Capture stderr separately
     err_to_out = set_default(False)
 
+    def _default_render_delay(self):
+        if self.plugin is not None:
+            return self.plugin.render_delay
+        return 250
+
     def redraw(self):
         if self.document:
             # Trigger a reload
             self.document.version += 1
         else:
-            self.set_version(self._id)
+            self.request_render(version=self._id)
+
+    def reload(self):
+        """ Reload the document from disk discarding any source sent
+        from the editor.
+
+        """
+        self.request_render(reload=True)
 
     @observe('document', 'document.version')
     def _update_document(self, change):
         doc = self.document
         if doc is None:
-            self.set_filename('-')
+            self.request_render(filename='-')
         else:
-            self.set_filename(doc.name)
-            self.set_version(doc.version)
+            self.request_render(filename=doc.name, version=doc.version)
+
+    def request_render(self, **params):
+        """ Request the viewer to render. Requests are debounced and merged
+        with any request that has not been sent yet.
+
+        Parameters
+        ----------
+        params: Dict
+            The `filename`, `version`, and `source` to render. If `reload` is
+            set the file is reloaded even if it did not change.
+
+        """
+        pending = self._render_pending
+        if 'version' in params and 'version' in pending:
+            self.renders_dropped += 1
+        pending.update(params)
+        self._render_timer += 1
+        timed_call(self.render_delay, self._render_debounced,
+                   self._render_timer)
+        self._update_render_queue()
+
+    def _render_debounced(self, timer):
+        if timer != self._render_timer:
+            return  # Another request was made
+        self._render_timer = 0
+        self.send_render()
+
+    def send_render(self):
+        """ Send the pending render if the viewer is not busy rendering.
+
+        """
+        if self._rendering or not self._render_pending or self._render_timer:
+            return
+        params, self._render_pending = self._render_pending, {}
+        state = self._render_state
+        filename = params.get('filename', state.get('filename', '-'))
+        version = params.get('version', state.get('version'))
+        # The viewer only rebuilds when the filename or version changes
+        # and replies with the result when done
+        changed = params.get('reload') or \
+            filename != state.get('filename') or \
+            version != state.get('version')
+        if params.get('reload'):
+            self.set_filename('-')
+        if filename != state.get('filename') or params.get('reload'):
+            self.set_filename(filename)
+        if 'source' in params:
+            self.set_source(params['source'])
+        if version is not None and version != state.get('version'):
+            self.set_version(version)
+        self._render_state = {'filename': filename, 'version': version}
+        if changed and filename != '-':
+            self._rendering = params
+        self._update_render_queue()
+
+    def render_finished(self):
+        """ Called when the viewer finished a render. The next pending
+        render, if any, is sent.
+
+        """
+        self._rendering = {}
+        self._update_render_queue()
+        self.send_render()
+
+    def _update_render_queue(self):
+        self.render_queue = int(bool(self._rendering)) + \
+            int(bool(self._render_pending))
 
     def send_message(self, method, *args, **kwargs):
-        # Defer until it's ready
+        # Queue until it's ready so the order of requests is preserved
         if not self.transport or not self.window_id:
             #log.debug('renderer | message not ready deferring')
-            timed_call(1000, self.send_message, method, *args, **kwargs)
+            self._pending.append((method, args, kwargs))
             return
         _id = kwargs.pop('_id')
         _silent = kwargs.pop('_silent', False)
@@ -228,17 +482,59 @@ class ViewerProcess(ProcessLineReceiver):
             request['id'] = _id
         if not _silent:
             log.debug(f'renderer | sent | {request}')
-        encoded_msg = jsonpickle.dumps(request).encode() + b'\r\n'
+        if self.codec:
+            encoded_msg = encode_frame(request, self.codec)
+        else:
+            encoded_msg = encode_line(request)
         deferred_call(self.transport.write, encoded_msg)
 
+    def send_pending_messages(self):
+        """ Send any messages that were queued while the viewer was starting
+        """
+        pending, self._pending = self._pending, []
+        for method, args, kwargs in pending:
+            self.send_message(method, *args, **kwargs)
+
+    def negotiate_framing(self, codecs):
+        """ Switch to framed messages if the viewer supports any of the codecs
+        available here. Older viewers do not advertise any and continue to
+        use the newline delimited protocol.
+
+        Parameters
+        ----------
+        codecs: List[str]
+            Codecs supported by the viewer
+
+        """
+        for codec in available_codecs():
+            if codec in codecs:
+                break
+        else:
+            return
+        # This must be sent using the current protocol
+        self.send_message('set_framing', codec, _id='set_framing')
+        self.codec = codec
+        log.debug(f"renderer | using {codec} framing")
+
     async def start(self):
         atexit.register(self.terminate)
         cmd = get_bootstrap_cmd()
         cmd.extend(['view', '-', '-f'])
         loop = asyncio.get_event_loop()
-        self.process = await loop.subprocess_exec(lambda: self, *cmd)
+        try:
+            self.process = await loop.subprocess_exec(lambda: self, *cmd)
+        finally:
+            self.starting = False
         return self.process
 
+    def ensure_started(self):
+        """ Start the process unless it is already running or starting,
+        such as a process taken from the pool before it's start completed.
+
+        """
+        if self.process is None and not self.starting:
+            self.restart()
+
     def restart(self):
         self.window_id = 0
         self.restarts += 1
@@ -254,26 +550,49 @@ class ViewerProcess(ProcessLineReceiver):
                 "renderer | Failed to successfully start renderer aborting!")
 
         log.debug(f"Attempting to restart viewer {self.process}")
+        self.starting = True
         deferred_call(self.start)
 
     def connection_made(self, transport):
+        # Start each process with the line protocol until negotiated
+        self.codec = ''
+        self.decoder = FrameDecoder()
         super().connection_made(transport)
         self.schedule_ping()
         self.terminated = False
 
     def data_received(self, data):
-        line = data.decode()
+        for framed, message in self.decoder.feed(data):
+            if framed:
+                self.message_received(message, str(message))
+            else:
+                self.line_received(message)
+
+    def line_received(self, line):
         try:
             response = jsonpickle.loads(line)
             # log.debug(f"viewer | resp | {response}")
         except Exception as e:
             log.debug(f"viewer | out | {line.rstrip()}")
             response = {}
+        self.message_received(response, line)
+
+    def message_received(self, response, line):
+        """ Handle a message from the viewer
 
+        Parameters
+        ----------
+        response: Dict
+            The decoded message
+        line: String
+            The message as text so it can be added to the output if it is
+            not a json-rpc response.
+
+        """
         doc = self.document
 
         if not isinstance(response, dict):
-            log.debug(f"viewer | out | {response.rstrip()}")
+            log.debug(f"viewer | out | {line.rstrip()}")
             return
         elif response:
             log.debug(f"viewer | out | {response}")
@@ -283,8 +602,10 @@ class ViewerProcess(ProcessLineReceiver):
         if response_id == 'window_id':
             self.window_id = response['result']
             self.restarts = 0  # Clear the restart count
+            self.negotiate_framing(response.get('framing', []))
+            self.send_pending_messages()
             return
-        elif response_id == 'keep_alive':
+        elif response_id in ('keep_alive', 'set_framing'):
             return
         elif response_id == 'invoke_command':
             command_id = response.get('command_id')
@@ -294,10 +615,12 @@ class ViewerProcess(ProcessLineReceiver):
         elif response_id == 'render_error':
             if doc:
                 doc.errors.extend(response['error']['message'].split("\n"))
+            self.render_finished()
             return
         elif response_id == 'render_success':
             if doc:
                 doc.errors = []
+            self.render_finished()
             return
         elif response_id == 'capture_output':
             # Script output capture it
@@ -363,6 +686,14 @@ class ViewerProcess(ProcessLineReceiver):
         if not self.terminated:
             # Clear the filename on crash so it works when reset
             self.restart()
+            # The new viewer has nothing loaded so send the last render again
+            params = self._render_state
+            params.update(self._rendering)
+            params.update(self._render_pending)
+            self._render_state = {}
+            self._rendering = {}
+            self._render_pending = params
+            self.send_render()
         log.warning("renderer | stdout closed")
 
     def terminate(self):
@@ -432,9 +763,106 @@ class ViewerPlugin(Plugin):
     #: Default dir for screenshots
     screenshot_dir = Str().tag(config=True)
 
+    #: Number of idle viewer processes kept running so new viewers open
+    #: without waiting for the process to start
+    viewer_pool_size = Int(1).tag(config=True)
+
+    #: Seconds to wait before refilling the pool so spawning does not
+    #: compete with a viewer that was just claimed
+    viewer_pool_delay = Float(2)
+
+    #: Milliseconds to wait for more edits before rendering
+    render_delay = Int(250).tag(config=True)
+
     #: Exporters
     exporters = ContainerList()
 
+    #: Idle viewer processes
+    _viewer_pool = ContainerList()
+
+    #: Whether a refill of the pool is scheduled
+    _viewer_pool_scheduled = Bool()
+
+    def start(self):
+        super().start()
+        self.schedule_fill_viewer_pool()
+
+    def stop(self):
+        super().stop()
+        pool = self._viewer_pool[:]
+        self._viewer_pool = []
+        for process in pool:
+            try:
+                process.terminate()
+            except Exception as e:
+                log.exception(e)
+
+    # -------------------------------------------------------------------------
+    # Viewer pool
+    # -------------------------------------------------------------------------
+    def acquire_viewer(self):
+        """ Claim a viewer process from the pool. A process that has already
+        started and sent it's window id is preferred. If the pool is empty a
+        new process is created. The pool is then refilled in the background.
+
+        Returns
+        -------
+        process: ViewerProcess
+            The viewer process. If it was not taken from the pool it is not
+            started yet.
+
+        """
+        pool = self._viewer_pool
+        process = None
+        for p in pool:
+            if p.window_id:
+                process = p
+                break
+        if process is None and pool:
+            process = pool[0]
+        if process is not None:
+            pool.remove(process)
+            log.debug(f"viewer | claimed pooled viewer {process.process}")
+        else:
+            process = ViewerProcess(plugin=self)
+        self.schedule_fill_viewer_pool()
+        return process
+
+    def schedule_fill_viewer_pool(self):
+        if self._viewer_pool_scheduled:
+            return
+        self._viewer_pool_scheduled = True
+        timed_call(int(self.viewer_pool_delay*1000), self.fill_viewer_pool)
+
+    def fill_viewer_pool(self):
+        """ Start viewer processes until the pool is full. Only one process is
+        started at a time to avoid stalling the ui.
+
+        """
+        self._viewer_pool_scheduled = False
+        pool = self._viewer_pool
+        if len(pool) >= self.viewer_pool_size:
+            return
+        process = ViewerProcess(plugin=self)
+        pool.append(process)
+        process.restart()
+        if len(pool) < self.viewer_pool_size:
+            self.schedule_fill_viewer_pool()
+
+    @observe('viewer_pool_size')
+    def _update_viewer_pool_size(self, change):
+        pool = self._viewer_pool
+        while len(pool) > max(0, self.viewer_pool_size):
+            pool.pop().terminate()
+        self.schedule_fill_viewer_pool()
+
+    @observe('render_delay')
+    def _update_render_delay(self, change):
+        for viewer in self.get_viewers():
+            viewer.renderer.render_delay = self.render_delay
+        for process in self._viewer_pool:
+            process.render_delay = self.render_delay
+
     def get_viewer_members(self):
         for m in self.members().values():
             meta = m.metadata
@@ -459,7 +887,7 @@ class ViewerPlugin(Plugin):
         viewer = self.get_viewer()
         editor = self.workbench.get_plugin('declaracad.editor').get_editor()
         doc = editor.doc
-        viewer.renderer.set_source(editor.get_text())
+        viewer.renderer.request_render(source=editor.get_text())
         doc.version += 1
 
     def get_viewer(self, name=None):
@@ -471,10 +899,7 @@ class ViewerPlugin(Plugin):
 
     def _default_exporters(self):
         """ TODO: push to an ExtensionPoint """
-        from .exporters.stl.exporter import StlExporter
-        from .exporters.step.exporter import StepExporter
-        from .exporters.vrml.exporter import VrmlExporter
-        return [StlExporter, StepExporter, VrmlExporter]
+        return get_exporters()
 
     # -------------------------------------------------------------------------
     # Plugin commands
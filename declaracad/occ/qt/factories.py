@@ -10,6 +10,7 @@ Created on Dec 13, 2017
 @author: jrm
 """
 from enaml.qt.qt_factories import QT_FACTORIES
+from ..impl.occ_factories import OCC_FACTORIES
 
 
 def occ_viewer_factory():
@@ -22,6 +23,7 @@ def occ_viewer_clipped_plane_factory():
     return QtOccViewerClippedPlane
 
 
+QT_FACTORIES.update(OCC_FACTORIES)
 QT_FACTORIES.update({
     'OccViewer': occ_viewer_factory,
     'OccViewerClippedPlane': occ_viewer_clipped_plane_factory,
@@ -10,6 +10,7 @@ Created on Sep 26, 2016
 """
 import os
 import sys
+import time
 import logging
 import traceback
 from datetime import datetime
@@ -29,7 +30,8 @@ from OCCT import Aspect, Graphic3d, TopAbs, V3d
 from OCCT import __version__ as OCCT_VERSION
 
 from OCCT.AIS import (
-    AIS_InteractiveContext, AIS_Shape, AIS_Shaded, AIS_WireFrame
+    AIS_InteractiveContext, AIS_Shape, AIS_Shaded, AIS_WireFrame,
+    AIS_ConnectedInteractive
 )
 from OCCT.Aspect import (
     Aspect_DisplayConnection, Aspect_TOTP_LEFT_LOWER, Aspect_GFM_VER,
@@ -37,13 +39,6 @@ from OCCT.Aspect import (
 )
 from OCCT.Bnd import Bnd_Box
 from OCCT.BRepBndLib import BRepBndLib
-from OCCT.BRepBuilderAPI import (
-    BRepBuilderAPI_MakeEdge, BRepBuilderAPI_MakeEdge2d,
-    BRepBuilderAPI_MakeFace, BRepBuilderAPI_MakeShape,
-    BRepBuilderAPI_MakeVertex
-)
-from OCCT.Geom import Geom_Curve, Geom_Surface
-from OCCT.gp import gp_Pnt, gp_Dir, gp_Ax3
 from OCCT.Graphic3d import (
     Graphic3d_MaterialAspect, Graphic3d_StereoMode_QuadBuffer,
     Graphic3d_RM_RASTERIZATION, Graphic3d_RM_RAYTRACING,
@@ -51,18 +46,13 @@ from OCCT.Graphic3d import (
     Graphic3d_StructureManager, Graphic3d_Structure,
     Graphic3d_Camera
 )
-
-from OCCT.MeshVS import (
-    MeshVS_DA_DisplayNodes, MeshVS_DA_EdgeColor, MeshVS_Mesh,
-    MeshVS_MeshPrsBuilder
-)
 from OCCT.OpenGl import OpenGl_GraphicDriver
 from OCCT.Quantity import (
     Quantity_Color, Quantity_NOC_BLACK, Quantity_NOC_WHITE
 )
 from OCCT.Prs3d import Prs3d_Drawer
+from OCCT.StdPrs import StdPrs_ToolTriangulatedShape
 from OCCT.PrsMgr import PrsMgr_PresentationManager
-from OCCT.TopAbs import TopAbs_FACE, TopAbs_EDGE, TopAbs_WIRE
 from OCCT.TCollection import TCollection_AsciiString
 from OCCT.TopLoc import TopLoc_Location
 from OCCT.V3d import V3d_Viewer, V3d_View, V3d_TypeOfOrientation
@@ -72,7 +62,10 @@ from declaracad.occ.impl.utils import (
 )
 from declaracad.occ.impl.occ_shape import OccShape, OccPart
 from declaracad.occ.impl.occ_dimension import OccDimension
-from declaracad.occ.impl.occ_display import OccDisplayItem
+from declaracad.occ.impl.occ_mesh import MESH_CACHE
+from declaracad.occ.impl.occ_display import (
+    OccDisplayItem, OccDisplayToolpath
+)
 from declaracad.occ.widgets.occ_viewer import (
     ProxyOccViewer, ViewerSelection
 )
@@ -197,6 +190,7 @@ class QtViewer3d(QOpenGLWidget):
         view = self.proxy.v3d_view
         view.Redraw()
         view.SetZoom(1.25 if delta > 0 else 0.8)
+        self.proxy.update_level_of_detail()
 
     def dragMoveEvent(self, event):
         if self._fire_event('mouse_dragged', event):
@@ -240,6 +234,7 @@ class QtViewer3d(QOpenGLWidget):
             if self._zoom_area:
                 xmin, ymin, dx, dy = self._drawbox
                 view.WindowFit(xmin, ymin, xmin + dx, ymin + dy)
+                self.proxy.update_level_of_detail()
                 self._zoom_area = False
 
     def draw_box(self, event):
@@ -271,6 +266,7 @@ class QtViewer3d(QOpenGLWidget):
             view.Redraw()
             view.Zoom(abs(self.dragStartPos.x()), abs(self.dragStartPos.y()),
                       abs(pt.x()), abs(pt.y()))
+            self.proxy.update_level_of_detail()
             self.dragStartPos = pt
             self._drawbox = None
         # PAN
@@ -305,10 +301,39 @@ class QtOccViewer(QtControl, ProxyOccViewer):
 
     #: Displayed Shapes
     _displayed_shapes = Dict()
+
+    #: Shapes removed during an update which are still displayed so their
+    #: presentation can be reused. Maps the display key to the ais shape.
+    _removed_shapes = Dict()
+    _updating = Bool()
+
+    #: Presentations shared by shapes with the same geometry. Maps the
+    #: instance key to a list of [shape, ais shape, instance count, key].
+    #: These are not displayed themselves.
+    _instance_references = Dict()
+
+    #: Maps each shape displayed as an instance to it's reference
+    _instances = Dict()
+
+    #: References with no instances left during an update. They are kept
+    #: until the update is complete so re-added shapes can reuse them.
+    _released_instances = List()
     _displayed_dimensions = Dict()
     _displayed_graphics = Dict()
+    _displayed_toolpaths = List()
     _selected_shapes = List()
 
+    #: Index used to lookup which displayed shape a selected sub shape
+    #: belongs to. Maps the topology attr (eg faces) to a dict of the
+    #: partner hash of each sub shape to a list of (occ_shape, index, shape).
+    #: Each attr is built when first needed and the index is cleared when
+    #: the displayed shapes change.
+    _selection_index = Dict()
+
+    #: Maps each displayed ais shape, including instances, to it's shape.
+    #: It is built when first needed and cleared with the selection index.
+    _selection_owners = Dict()
+
     #: Errors
     errors = Dict()
 
@@ -347,6 +372,9 @@ class QtOccViewer(QtControl, ProxyOccViewer):
     #: Fired
     _redisplay_timer = Typed(QTimer, ())
 
+    #: Fired after zooming to update the level of detail of toolpaths
+    _lod_timer = Typed(QTimer, ())
+
     _qt_app = Property(lambda self: Application.instance()._qapp, cached=True)
 
     def get_shapes(self):
@@ -365,6 +393,11 @@ class QtOccViewer(QtControl, ProxyOccViewer):
         redisplay_timer.setInterval(8)
         redisplay_timer.timeout.connect(self.on_redisplay_requested)
 
+        lod_timer = self._lod_timer
+        lod_timer.setSingleShot(True)
+        lod_timer.setInterval(100)
+        lod_timer.timeout.connect(self.on_lod_requested)
+
     def init_viewer(self):
         """ Init viewer when the QOpenGLWidget is ready
 
@@ -517,12 +550,48 @@ class QtOccViewer(QtControl, ProxyOccViewer):
         displayed_shapes = self._displayed_shapes
         display = self.ais_context.Display
         qt_app = self._qt_app
+        removed_shapes = self._removed_shapes
+        self._selection_index = {}
+        self._selection_owners = {}
         occ_shape.displayed = True
-        for s in occ_shape.walk_shapes():
+        shapes = list(occ_shape.walk_shapes())
+        instanced = self._get_instanced_shapes(shapes)
+        for s in shapes:
+            # Display shapes with the same geometry as instances of one
+            # presentation
+            instance_key = instanced.get(s)
+            if instance_key is not None:
+                try:
+                    s.ais_shape = self._create_instance(s, instance_key)
+                    s.observe('ais_shape', self.on_ais_shape_changed)
+                    display(s.ais_shape, False)
+                    s.displayed = True
+                    displayed_shapes[s.shape] = s
+                except RuntimeError as e:
+                    log.exception(e)
+                continue
+
+            # Reuse the presentation of an identical shape that was removed
+            key = self._get_display_key(s) if removed_shapes else None
+            ais_shape = None
+            if key is not None and key in removed_shapes:
+                ais_shape = removed_shapes[key]
+                if ais_shape.Shape().IsSame(s.shape):
+                    del removed_shapes[key]
+                else:
+                    ais_shape = None
+            if ais_shape is not None:
+                s.ais_shape = ais_shape
+                s.observe('ais_shape', self.on_ais_shape_changed)
+                s.displayed = True
+                displayed_shapes[s.shape] = s
+                continue
+
             s.observe('ais_shape', self.on_ais_shape_changed)
             ais_shape = s.ais_shape
             if ais_shape is not None:
                 try:
+                    self.mesh_shape(s.shape)
                     display(ais_shape, False)
                     s.displayed = True
                     displayed_shapes[s.shape] = s
@@ -544,19 +613,51 @@ class QtOccViewer(QtControl, ProxyOccViewer):
 
         self._redisplay_timer.start()
 
+    def mesh_shape(self, shape):
+        """ Mesh the shape with the deflection the presentation would use
+        so the triangulation is shared with the exporters and is not
+        recomputed when the shape is displayed again.
+
+        Parameters
+        ----------
+        shape: TopoDS_Shape
+            The shape to mesh
+
+        """
+        drawer = self.prs3d_drawer
+        try:
+            deflection = StdPrs_ToolTriangulatedShape.GetDeflection_(
+                shape, drawer)
+            MESH_CACHE.mesh(shape, deflection, drawer.DeviationAngle())
+        except Exception as e:
+            # Let the presentation mesh it
+            log.debug(f"Failed to mesh shape: {e}")
+
     def _remove_shape_from_display(self, occ_shape):
         displayed_shapes = self._displayed_shapes
         remove = self.ais_context.Remove
+        self._selection_index = {}
+        self._selection_owners = {}
         occ_shape.displayed = False
         for s in occ_shape.walk_shapes():
             s.unobserve('ais_shape', self.on_ais_shape_changed)
             if s.get_member('ais_shape').get_slot(s) is None:
                 continue
             ais_shape = s.ais_shape
+            self._release_instance(s)
             if ais_shape is not None:
                 s.displayed = False
-                displayed_shapes.pop(ais_shape, None)
-                remove(ais_shape, False)
+                displayed_shapes.pop(s.shape, None)
+                key = None
+                if self._updating and isinstance(ais_shape, AIS_Shape):
+                    key = self._get_display_key(s)
+                if key is not None and key not in self._removed_shapes:
+                    # Keep it until the update is complete
+                    self._removed_shapes[key] = ais_shape
+                else:
+                    remove(ais_shape, False)
+                    if isinstance(ais_shape, AIS_Shape):
+                        MESH_CACHE.discard(ais_shape.Shape())
 
         if isinstance(occ_shape, OccPart):
             for d in occ_shape.declaration.traverse():
@@ -570,20 +671,200 @@ class QtOccViewer(QtControl, ProxyOccViewer):
 
         self._redisplay_timer.start()
 
+    def _get_display_key(self, occ_shape):
+        """ Generate a key which is equal for shapes that are displayed the
+        same way. Since hash codes can collide the shape must still be
+        checked with IsSame before the presentation is reused.
+
+        """
+        shape = occ_shape.shape
+        if shape is None or shape.IsNull():
+            return None
+        trsf = occ_shape.location.Transformation()
+        return (shape.HashCode(2**31-1),) + \
+            self._get_appearance_key(occ_shape) + \
+            (tuple(trsf.Value(i, j) for i in (1, 2, 3) for j in (1, 2, 3, 4)),)
+
+    def _get_instance_key(self, occ_shape):
+        """ Generate a key which is equal for shapes that have the same
+        geometry and appearance regardless of their location. Textured shapes
+        are not instanced.
+
+        """
+        shape = occ_shape.shape
+        if shape is None or shape.IsNull() or occ_shape.declaration.texture:
+            return None
+        return (self._get_partner_key(shape),) + \
+            self._get_appearance_key(occ_shape)
+
+    def _get_appearance_key(self, occ_shape):
+        """ Generate a key from the declaration members that change how a
+        shape is displayed.
+
+        """
+        d = occ_shape.declaration
+        m = d.material
+        t = d.texture
+        return (
+            d.color.argb if d.color else None,
+            d.transparency,
+            (m.name, m.transparency, m.shininess, m.refraction_index) +
+            tuple(c.argb if c else None for c in (
+                m.color, m.ambient_color, m.diffuse_color,
+                m.specular_color, m.emissive_color)) if m else None,
+            (t.path,) + tuple((p.enabled, p.u, p.v) for p in (
+                t.repeat, t.origin, t.scale)) if t else None,
+        )
+
+    def _get_instanced_shapes(self, shapes):
+        """ Find the shapes which should be displayed as instances. These
+        are shapes whose geometry is already displayed as an instance or is
+        used more than once.
+
+        Parameters
+        ----------
+        shapes: List[OccShape]
+            The shapes being displayed
+
+        Returns
+        -------
+        instanced: Dict[OccShape, Tuple]
+            The instance key of each shape to display as an instance.
+
+        """
+        groups = {}
+        for s in shapes:
+            key = self._get_instance_key(s)
+            if key is not None:
+                groups.setdefault(key, []).append(s)
+        references = self._instance_references
+        instanced = {}
+        for key, group in groups.items():
+            if len(group) > 1 or key in references:
+                for s in group:
+                    instanced[s] = key
+        return instanced
+
+    def _create_instance(self, occ_shape, key):
+        """ Create an instance of the presentation of the shape's geometry
+        placed at the location of the shape. The presentation is created the
+        first time the geometry is used.
+
+        Parameters
+        ----------
+        occ_shape: OccShape
+            The shape to display
+        key: Tuple
+            The instance key of the shape
+
+        Returns
+        -------
+        ais_shape: AIS_ConnectedInteractive
+            The instance to display.
+
+        """
+        shape = occ_shape.shape
+        entries = self._instance_references.setdefault(key, [])
+        for entry in entries:
+            s = entry[0]
+            if s.IsPartner(shape) and s.Orientation() == shape.Orientation():
+                entry[2] += 1
+                break
+        else:
+            s = shape.Located(TopLoc_Location())
+            self.mesh_shape(s)
+            entry = [s, occ_shape.create_ais_shape(s), 1, key]
+            entries.append(entry)
+        self._instances[occ_shape] = entry
+        location = occ_shape.location.Multiplied(shape.Location())
+        ais_shape = AIS_ConnectedInteractive()
+        ais_shape.Connect(entry[1], location.Transformation())
+        return ais_shape
+
+    def _release_instance(self, occ_shape):
+        """ Release the reference presentation used by the shape if it was
+        displayed as an instance. The presentation is dropped once no
+        instances use it. During an update it is kept until the update is
+        done in case the shape is displayed again.
+
+        """
+        entry = self._instances.pop(occ_shape, None)
+        if entry is None:
+            return
+        entry[2] -= 1
+        if entry[2] > 0:
+            return
+        if self._updating:
+            self._released_instances.append(entry)
+        else:
+            self._drop_instance_reference(entry)
+
+    def _drop_instance_reference(self, entry):
+        """ Remove the reference presentation if it has no instances """
+        if entry[2] > 0:
+            return
+        key = entry[3]
+        MESH_CACHE.discard(entry[0])
+        references = self._instance_references
+        entries = [e for e in references.get(key, []) if e is not entry]
+        if entries:
+            references[key] = entries
+        else:
+            references.pop(key, None)
+
+    def begin_update(self):
+        """ Keep shapes removed from the display until the update is done so
+        their presentations can be reused by identical shapes that are added.
+
+        """
+        self._updating = True
+
+    def end_update(self):
+        """ Remove any shapes removed during the update that were not
+        reused.
+
+        """
+        self._updating = False
+        released = self._released_instances
+        if released:
+            # Drop references that were not reused
+            for entry in released:
+                self._drop_instance_reference(entry)
+            self._released_instances = []
+        removed_shapes = self._removed_shapes
+        if removed_shapes:
+            remove = self.ais_context.Remove
+            for ais_shape in removed_shapes.values():
+                remove(ais_shape, False)
+                MESH_CACHE.discard(ais_shape.Shape())
+            log.debug(f"Removed {len(removed_shapes)} unused shapes")
+            self._removed_shapes = {}
+        self._redisplay_timer.start()
+
     def on_ais_shape_changed(self, change):
         ais_context = self.ais_context
         displayed_shapes = self._displayed_shapes
         occ_shape = change['object']
+        self._selection_index = {}
+        self._selection_owners = {}
         if change['type'] == 'update':
             old_ais_shape = change['oldvalue']
             if old_ais_shape is not None:
-                old_shape = old_ais_shape.Shape()
-                displayed_shapes.pop(old_shape, None)
+                if isinstance(old_ais_shape, AIS_Shape):
+                    displayed_shapes.pop(old_ais_shape.Shape(), None)
+                    MESH_CACHE.discard(old_ais_shape.Shape())
+                else:
+                    # An instance, the shape is no longer the same
+                    self._release_instance(occ_shape)
+                    for k, v in list(displayed_shapes.items()):
+                        if v is occ_shape:
+                            del displayed_shapes[k]
                 ais_context.Remove(old_ais_shape, False)
                 occ_shape.displayed = False
             new_ais_shape = change['value']
             if new_ais_shape is not None:
                 displayed_shapes[occ_shape.shape] = occ_shape
+                self.mesh_shape(occ_shape.shape)
                 ais_context.Display(new_ais_shape, False)
                 occ_shape.displayed = True
         self._redisplay_timer.start()
@@ -603,6 +884,14 @@ class QtOccViewer(QtControl, ProxyOccViewer):
         self._redisplay_timer.start()
 
     def _add_item_to_display(self, occ_disp_item):
+        if isinstance(occ_disp_item, OccDisplayToolpath):
+            # Toolpaths are drawn directly in the view
+            occ_disp_item.display(self.gfx_structure_manager,
+                                  self.v3d_view.Convert(1))
+            if occ_disp_item not in self._displayed_toolpaths:
+                self._displayed_toolpaths.append(occ_disp_item)
+            self._redisplay_timer.start()
+            return
         ais_object = occ_disp_item.item
         if ais_object is not None:
             self.ais_context.Display(ais_object, False)
@@ -610,12 +899,33 @@ class QtOccViewer(QtControl, ProxyOccViewer):
         self._redisplay_timer.start()
 
     def _remove_item_from_display(self, occ_disp_item):
+        if isinstance(occ_disp_item, OccDisplayToolpath):
+            occ_disp_item.erase()
+            if occ_disp_item in self._displayed_toolpaths:
+                self._displayed_toolpaths.remove(occ_disp_item)
+            self._redisplay_timer.start()
+            return
         ais_object = occ_disp_item.item
         if ais_object is not None:
             self.ais_context.Remove(ais_object, False)
             self._displayed_graphics.pop(ais_object, None)
         self._redisplay_timer.start()
 
+    def update_level_of_detail(self):
+        """ Queue an update of the level of detail after the zoom changes
+
+        """
+        if self._displayed_toolpaths:
+            self._lod_timer.start()
+
+    def on_lod_requested(self):
+        pixel_size = self.v3d_view.Convert(1)
+        redraw = False
+        for occ_disp_item in self._displayed_toolpaths:
+            redraw = occ_disp_item.set_pixel_size(pixel_size) or redraw
+        if redraw:
+            self.redraw()
+
     def on_redisplay_requested(self):
         self.ais_context.UpdateCurrentViewer()
 
@@ -860,6 +1170,7 @@ class QtOccViewer(QtControl, ProxyOccViewer):
 
     def zoom_factor(self, factor):
         self.v3d_view.SetZoom(factor)
+        self.update_level_of_detail()
 
     def rotate_view(self, x=0, y=0, z=0):
         self.v3d_view.Rotate(x, y, z, True)
@@ -872,6 +1183,7 @@ class QtOccViewer(QtControl, ProxyOccViewer):
         view.FitAll()
         view.ZFitAll()
         self.redraw()
+        self.update_level_of_detail()
 
     def fit_selection(self):
         if not self._selected_shapes:
@@ -886,6 +1198,7 @@ class QtOccViewer(QtControl, ProxyOccViewer):
         cx, cy = int(xmin+(xmax-xmin)/2), int(ymin+(ymax-ymin)/2)
         self.ais_context.MoveTo(cx, cy, view, True)
         view.WindowFit(xmin-pad, ymin-pad, xmax+pad, ymax+pad)
+        self.update_level_of_detail()
 
     def take_screenshot(self, filename):
         return self.v3d_view.Dump(filename)
@@ -913,10 +1226,9 @@ class QtOccViewer(QtControl, ProxyOccViewer):
         ais_context.InitSelected()
 
         # Lookup the shape declrations based on the selection context
+        t0 = time.perf_counter()
         selection = {}
         shapes = []
-        displayed_shapes = self._displayed_shapes
-        occ_shapes = set(self._displayed_shapes.values())
         while ais_context.MoreSelected():
             if ais_context.HasSelectedShape():
                 i = None
@@ -924,28 +1236,21 @@ class QtOccViewer(QtControl, ProxyOccViewer):
                 topods_shape = Topology.cast_shape(ais_context.SelectedShape())
                 shape_type = topods_shape.ShapeType()
                 attr = str(shape_type).split("_")[-1].lower() + 's'
-
-                # Try long lookup based on topology
-                for occ_shape in occ_shapes:
-                    shape_list = getattr(occ_shape.topology, attr, None)
-                    if not shape_list:
-                        continue
-                    for i, s in enumerate(shape_list):
-                        if topods_shape.IsPartner(s):
-                            found = True
-                            break
-                    if found:
-                        d = occ_shape.declaration
-                        shapes.append(topods_shape)
-                        # Insert what was selected into the options
-                        info = selection.get(d)
-                        if info is None:
-                            info = selection[d] = {}
-                        selection_info = info.get(attr)
-                        if selection_info is None:
-                            selection_info = info[attr] = {}
-                        selection_info[i] = topods_shape
-                        break
+                result = self._lookup_selection(
+                    ais_context.SelectedInteractive(), topods_shape, attr)
+                if result is not None:
+                    found = True
+                    occ_shape, i = result
+                    d = occ_shape.declaration
+                    shapes.append(topods_shape)
+                    # Insert what was selected into the options
+                    info = selection.get(d)
+                    if info is None:
+                        info = selection[d] = {}
+                    selection_info = info.get(attr)
+                    if selection_info is None:
+                        selection_info = info[attr] = {}
+                    selection_info[i] = topods_shape
 
                 # Mark it as found we don't know what shape it's from
                 if not found:
@@ -959,6 +1264,19 @@ class QtOccViewer(QtControl, ProxyOccViewer):
 
             ais_context.NextSelected()
 
+        # Toolpaths are not in the ais context so pick them separately
+        if pos and not area and self._displayed_toolpaths:
+            tolerance = 4 * view.Convert(1)
+            for occ_disp_item in self._displayed_toolpaths:
+                line = occ_disp_item.pick(view, pos[0], pos[1], tolerance)
+                if line:
+                    source = occ_disp_item.describe_line(line)
+                    selection[occ_disp_item.declaration] = {
+                        'lines': {line: source}}
+
+        log.debug(f"Selection of {len(shapes)} shapes took "
+                  f"{round(1000*(time.perf_counter()-t0), 3)}ms")
+
         if shift:
             ais_context.UpdateSelected(True)
         # Set selection
@@ -966,6 +1284,93 @@ class QtOccViewer(QtControl, ProxyOccViewer):
         self.declaration.selection = ViewerSelection(
             selection=selection, position=pos, area=area)
 
+    def _lookup_selection(self, ais_shape, shape, attr):
+        """ Find which displayed shape a selected sub shape belongs to.
+        Instances share the same geometry so the sub shape is only looked up
+        in the shape that owns the selected ais shape if it is known.
+
+        Parameters
+        ----------
+        ais_shape: AIS_InteractiveObject
+            The selected interactive object
+        shape: TopoDS_Shape
+            The selected sub shape
+        attr: String
+            The topology attribute of the sub shape type (eg faces)
+
+        Returns
+        -------
+        result: Tuple[OccShape, Int] or None
+            The shape and index of the sub shape in the topology attribute
+            or None if it is not found.
+
+        """
+        owners = self._selection_owners
+        if not owners:
+            for occ_shape in self._get_displayed_occ_shapes():
+                owners[occ_shape.ais_shape] = occ_shape
+        owner = owners.get(ais_shape) if ais_shape is not None else None
+
+        # Lookup the candidates by hash then check for a partner
+        index = self._get_selection_index(attr)
+        candidates = index.get(self._get_partner_key(shape), ())
+        for occ_shape, i, s in candidates:
+            if owner is not None and occ_shape is not owner:
+                continue
+            if shape.IsPartner(s):
+                return (occ_shape, i)
+
+    def _get_displayed_occ_shapes(self):
+        """ Get the displayed shapes including each instance """
+        shapes = set(self._displayed_shapes.values())
+        shapes.update(self._instances.keys())
+        return shapes
+
+    def _get_partner_key(self, shape):
+        """ Get a hash that is equal for shapes that are partners (share the
+        same TShape) regardless of their location and orientation.
+
+        """
+        return shape.Located(TopLoc_Location()).HashCode(2**31-1)
+
+    def _get_selection_index(self, attr):
+        """ Get the index of every sub shape of the given type in the displayed
+        shapes. It is built the first time it is needed after the displayed
+        shapes change.
+
+        Parameters
+        ----------
+        attr: String
+            The topology attribute of the sub shape type (eg faces)
+
+        Returns
+        -------
+        index: Dict
+            Maps the partner key to a list of (occ_shape, index, shape)
+
+        """
+        index = self._selection_index.get(attr)
+        if index is not None:
+            return index
+        t0 = time.perf_counter()
+        index = self._selection_index[attr] = {}
+        get_key = self._get_partner_key
+        count = 0
+        for occ_shape in self._get_displayed_occ_shapes():
+            shape_list = getattr(occ_shape.topology, attr, None)
+            if not shape_list:
+                continue
+            for i, s in enumerate(shape_list):
+                key = get_key(s)
+                candidates = index.get(key)
+                if candidates is None:
+                    candidates = index[key] = []
+                candidates.append((occ_shape, i, s))
+                count += 1
+        log.debug(f"Indexed {count} {attr} for selection in "
+                  f"{round(1000*(time.perf_counter()-t0), 3)}ms")
+        return index
+
     def update_display(self, change=None):
         """ Queue an update request """
         self._redisplay_timer.start()
@@ -976,16 +1381,36 @@ class QtOccViewer(QtControl, ProxyOccViewer):
         remove = self.ais_context.Remove
         for occ_shape in self._displayed_shapes.values():
             remove(occ_shape.ais_shape, False)
+            MESH_CACHE.discard(occ_shape.shape)
+        for occ_shape in self._instances.keys():
+            # Instances of the same shape share a key in the displayed shapes
+            remove(occ_shape.ais_shape, False)
         for ais_dim in self._displayed_dimensions.keys():
             remove(ais_dim, False)
         for ais_item in self._displayed_graphics.keys():
             remove(ais_item, False)
+        for ais_shape in self._removed_shapes.values():
+            remove(ais_shape, False)
+            MESH_CACHE.discard(ais_shape.Shape())
+        for entries in self._instance_references.values():
+            for entry in entries:
+                MESH_CACHE.discard(entry[0])
+        for occ_disp_item in self._displayed_toolpaths:
+            occ_disp_item.erase()
+        self._displayed_toolpaths = []
+        self._removed_shapes = {}
+        self._instances = {}
+        self._instance_references = {}
+        self._released_instances = []
+        self._selection_index = {}
+        self._selection_owners = {}
         self.gfx_structure.Clear()
         self.ais_context.UpdateCurrentViewer()
 
     def reset_view(self):
         """ Reset to default zoom and orientation """
         self.v3d_view.Reset()
+        self.update_level_of_detail()
 
     @contextmanager
     def redraw_blocked(self):
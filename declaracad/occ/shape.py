@@ -11,11 +11,13 @@ Created on Sep 30, 2016
 @author: jrm
 """
 import math
+import threading
 from math import pi
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
 from atom.api import (
-    Atom, Tuple, Instance, Bool, Str, Float, FloatRange, Property, Coerced,
-    Typed, ForwardTyped, List, Enum, Event, Value, Subclass,
-    observe, set_default
+    Atom, Tuple, Instance, Bool, Str, Int, Float, FloatRange, Property,
+    Coerced, Typed, ForwardTyped, List, Enum, Event, Value, Subclass,
+    Callable, observe, set_default
 )
 from enaml.application import Application
 from enaml.core.declarative import d_, d_func
@@ -36,6 +38,110 @@ from .geom import (
 )
 
 
+class BuildCancelled(Exception):
+    """ Raised in the thread building a model when the build is cancelled
+
+    """
+
+
+class BuildMonitor(Atom):
+    """ Tracks the progress of building the shapes of a model and allows
+    the build to be cancelled. Use it as a context manager in the thread
+    doing the build.
+
+    """
+    #: Set to cancel the build the next time a shape is built
+    cancelled = Bool()
+
+    #: Estimated number of shapes to build
+    total = Int()
+
+    #: Number of shapes built
+    built = Int()
+
+    #: Called with the progress in percent when it changes
+    callback = Callable()
+
+    #: Called with a list of TopoDS_Shapes which can be displayed before
+    #: the build is complete, for example while a large file is imported
+    partial = Callable()
+
+    #: Last progress reported
+    progress = Int()
+
+    #: Monitor of the build running in the current thread
+    _local = threading.local()
+
+    @classmethod
+    def current(cls):
+        """ Get the monitor of the build in this thread if any """
+        return getattr(cls._local, 'monitor', None)
+
+    def __enter__(self):
+        BuildMonitor._local.monitor = self
+        return self
+
+    def __exit__(self, *args):
+        BuildMonitor._local.monitor = None
+
+    def check(self):
+        """ Raise BuildCancelled if the build was cancelled """
+        if self.cancelled:
+            raise BuildCancelled()
+
+    def step(self):
+        """ Mark a shape as built and report the progress """
+        self.check()
+        self.built += 1
+        self.update(100 * self.built / (self.total or 1))
+
+    def update(self, progress):
+        """ Report the progress in percent """
+        progress = min(100, int(progress))
+        if progress != self.progress:
+            self.progress = progress
+            if self.callback is not None:
+                self.callback(progress)
+
+    def show_partial(self, shapes):
+        """ Report shapes that can be displayed before the build is done """
+        if self.partial is not None:
+            self.partial(list(shapes))
+
+
+def process_events():
+    """ Process pending UI events so the UI does not freeze while a model
+    is built. This does nothing if the model is built in a background thread.
+
+    """
+    app = Application.instance()
+    if app is not None and threading.current_thread() is \
+            threading.main_thread():
+        app.process_events()
+
+
+#: Marks the worker threads of a parallel build
+_parallel_build = threading.local()
+
+
+def in_parallel_build():
+    """ Check if the current thread is a worker of a parallel build. Shapes
+    built on workers may share their inputs with other shapes being built at
+    the same time so the inputs must not be modified.
+
+    """
+    return getattr(_parallel_build, 'active', False)
+
+
+def activate_on_worker(node):
+    """ Run the bottom-up activation of the node on a worker thread """
+    _parallel_build.active = True
+    try:
+        node.activate_bottom_up()
+    finally:
+        _parallel_build.active = False
+
+
 class ProxyShape(ProxyControl):
     #: A reference to the Shape declaration.
     declaration = ForwardTyped(lambda: Shape)
@@ -442,6 +548,11 @@ class Shape(ToolkitObject):
         times and should not normally need to be invoked by user code.
 
         """
+        monitor = BuildMonitor.current()
+        if monitor is not None:
+            monitor.check()
+        if settings.workers > 1 and not isinstance(self.parent, Shape):
+            return self.activate_proxy_parallel(settings.workers)
         self.activate_top_down()
         for child in self.children:
             # Make sure each is initialized upon activation
@@ -453,11 +564,130 @@ class Shape(ToolkitObject):
 
         # Generating the model can take a lot of time
         # so process events inbetween to keep the UI from freezing
-        Application.instance().process_events()
+        process_events()
 
         self.activate_bottom_up()
         self.proxy_is_active = True
         self.activated()
+        if monitor is not None:
+            monitor.step()
+
+    def activate_proxy_parallel(self, workers):
+        """ Activate the proxy tree building independent shapes concurrently.
+
+        The top-down pass is done sequentially. The bottom-up pass, where
+        operations are computed, is done on a pool of worker threads as
+        soon as all the shapes a node depends on are built. Change
+        notifications of each proxy are suppressed while it is built and
+        replayed on the main thread when it completes.
+
+        Parameters
+        ----------
+        workers: Int
+            The number of worker threads to use.
+
+        """
+        nodes = []
+        self._activate_top_down_tree(nodes)
+
+        pending = set(nodes)
+        waiting = {}
+        dependents = {node: [] for node in nodes}
+        for node in nodes:
+            deps = waiting[node] = node._get_dependencies(pending)
+            for dep in deps:
+                dependents[dep].append(node)
+
+        monitor = BuildMonitor.current()
+        with ThreadPoolExecutor(workers) as pool:
+            futures = {}
+
+            def submit(node):
+                node.proxy.set_notifications_enabled(False)
+                futures[pool.submit(activate_on_worker, node)] = node
+
+            for node in nodes:
+                if not waiting[node]:
+                    submit(node)
+
+            try:
+                while futures:
+                    done, _ = wait(
+                        futures, timeout=0.1, return_when=FIRST_COMPLETED)
+
+                    # Generating the model can take a lot of time
+                    # so process events inbetween to keep the UI from freezing
+                    process_events()
+
+                    for f in done:
+                        node = futures.pop(f)
+                        proxy = node.proxy
+                        shape = proxy.shape
+                        del proxy.shape
+                        proxy.set_notifications_enabled(True)
+                        f.result()
+
+                        # Notify observers from the thread that started the
+                        # build instead of the worker
+                        if shape is not None:
+                            proxy.shape = shape
+                        node.proxy_is_active = True
+                        node.activated()
+                        if monitor is not None:
+                            monitor.step()
+
+                        for parent in dependents[node]:
+                            deps = waiting[parent]
+                            deps.discard(node)
+                            if not deps:
+                                submit(parent)
+            finally:
+                # If a build failed let the ones still running finish then
+                # restore their notifications
+                wait(futures)
+                for node in futures.values():
+                    node.proxy.set_notifications_enabled(True)
+
+        # Anything left has a circular reference so build it sequentially
+        for node in nodes:
+            if not node.proxy_is_active:
+                node.activate_bottom_up()
+                node.proxy_is_active = True
+                node.activated()
+
+    def _activate_top_down_tree(self, nodes):
+        """ Run the top-down pass over the shape tree adding each shape to
+        the list of nodes in the order they would be activated.
+
+        """
+        self.activate_top_down()
+        for child in self.children:
+            if not child.is_initialized:
+                child.initialize()
+            if isinstance(child, Shape):
+                if not child.proxy_is_active:
+                    child._activate_top_down_tree(nodes)
+            elif isinstance(child, ToolkitObject):
+                if not child.proxy_is_active:
+                    child.activate_proxy()
+        nodes.append(self)
+
+    def _get_dependencies(self, nodes):
+        """ Get the set of nodes this shape depends on. This includes the
+        child shapes and any shapes referenced by a declaration member.
+
+        """
+        deps = set(c for c in self.children if c in nodes)
+        for name, m in self.members().items():
+            if not m.metadata or not m.metadata.get('d_member'):
+                continue
+            if isinstance(m, (Property, Event)):
+                continue
+            value = getattr(self, name)
+            if isinstance(value, Shape) and value in nodes:
+                deps.add(value)
+        deps.discard(self)
+        return deps
 
     def render(self):
         """ Generates and returns the actual shape from the declaration.
@@ -474,6 +704,9 @@ class Shape(ToolkitObject):
             self.initialize()
         if not self.proxy_is_active:
             self.activate_proxy()
+        # Apply any changes waiting to be rebuilt
+        from .impl.occ_update import UPDATE_SCHEDULER
+        UPDATE_SCHEDULER.flush_main_thread()
         return self.proxy.shape
 
 
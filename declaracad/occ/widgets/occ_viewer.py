@@ -219,6 +219,12 @@ class ProxyOccViewer(ProxyControl):
     def update_display(self):
         raise NotImplementedError
 
+    def begin_update(self):
+        raise NotImplementedError
+
+    def end_update(self):
+        raise NotImplementedError
+
 
 class OccViewer(Control):
     """ A widget to view OpenCascade shapes.
@@ -385,3 +391,17 @@ class OccViewer(Control):
     def update_display(self):
         """ Trigger an update of the display """
         self.proxy.update_display()
+
+    def begin_update(self):
+        """ Keep shapes removed from the display until `end_update` is called
+        so the presentation of unchanged shapes can be reused.
+        """
+        if self.proxy_is_active:
+            self.proxy.begin_update()
+
+    def end_update(self):
+        """ Remove any shapes removed since `begin_update` that were not
+        reused.
+        """
+        if self.proxy_is_active:
+            self.proxy.end_update()
@@ -26,6 +26,7 @@ requirements = [
     'PyQtWebEngine',
     'service_identity',
     'ezdxf',
+    'numpy',
 ]
 
 
@@ -24,3 +24,143 @@ def test_app():
     #for line in stdout.split(b"\n"):
     #    print(stdout)
     assert b'Workbench stopped' in stdout
+
+
+def test_framing():
+    from declaracad.core.framing import FrameDecoder, encode_frame
+    msg = {'id': 1, 'result': 'x' * 100000}
+    data = b'print output\n' + encode_frame(msg) + encode_frame({'id': 2})
+    decoder = FrameDecoder()
+    messages = []
+    for i in range(0, len(data), 1000):
+        messages.extend(decoder.feed(data[i:i+1000]))
+    assert messages == [(False, 'print output'), (True, msg),
+                        (True, {'id': 2})]
+
+
+def test_render_queue(qt_app):
+    from declaracad.occ.plugin import ViewerProcess
+    sent = []
+
+    class Viewer(ViewerProcess):
+        def set_filename(self, filename):
+            sent.append(('filename', filename))
+
+        def set_source(self, source):
+            sent.append(('source', source))
+
+        def set_version(self, version):
+            sent.append(('version', version))
+
+    viewer = Viewer(document=None)
+    for version in range(1, 5):
+        viewer.request_render(filename='test.enaml', version=version)
+    assert sent == []
+    viewer._render_debounced(viewer._render_timer)
+
+    # Intermediate versions are dropped
+    assert sent == [('filename', 'test.enaml'), ('version', 4)]
+    assert viewer.renders_dropped == 3
+
+    # Only one render is sent until the viewer replies
+    viewer.request_render(source='x')
+    viewer.request_render(version=5)
+    viewer._render_debounced(viewer._render_timer)
+    assert len(sent) == 2
+    assert viewer.render_queue == 2
+    viewer.message_received({'id': 'render_success'}, '')
+    assert sent[2:] == [('source', 'x'), ('version', 5)]
+    assert viewer.render_queue == 1
+    viewer.message_received({'id': 'render_success'}, '')
+    assert viewer.render_queue == 0
+
+
+def test_capture_thread_output():
+    import threading
+    from declaracad.core.utils import capture_thread_output
+    captured = []
+
+    def worker(started, done):
+        with capture_thread_output() as stdout:
+            print("from worker")
+            started.set()
+            done.wait()
+        captured.append(stdout.getvalue())
+
+    started, done = threading.Event(), threading.Event()
+    t = threading.Thread(target=worker, args=(started, done))
+    t.start()
+    started.wait()
+    # Output of other threads is not captured
+    print("from main")
+    done.set()
+    t.join()
+    assert captured == ["from worker\n"]
+
+
+def test_batch_export(tmpdir):
+    import json
+    from declaracad.apps.batch_exporter import load_manifest
+    source = """
+from declaracad.occ.api import Part, Box
+
+enamldef Assembly(Part):
+    Box:
+        pass
+"""
+    for path in ('a/model.enaml', 'b/model.enaml'):
+        tmpdir.join(path).write(source, ensure=True)
+    manifest = tmpdir.join('manifest.json')
+    manifest.write(json.dumps({
+        "files": ["**/*.enaml"],
+        "exporters": [{"type": "stl"}],
+        "output_dir": "build",
+        "summary": "build/summary.json",
+    }))
+    m = load_manifest(str(manifest))
+    assert len(m['files']) == 2
+    assert m['output_dirs'] == [str(tmpdir.join('build', 'a')),
+                                str(tmpdir.join('build', 'b'))]
+
+    # Without an output_dir each model is exported next to it's source
+    nearby = tmpdir.join('nearby.json')
+    nearby.write(json.dumps({
+        "files": ["a/*.enaml", "b/*.enaml"],
+        "exporters": [{"type": "stl"}],
+    }))
+    assert load_manifest(str(nearby))['output_dirs'] == [None, None]
+
+    # Models outside the manifest directory with the same name would be
+    # exported to the same path
+    other = tmpdir.join('c', 'manifest.json')
+    other.write(json.dumps({
+        "files": ["../a/*.enaml", "../b/*.enaml"],
+        "exporters": [{"type": "stl"}],
+        "output_dir": "build",
+    }), ensure=True)
+    with pytest.raises(ValueError):
+        load_manifest(str(other))
+
+    subprocess.check_call([sys.executable, '-m', 'declaracad',
+                           'export-batch', str(manifest), '-j', '2',
+                           '-t', '120'])
+    assert tmpdir.join('build', 'a', 'model.stl').exists()
+    assert tmpdir.join('build', 'b', 'model.stl').exists()
+    summary = json.loads(tmpdir.join('build', 'summary.json').read())
+    assert summary['failures'] == []
+
+
+def test_viewer_started_once(qt_app):
+    from declaracad.occ.plugin import ViewerProcess
+
+    class Viewer(ViewerProcess):
+        async def start(self):
+            pass
+
+    # A viewer claimed from the pool before it's start completed is not
+    # started again
+    viewer = Viewer(document=None)
+    viewer.ensure_started()
+    assert viewer.starting and viewer.restarts == 1
+    viewer.ensure_started()
+    assert viewer.restarts == 1
@@ -1,4 +1,6 @@
+import sys
 import pytest
+import subprocess
 from textwrap import dedent
 
 from OCCT.TopoDS import TopoDS_Shape
@@ -156,6 +158,19 @@ TESTS = {
         Box:
             position = (0.5, 0.5, 0)
     """,
+'cut-parallel': """
+    Cut:
+        parallel = True
+        fuzzy_value = 1e-5
+        Box:
+            dx = 4
+        Cylinder:
+            radius = 0.25
+            position = (1, 0.5, 0)
+        Cylinder:
+            radius = 0.25
+            position = (3, 0.5, 0)
+    """,
 'fuse': """
     Fuse:
         Box:
@@ -179,8 +194,258 @@ def test_shapes_render(qt_app, name):
     assert isinstance(assembly.render(), TopoDS_Shape)
 
 
+def test_shape_cache(qt_app, tmpdir):
+    from declaracad.occ.impl.occ_cache import SHAPE_CACHE
+    source = TEMPLATE % TESTS['cut']
+    path = SHAPE_CACHE.path
+    try:
+        SHAPE_CACHE.path = str(tmpdir)
+        SHAPE_CACHE.clear()
+        SHAPE_CACHE.hits = 0
+        load_model("test", source)[0].render()
+        assert SHAPE_CACHE.hits == 0
+        assembly = load_model("test", source)[0]
+        assert isinstance(assembly.render(), TopoDS_Shape)
+        assert SHAPE_CACHE.hits > 0
+    finally:
+        SHAPE_CACHE.path = path
+
+
+def test_shape_cache_threads(qt_app, tmpdir):
+    from concurrent.futures import ThreadPoolExecutor
+    from declaracad.occ.impl.occ_cache import ShapeCache
+    shape = load_model("test", TEMPLATE % TESTS['box1'])[0].render()
+    cache = ShapeCache(path=str(tmpdir), memory_size=2)
+
+    # Workers saving and loading the same keys do not conflict
+    def build(i):
+        key = 'key-%s' % (i % 3)
+        cache.save(key, shape)
+        cache.load(key)
+
+    with ThreadPoolExecutor(8) as pool:
+        list(pool.map(build, range(64)))
+    assert sorted(tmpdir.listdir(lambda p: p.ext == '.tmp')) == []
+    assert ShapeCache(path=str(tmpdir)).load('key-0') is not None
+
+
+def test_coalesced_updates(qt_app):
+    from declaracad.occ.impl.occ_update import UPDATE_SCHEDULER
+    assembly = load_model("test", TEMPLATE % TESTS['cut'])[0]
+    assembly.render()
+    cut = assembly.children[0]
+    box = cut.children[0]
+    UPDATE_SCHEDULER.rebuilds = 0
+    box.dx = 2
+    box.dy = 2
+    box.dz = 2
+    assert UPDATE_SCHEDULER.rebuilds == 0
+    UPDATE_SCHEDULER.flush()
+
+    # The box, cut and assembly are only rebuilt once
+    assert UPDATE_SCHEDULER.rebuilds == 3
+    assert box.bbox.dx == pytest.approx(2, abs=1e-3)
+
+    # Render applies pending changes
+    box.dx = 5
+    assert box.render() is box.proxy.shape
+    assert UPDATE_SCHEDULER.rebuilds == 6
+    assert box.bbox.dx == pytest.approx(5, abs=1e-3)
+
+
+def test_parallel_render(qt_app, tmpdir):
+    from declaracad.occ.geom import settings
+    from declaracad.occ.impl.occ_cache import SHAPE_CACHE
+    source = TEMPLATE % TESTS['cut-parallel']
+    path = SHAPE_CACHE.path
+    try:
+        SHAPE_CACHE.path = str(tmpdir)
+        SHAPE_CACHE.clear()
+        expected = load_model("test", source)[0]
+        expected.render()
+
+        # Clear the cache so the shapes are built on the workers
+        SHAPE_CACHE.clear()
+        SHAPE_CACHE.hits = 0
+        settings.workers = 4
+        assembly = load_model("test", source)[0]
+        assert isinstance(assembly.render(), TopoDS_Shape)
+        assert SHAPE_CACHE.hits == 0
+        assert assembly.proxy_is_active
+        assert assembly.bbox.dx == pytest.approx(expected.bbox.dx)
+    finally:
+        settings.workers = 0
+        SHAPE_CACHE.path = path
+
+
+def test_build_cancelled(qt_app):
+    from declaracad.occ.shape import Shape, BuildMonitor, BuildCancelled
+    assembly = load_model("test", TEMPLATE % TESTS['cut'])[0]
+    with BuildMonitor(cancelled=True):
+        with pytest.raises(BuildCancelled):
+            assembly.render()
+
+    # Progress is reported as each shape is built
+    progress = []
+    assembly = load_model("test", TEMPLATE % TESTS['cut'])[0]
+    total = len([d for d in assembly.traverse() if isinstance(d, Shape)])
+    monitor = BuildMonitor(total=total, callback=progress.append)
+    with monitor:
+        assert isinstance(assembly.render(), TopoDS_Shape)
+    assert monitor.built == total
+    assert progress[-1] == 100
+
+
+def test_model_loader(qt_app):
+    import time
+    from declaracad.occ.plugin import ModelLoader
+    loader = ModelLoader()
+    results = []
+    source = TEMPLATE % TESTS['box1']
+
+    # Loading the same version again supersedes the first build
+    loader.load("test", source, 1, lambda *args: results.append(args))
+    loader.load("test", source, 1, lambda *args: results.append(args))
+    start = time.time()
+    while loader.loading and time.time() - start < 30:
+        qt_app.process_events()
+        time.sleep(0.01)
+    qt_app.process_events()
+    assert not loader.loading
+    assert len(results) == 1
+    parts, error, output = results[0]
+    assert error is None and len(parts) == 1
+
+
+def test_mesh_cache(qt_app):
+    from declaracad.occ.impl.occ_mesh import MeshCache
+    cache = MeshCache()
+    shape = load_model("test", TEMPLATE % TESTS['box1'])[0].render()
+    cache.mesh(shape, 0.1)
+    assert cache.misses == 6 and cache.hits == 0
+
+    # Already meshed faces are reused
+    cache.mesh(shape, 0.1)
+    assert cache.misses == 6 and cache.hits == 6
+    cache.mesh(shape, 0.01)
+    cache.mesh(shape, 0.1)
+    assert cache.misses == 12 and cache.hits == 12
+
+    # Removed shapes are no longer kept
+    assert cache.triangles > 0
+    cache.discard(shape)
+    assert cache.triangles == 0 and not cache._faces
+
+    # The cache is bounded by the number of triangles
+    cache.max_triangles = 12
+    cache.mesh(shape, 0.1)
+    cache.mesh(shape, 0.01)
+    assert 0 < cache.triangles <= 12
+
+
+def test_stl_export(qt_app, tmpdir):
+    import struct
+    from declaracad.occ.exporters.stl.exporter import StlExporter
+    parts = load_model("test", TEMPLATE % TESTS['box1'])
+    path = str(tmpdir.join('box.stl'))
+    StlExporter(filename="test", path=path).export(parts)
+    with open(path, 'rb') as f:
+        data = f.read()
+    count = struct.unpack('<I', data[80:84])[0]
+    assert count == 12
+    assert len(data) == 84 + 50 * count
+
+    StlExporter(filename="test", path=path, split='solid').export(parts)
+    assert tmpdir.join('box-0.stl').exists()
+
+
+def test_gltf_export(qt_app, tmpdir):
+    import json
+    import struct
+    from declaracad.occ.exporters.gltf.exporter import GltfExporter
+    source = TEMPLATE % """
+    Looper:
+        iterable = range(3)
+        Part:
+            position = (loop.index * 10, 0, 0)
+            Cylinder:
+                radius = 2
+                height = 5
+    """
+    parts = load_model("test", source)
+    path = str(tmpdir.join('model.glb'))
+    GltfExporter(filename="test", path=path).export(parts)
+    with open(path, 'rb') as f:
+        data = f.read()
+    magic, version, length = struct.unpack('<III', data[:12])
+    assert version == 2 and length == len(data)
+    size = struct.unpack('<I', data[12:16])[0]
+    gltf = json.loads(data[20:20+size])
+
+    # The repeated cylinder is only written once
+    assert len(gltf['meshes']) == 1
+    assert len([n for n in gltf['nodes'] if 'mesh' in n]) == 3
+
+
+def test_instanced_display(qt_app):
+    from OCCT.Prs3d import Prs3d_Drawer
+    from declaracad.occ.qt.qt_occ_viewer import QtOccViewer
+    source = TEMPLATE % """
+    Looper:
+        iterable = range(3)
+        Part:
+            position = (loop.index * 10, 0, 0)
+            Cylinder:
+                radius = 2
+                height = 5
+    Box:
+        pass
+    """
+    assembly = load_model("test", source)[0]
+    assembly.render()
+    shapes = list(assembly.proxy.walk_shapes())
+    viewer = QtOccViewer(prs3d_drawer=Prs3d_Drawer())
+
+    # Only the repeated cylinder is instanced
+    instanced = viewer._get_instanced_shapes(shapes)
+    assert len(instanced) == 3
+    for s, key in instanced.items():
+        s.ais_shape = viewer._create_instance(s, key)
+    references = viewer._instance_references
+    assert len(references) == 1
+    entry = list(references.values())[0][0]
+    assert entry[2] == 3
 
+    # Selecting a face of any instance finds that instance
+    for s in instanced:
+        face = s.topology.faces[1]
+        assert viewer._lookup_selection(s.ais_shape, face, 'faces') == (s, 1)
 
+    # References released during an update are kept until it's done
+    viewer.begin_update()
+    for s in instanced:
+        viewer._release_instance(s)
+    assert entry[2] == 0 and len(references) == 1
+    s, key = list(instanced.items())[0]
+    viewer._create_instance(s, key)
+    viewer.end_update()
+    assert entry[2] == 1 and len(references) == 1
 
+    # Otherwise it is dropped with the last instance
+    viewer._release_instance(s)
+    assert references == {}
 
 
+def test_headless():
+    # Must run in a new process since only one application can exist
+    script = dedent("""
+    import sys
+    from declaracad import occ
+    from declaracad.occ.plugin import load_model
+    app = occ.install_headless()
+    source = '''%s'''
+    assembly = load_model("test", source)[0]
+    assert assembly.render() is not None
+    assert 'enaml.qt' not in sys.modules
+    """) % (TEMPLATE % TESTS['cut'])
+    subprocess.check_call([sys.executable, '-c', script])
@@ -1,3 +1,22 @@
 
 def test_load_dxf():
     pass
+
+
+def test_load_step(qt_app, tmpdir):
+    from declaracad.occ.impl.occ_cache import SHAPE_CACHE
+    from declaracad.occ.importers.step import load_step
+    filename = 'examples/models/as1_pe_203.stp'
+    path = SHAPE_CACHE.path
+    try:
+        SHAPE_CACHE.path = str(tmpdir)
+        SHAPE_CACHE.clear()
+        shapes = load_step(filename)
+        assert shapes
+
+        # The second load is read from the cache
+        SHAPE_CACHE.hits = 0
+        assert len(load_step(filename)) == len(shapes)
+        assert SHAPE_CACHE.hits == 1
+    finally:
+        SHAPE_CACHE.path = path
@@ -1,6 +1,7 @@
 import os
 import pytest
 from declaracad.cnc import gcode
+from declaracad.occ.api import Point
 
 
 @pytest.mark.parametrize('name', os.listdir('examples/gcode'))
@@ -8,4 +9,205 @@ def test_gcode(name):
     path = 'examples/gcode/%s' % name
     data = gcode.parse(path)
     assert len(data.commands) > 0
+    assert len(data) == len(data.commands)
 
+
+def test_gcode_columns():
+    path = 'examples/gcode/Alien.gcode'
+    data = gcode.parse(path)
+    commands = list(gcode.iter_commands(path))
+    for i in (0, len(commands) // 2, len(commands) - 1):
+        cmd = data.command(i)
+        assert cmd.id == commands[i].id
+        assert cmd.data == commands[i].data
+    xs = [c.data['X'] for c in commands if c.data and 'X' in c.data]
+    assert data.max().x == max(xs)
+    assert data.min().x == min(xs)
+
+
+
+def test_discretize_array():
+    from declaracad.occ.api import Topology, Polyline
+    from declaracad.cnc.interpolate import distance
+    shape = Polyline(points=[(0, 0, 0), (10, 0, 0), (10, 10, 0)]).render()
+    points = Topology.discretize_array(shape, 0.01)
+    expected = Topology.discretize(shape, 0.01)
+    assert points.shape == (len(expected), 3)
+    assert points[-1].tolist() == pytest.approx(expected[-1][:])
+    assert gcode.Movement(points=points).length() == pytest.approx(20)
+    distance(points, 0, 1)
+    assert points[0, 2] == 0 and points[-1, 2] == pytest.approx(-1)
+
+
+def test_split_wires():
+    from declaracad.occ.api import Polyline
+    from declaracad.cnc import interpolate
+    wires = [
+        Polyline(points=[(0, 0, 0), (10, 0, 0), (20, 0, 0)]).render(),
+        Polyline(points=[(10, 0, 0), (10, 10, 0)]).render(),
+    ]
+    graph = interpolate.build_edge_graph(wires)
+    assert len(graph) == 4
+    vertex, edges = interpolate.lookup_vertex(graph, Point(10, 1e-9, 0))
+    assert len(edges) == 3
+    assert len(list(interpolate.split_wires(graph))) == 3
+
+
+def test_optimize_moves():
+    import numpy as np
+    from declaracad.occ.api import Polyline
+    from declaracad.cnc.optimize import (
+        optimize_moves, optimize_graph, get_endpoints
+    )
+
+    def travel(wires):
+        starts, ends = get_endpoints(wires)
+        # From the origin to the first wire then between each wire
+        return np.linalg.norm(starts[0]) + np.linalg.norm(
+            starts[1:] - ends[:-1], axis=1).sum()
+
+    # Lines spaced along x alternating direction
+    wires = [
+        Polyline(points=[(x, 0, 0), (x, 10, 0)][::1 if i % 2 else -1]).render()
+        for i, x in enumerate((0, 30, 10, 20))
+    ]
+    result = optimize_moves(wires, Point(0, 0, 0), optimizer_timeout=5)
+    assert len(result) == len(wires)
+
+    # The lines are cut in order along x zig zagging up and down
+    starts, ends = get_endpoints(result)
+    assert starts[:, 0].tolist() == pytest.approx([0, 10, 20, 30])
+    assert starts[:, 1].tolist() == pytest.approx([0, 10, 0, 10])
+    assert travel(result) == pytest.approx(30)
+    assert travel(result) < travel(wires)
+
+    result = optimize_graph(wires, Point(0, 0, 0))
+    assert len(result) == len(wires)
+
+    # Lines from a common center. Instead of lifting at the end of a branch
+    # the path is retraced back to the center.
+    wires = [
+        Polyline(points=[(0, 0, 0), p]).render()
+        for p in ((10, 0, 0), (0, 10, 0), (-10, 0, 0))
+    ]
+    result = optimize_graph(wires, Point(10, 0, 0))
+    assert len(result) == 4
+    starts, ends = get_endpoints(result)
+    assert starts[0].tolist() == pytest.approx([10, 0, 0])
+    assert np.allclose(starts[1:], ends[:-1])
+
+
+def test_build_toolpath():
+    import numpy as np
+    from declaracad.occ.importers.gcode import build_toolpath
+    from declaracad.occ.impl.occ_display import (
+        decimate, split_polylines, nearest_segment
+    )
+    doc = gcode.parse('examples/gcode/Alien.gcode')
+    points, moves, lines, dwells = build_toolpath(doc)
+    assert len(points) == len(moves) == len(lines)
+    assert moves[0] == -1 and (moves[1:] >= 0).all()
+    assert set(lines[1:]) <= set(doc.lines)
+
+    # Every vertex of a move is in one of the polylines
+    arcs, bounds = split_polylines(moves, 2)
+    assert bounds.sum() == len(arcs)
+    assert set(arcs) >= set(np.flatnonzero(moves == 2))
+
+    # Decimating keeps the ends of each polyline
+    keep = decimate(points, moves, 1)
+    arcs, bounds = split_polylines(moves, 2, keep)
+    assert bounds.sum() == len(arcs) and (bounds >= 2).all()
+
+    # Pick a segment from above
+    i = int(np.flatnonzero(moves == 2)[0])
+    p = (points[i-1] + points[i]) / 2
+    assert nearest_segment(points, moves, p + (0, 0, 10), (0, 0, -1),
+                           0.001) == i
+
+
+def test_stream_file():
+    import pty
+    import select
+    import asyncio
+    import threading
+    from declaracad.cnc.plugin import (
+        Device, Job, SerialConnection, SerialConfig
+    )
+
+    # A fake controller with a 128 byte receive buffer that completes a
+    # line every millisecond
+    master, slave = pty.openpty()
+    received = []
+    stats = {'max': 0}
+    running = True
+
+    def controller():
+        buf = b''
+        while running:
+            r, w, x = select.select([master], [], [], 0.001)
+            if r:
+                buf += os.read(master, 1024)
+                stats['max'] = max(stats['max'], len(buf))
+            if b'\n' in buf:
+                line, buf = buf.split(b'\n', 1)
+                received.append(line)
+                os.write(master, b'ok\r\n')
+
+    thread = threading.Thread(target=controller, daemon=True)
+    thread.start()
+
+    device = Device(connection=SerialConnection(
+        config=SerialConfig(port=os.ttyname(slave), rtscts=False)))
+    job = Job(filename='examples/gcode/Alien.gcode')
+    job.load()
+
+    async def run():
+        await device.connect()
+        try:
+            await device.stream(job)
+        finally:
+            await device.disconnect()
+
+    loop = asyncio.new_event_loop()
+    try:
+        loop.run_until_complete(run())
+    finally:
+        running = False
+        thread.join()
+        loop.close()
+        os.close(master)
+        os.close(slave)
+
+    assert job.status == 'complete'
+    assert job.completed == len(job.lines) == len(received)
+    assert received == [data.strip() for line, data in job.lines]
+    assert stats['max'] <= device.config.rx_buffer_size
+
+
+def test_device_wait_until():
+    import time
+    import asyncio
+    from declaracad.cnc.plugin import Device, TimeoutError
+    device = Device()
+    state = {}
+
+    def ready():
+        state['ready'] = True
+        device.notify()
+
+    async def run():
+        loop = asyncio.get_event_loop()
+        loop.call_later(0.01, ready)
+        t0 = time.time()
+        await device.wait_until(lambda: state.get('ready'), timeout=1)
+        # Woken up by the notification instead of polling
+        assert time.time() - t0 < 0.1
+        with pytest.raises(TimeoutError):
+            await device.wait_until(lambda: False, timeout=0.01)
+
+    loop = asyncio.new_event_loop()
+    try:
+        loop.run_until_complete(run())
+    finally:
+        loop.close()